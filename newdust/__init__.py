@@ -3,3 +3,7 @@ from . import graindist
 from . import scatteringmodel
 from . import halos
 from .grainpop import *
+from .reweight import *
+from .tablemodel import *
+from .inversion import *
+from .adaptive import *
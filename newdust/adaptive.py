@@ -0,0 +1,180 @@
+import numpy as np
+import astropy.units as u
+
+from .graindist.composition.composition import _interp_table
+
+__all__ = ['adaptive_ext']
+
+TOL   = 1.e-3  # default relative interpolation tolerance
+NINIT = 16     # default number of values on the starting (log-spaced) grid
+NMAX  = 2000   # default maximum number of values on the refined grid
+
+def adaptive_ext(gpop, lmin, lmax, tol=TOL, ninit=NINIT, nmax=NMAX, theta=0.0, outputs='tau', **kwargs):
+    """
+    Calculate the extinction of a grain population on a wavelength/energy grid that is
+    refined only where it is needed, e.g. around absorption edges, instead of on a dense
+    uniform grid.
+
+    The refinement starts from `ninit` log-spaced values between `lmin` and `lmax`, and
+    happens in two steps:
+
+    1. Wherever interpolating the complex index of refraction between neighbouring grid
+    values misses the composition by more than `tol` (relative to |m-1|), a value is added.
+    The candidate values are the knots of the optical constant tables in each interval
+    (the knot with the largest error is added), or the middle of the interval (in log space)
+    if it has no knots. This step does not need any scattering calculations.
+
+    2. The extinction is calculated on that grid, then at the middle of each interval, and
+    the intervals where log-log interpolation misses tau_ext by more than `tol` (relative)
+    are split again, until every interval passes. The values calculated to test an
+    interval are kept on the grid.
+
+    The results are stored in `gpop` as if gpop.calculate_ext had been run on the final grid.
+
+    Inputs
+    ------
+    gpop : newdust.grainpop.SingleGrainPop -or- newdust.grainpop.GrainPop
+
+    lmin, lmax : astropy.units.Quantity -or- float : ends of the wavelength/energy range;
+        if no units specified, defaults to keV. The grid is in the units of `lmin`.
+
+    tol : float : relative interpolation tolerance for the optical constants and tau_ext
+
+    ninit : int : number of values on the starting grid
+
+    nmax : int : maximum number of values on the refined grid; the refinement stops
+        (with a warning) if the grid would grow beyond it
+
+    theta : astropy.units.Quantity -or- numpy.ndarray -or- float : passed to gpop.calculate_ext
+
+    outputs : string ('all', 'int_diff', or 'tau') : passed to gpop.calculate_ext
+
+    **kwargs passed to gpop.calculate_ext
+
+    Returns
+    -------
+    dict with the results on the final grid of NE values:
+    |   'lam' : astropy.units.Quantity (NE) : wavelength/energy grid
+    |   'tau_ext', 'tau_sca', 'tau_abs' : numpy.ndarray (NE) : optical depths
+    |   'ncm' : int : number of values added for the optical constants (step 1)
+    |   'ntau' : int : number of values added for tau_ext (step 2)
+    """
+    assert tol > 0.0
+    assert ninit >= 2 and nmax >= ninit
+    assert 'extend' not in kwargs and 'lam' not in kwargs
+    if not isinstance(lmin, u.Quantity):
+        lmin = lmin * u.keV
+    unit = lmin.unit
+    x0   = lmin.value
+    x1   = lmax.to(unit, equivalencies=u.spectral()).value if isinstance(lmax, u.Quantity) else \
+           (lmax * u.keV).to(unit, equivalencies=u.spectral()).value
+    xlo, xhi = min(x0, x1), max(x0, x1)
+    assert xlo > 0.0 and xhi > xlo
+
+    comps = [gp.comp for gp in gpop.gpoplist] if hasattr(gpop, 'gpoplist') else [gpop.comp]
+    grid  = np.logspace(np.log10(xlo), np.log10(xhi), ninit)
+
+    # Step 1: resolve the optical constants, without any scattering calculations
+    grid = _refine_cm(grid, comps, unit, tol, nmax)
+    ncm  = len(grid) - ninit
+
+    # Step 2: resolve tau_ext, testing the middle of each interval that has not passed
+    gpop.calculate_ext(grid * unit, theta=theta, outputs=outputs, **kwargs)
+    active = np.ones(len(grid) - 1, dtype=bool)
+    ntau   = 0
+    while np.any(active):
+        grid, tau = _current_ext(gpop, unit)
+        left  = grid[:-1][active]
+        right = grid[1:][active]
+        mid   = np.sqrt(left * right)
+        if len(grid) + len(mid) > nmax:
+            print("WARNING: reached nmax = %d values before tau_ext was resolved to tol = %.1e" % (nmax, tol))
+            break
+        expected = _interp_table(mid, grid, [tau], [0.0], loglog=True)[0]
+        gpop.calculate_ext(mid * unit, theta=theta, outputs=outputs, extend=True, **kwargs)
+        ntau += len(mid)
+        grid, tau = _current_ext(gpop, unit)
+        found  = np.interp(mid, grid, tau)  # exact, mid is on the grid
+        failed = np.abs(found - expected) > tol * np.abs(found)
+
+        # Both halves of a failed interval are tested again; the intervals that passed are done
+        active = np.zeros(len(grid) - 1, dtype=bool)
+        imid   = np.searchsorted(grid, mid[failed])
+        active[imid - 1] = True
+        active[imid] = True
+
+    result = dict()
+    result['lam']     = grid * unit
+    for k in ['tau_ext', 'tau_sca', 'tau_abs']:
+        result[k] = _sorted_values(gpop, unit, getattr(gpop, k))
+    result['ncm']     = ncm
+    result['ntau']    = ntau
+    return result
+
+def _refine_cm(grid, comps, unit, tol, nmax):
+    """
+    Add values to the ascending grid until the complex index of refraction of every
+    composition in `comps` is interpolated to within `tol` at the table knots
+    (or the middle of the interval, if it has no knots)
+    """
+    knots = []
+    for comp in comps:
+        wavel = getattr(comp, 'wavel', None)
+        if wavel is not None:
+            knots.append(np.atleast_1d(wavel.to(unit, equivalencies=u.spectral()).value))
+    knots = np.unique(np.concatenate(knots)) if len(knots) > 0 else np.array([])
+    knots = knots[(knots > grid[0]) & (knots < grid[-1])]
+
+    active = np.ones(len(grid) - 1, dtype=bool)
+    while np.any(active):
+        # Candidate values: the knots inside each active interval, or its middle
+        iknot = np.searchsorted(grid, knots, side='right') - 1
+        on_grid = np.isclose(knots, grid[iknot], rtol=1.e-12, atol=0.0)
+        use   = active[iknot] & ~on_grid
+        cand  = [knots[use]]
+        nknot = np.bincount(iknot[use], minlength=len(grid) - 1)
+        empty = active & (nknot == 0)
+        cand.append(np.sqrt(grid[:-1][empty] * grid[1:][empty]))
+        cand  = np.concatenate(cand)
+        icand = np.searchsorted(grid, cand, side='right') - 1
+
+        err = np.zeros(len(cand))
+        for comp in comps:
+            m_grid = np.atleast_1d(comp.cm(grid * unit))
+            m_cand = np.atleast_1d(comp.cm(cand * unit))
+            rp, ip = _interp_table(cand, grid, [m_grid.real, m_grid.imag], [1.0, 0.0], loglog=True)
+            scale  = np.maximum(np.abs(m_cand - 1.0), np.finfo(float).tiny)
+            err    = np.maximum(err, np.abs(rp + 1j * ip - m_cand) / scale)
+
+        # Add the worst candidate of each interval that fails
+        worst = np.full(len(grid) - 1, -1)
+        order = np.lexsort((err, icand))  # by interval, then by error
+        group = icand[order]
+        last  = np.append(group[1:] != group[:-1], True)
+        worst[group[last]] = order[last]
+        failed = (worst >= 0)
+        failed[failed] = err[worst[failed]] > tol
+        if not np.any(failed):
+            break
+        if len(grid) + np.sum(failed) > nmax:
+            print("WARNING: reached nmax = %d values before the optical constants were resolved to tol = %.1e" % (nmax, tol))
+            break
+        new  = cand[worst[failed]]
+        grid = np.sort(np.append(grid, new))
+
+        # Only the intervals next to a new value need to be tested again
+        active = np.zeros(len(grid) - 1, dtype=bool)
+        inew   = np.searchsorted(grid, new)
+        active[inew - 1] = True
+        active[inew] = True
+    return grid
+
+def _sorted_values(gpop, unit, values):
+    # Values stored in gpop, in ascending order of the grid in `unit`
+    x = np.atleast_1d(gpop.lam.to(unit, equivalencies=u.spectral()).value)
+    return np.asarray(values)[np.argsort(x)]
+
+def _current_ext(gpop, unit):
+    # Ascending grid of values calculated so far, in `unit`, and the tau_ext values on it
+    x = np.atleast_1d(gpop.lam.to(unit, equivalencies=u.spectral()).value)
+    return np.sort(x), _sorted_values(gpop, unit, gpop.tau_ext)
@@ -7,7 +7,10 @@ def _find_cmfile(name):
     data_path = root_path + 'tables/'
     return data_path + name
 
+from .cmtables import read_cmfile, clear_cmfile_cache
 from .composition import Composition
 from .cmdrude import CmDrude
 from .cmsilicate import CmSilicate
 from .cmgraphite import CmGraphite
+from .cmeffective import CmVacuum, CmEffectiveMedium
+from .cmkk import make_cm_kk, kk_real_part
@@ -29,6 +29,24 @@ class CmDrude(Composition):
         self.revals = self.rp(self.wavel)
         self.imvals = self.ip(self.wavel)
 
+    def cm(self, x, loglog=None):
+        """
+        Calculate the complex index of refraction under the Drude approximation,
+        converting the input grid only once.
+
+        Inputs
+        ------
+        x : if astropy.units.Quantity, convert to same units as self.wavel;
+            if numpy.ndarray, assume keV units
+
+        loglog : ignored, kept for compatibility with Composition.cm
+        
+        Returns
+        -------
+        1 + (rho / 2 m_p) * (r_e / 2 pi) * wavel^2 + 0j
+        """
+        return self.rp(x) + 0j
+
     def rp(self, x):
         """
         Calculate the real part of the complex index of refraction under the Drude approximation.
@@ -0,0 +1,254 @@
+import numpy as np
+import astropy.units as u
+
+from newdust.graindist.composition import Composition
+
+__all__ = ['CmVacuum', 'CmEffectiveMedium']
+
+ALLOWED_RULES = ['Bruggeman', 'MaxwellGarnett']
+
+# Number of Newton steps used to polish the Bruggeman solution
+BRUG_NPOLISH = 2
+
+class CmVacuum(Composition):
+    """
+    Optical constants of vacuum (m = 1), e.g. for describing grain porosity
+    in an effective-medium composition.
+    """
+    def __init__(self):
+        Composition.__init__(self)
+        self.cmtype = 'Vacuum'
+        self.rho    = 0.0
+        self.citation = "Vacuum, m = 1"
+
+    def rp(self, x):
+        return np.ones_like(np.asarray(x, dtype=float))[()]
+
+    def ip(self, x):
+        return np.zeros_like(np.asarray(x, dtype=float))[()]
+
+    def cm(self, x, loglog=None):
+        return self.rp(x) + 0j
+
+class CmEffectiveMedium(Composition):
+    """
+    Optical constants for a mixture of materials, using effective-medium theory
+    to combine the dielectric functions (eps = m^2) of several Compositions.
+
+    | Additional Attributes
+    | ---------------------
+    | components : list of Composition objects to mix
+    | vfrac : numpy.ndarray : volume fraction of each component (must sum to 1)
+    | rule : 'Bruggeman' or 'MaxwellGarnett'
+    |   'Bruggeman' treats all components symmetrically;
+    |   'MaxwellGarnett' treats the first component as the host matrix and the
+    |   others as inclusions
+    """
+    def __init__(self, components, vfrac, rule='Bruggeman'):
+        """
+        Inputs
+        ------
+        components : list of newdust.graindist.composition objects
+
+        vfrac : list or numpy.ndarray : volume fraction of each component
+
+        rule : string ('Bruggeman' or 'MaxwellGarnett') : mixing rule to use
+        """
+        Composition.__init__(self)
+        assert rule in ALLOWED_RULES
+        vfrac = np.asarray(vfrac, dtype=float)
+        assert np.shape(vfrac) == (len(components),)
+        _check_vfrac(vfrac)
+
+        self.components = components
+        self.vfrac  = vfrac
+        self.rule   = rule
+        self.cmtype = '{}({})'.format(rule, '+'.join([c.cmtype for c in components]))
+        self.rho    = float(np.sum(vfrac * np.array([c.rho for c in components])))
+        self.citation = "Effective medium mixture of:\n" + \
+            "\n".join([str(getattr(c, 'citation', None)) for c in components])
+
+        # Set up default values on the combined grid of the tabulated components,
+        # so that the inherited plotting method from Composition will work
+        grids = [c.wavel.to('micron', equivalencies=u.spectral()).value
+                 for c in components if getattr(c, 'wavel', None) is not None]
+        if len(grids) > 0:
+            self.wavel  = np.unique(np.concatenate(grids)) * u.micron
+            mvals       = self.cm(self.wavel)
+            self.revals = mvals.real
+            self.imvals = mvals.imag
+
+    def rp(self, x):
+        """
+        Real part of the effective complex index of refraction
+
+        Inputs
+        ------
+        x : if astropy.units.Quantity, use as is; if numpy.ndarray, assume keV units
+        """
+        return np.real(self.cm(x))
+
+    def ip(self, x):
+        """
+        Imaginary part of the effective complex index of refraction
+
+        Inputs
+        ------
+        x : if astropy.units.Quantity, use as is; if numpy.ndarray, assume keV units
+        """
+        return np.imag(self.cm(x))
+
+    def cm(self, x, loglog=None):
+        """
+        Returns the effective complex index of refraction for the volume
+        fractions stored in self.vfrac
+
+        Inputs
+        ------
+        x : if astropy.units.Quantity, use as is; if numpy.ndarray, assume keV units
+
+        loglog : passed to the cm method of each component
+        """
+        return self.cm_vfrac(x, self.vfrac, loglog=loglog)
+
+    def cm_vfrac(self, x, vfrac, loglog=None):
+        """
+        Evaluate the effective complex index of refraction for many sets of
+        volume fractions at once. The optical constants of each component are
+        evaluated only once, and the mixing rule is solved for all volume
+        fractions and wavelengths in a single vectorized calculation.
+
+        Inputs
+        ------
+        x : if astropy.units.Quantity, use as is; if numpy.ndarray, assume keV units
+
+        vfrac : numpy.ndarray : volume fractions of shape (NC,) or (NF, NC),
+            where NC is the number of components
+
+        loglog : passed to the cm method of each component
+
+        Returns
+        -------
+        numpy.ndarray (complex) of shape (NE,) if vfrac is 1-D, otherwise (NF, NE)
+
+        The scattering models (Mie, RGscattering) take a composition with a single index per
+        wavelength/energy, not NF x NE arrays. SingleGrainPop.calculate_ext_vfrac runs one
+        scattering calculation for all of the volume fractions, using this method.
+        """
+        vfrac = np.asarray(vfrac, dtype=float)
+        one_set = (vfrac.ndim == 1)
+        vfrac = np.atleast_2d(vfrac)  # NF x NC
+        assert vfrac.shape[1] == len(self.components)
+        _check_vfrac(vfrac)
+
+        scalar = (np.size(x) == 1) and (np.ndim(x) == 0)
+        x_1d = np.atleast_1d(x)
+        # Dielectric function of each component, NC x NE
+        eps_c = np.array([np.atleast_1d(_component_cm(c, x_1d, loglog)) for c in self.components])**2
+
+        if self.rule == 'Bruggeman':
+            eps = _bruggeman(eps_c, vfrac)
+        if self.rule == 'MaxwellGarnett':
+            eps = _maxwell_garnett(eps_c, vfrac)
+
+        # Choose the root with positive imaginary part (absorption, not gain)
+        result = np.sqrt(eps)
+        result = np.where(result.imag < 0.0, -result, result)  # NF x NE
+        if one_set:
+            result = result[0]
+            if scalar:
+                return result[0]
+        return result
+
+    def at_vfrac(self, vfrac):
+        """
+        Returns a new CmEffectiveMedium with the same components and mixing rule,
+        but with different volume fractions. To calculate extinction for many volume
+        fractions at once, see SingleGrainPop.calculate_ext_vfrac.
+        """
+        return CmEffectiveMedium(self.components, vfrac, rule=self.rule)
+
+#---------------- Helper functions for the mixing rules
+
+def _check_vfrac(vfrac):
+    assert np.all(vfrac >= 0.0)
+    assert np.all(np.abs(np.sum(vfrac, axis=-1) - 1.0) < 1.e-6)
+
+def _maxwell_garnett(eps_c, vfrac):
+    """
+    eps_c : NC x NE : dielectric function of each component, first is the host
+
+    vfrac : NF x NC : volume fractions
+
+    Returns NF x NE effective dielectric function
+    """
+    eps_m = eps_c[0]  # NE
+    beta  = (eps_c[1:] - eps_m) / (eps_c[1:] + 2.0 * eps_m)  # (NC-1) x NE
+    fbeta = np.dot(vfrac[:,1:], beta)  # NF x NE
+    return eps_m * (1.0 + 2.0 * fbeta) / (1.0 - fbeta)
+
+def _bruggeman(eps_c, vfrac, npolish=BRUG_NPOLISH):
+    """
+    Solves sum_i f_i (eps_i - eps) / (eps_i + 2 eps) = 0 for eps, for all
+    volume fractions and wavelengths at once.
+
+    Multiplying through by the denominators turns the Bruggeman condition into a
+    polynomial of degree NC in eps. All roots are found at once from the
+    eigenvalues of a stack of companion matrices. The physical root has a
+    non-negative imaginary part; if more than one root qualifies, the one closest
+    to the volume-averaged dielectric function is used. A few Newton steps then
+    polish the chosen root.
+
+    eps_c : NC x NE : dielectric function of each component
+
+    vfrac : NF x NC : volume fractions
+
+    Returns NF x NE effective dielectric function
+    """
+    NC, NE = np.shape(eps_c)
+    NF     = np.shape(vfrac)[0]
+    ec = np.broadcast_to(eps_c[np.newaxis,:,:], (NF, NC, NE)).reshape(NF, NC, NE)
+    fc = np.broadcast_to(vfrac[:,:,np.newaxis], (NF, NC, NE))
+
+    # Polynomial coefficients in ascending order of eps, shape NF x NE x (NC+1)
+    coeffs = np.zeros(shape=(NF, NE, NC+1), dtype='complex')
+    for i in range(NC):
+        term = np.zeros(shape=(NF, NE, NC+1), dtype='complex')
+        term[...,0] = 1.0
+        for j in range(NC):
+            if j == i: continue
+            # multiply by (eps_j + 2 eps)
+            term[...,1:] = ec[:,j,:,np.newaxis] * term[...,1:] + 2.0 * term[...,:-1]
+            term[...,0]  = ec[:,j,:] * term[...,0]
+        # multiply by f_i (eps_i - eps)
+        term[...,1:] = ec[:,i,:,np.newaxis] * term[...,1:] - term[...,:-1]
+        term[...,0]  = ec[:,i,:] * term[...,0]
+        coeffs += fc[:,i,:,np.newaxis] * term
+
+    # Roots from the companion matrix of the monic polynomial
+    monic = coeffs[...,:-1] / coeffs[...,-1:]
+    companion = np.zeros(shape=(NF, NE, NC, NC), dtype='complex')
+    companion[...,1:,:-1] = np.eye(NC-1)
+    companion[...,:,-1]   = -monic
+    roots = np.linalg.eigvals(companion)  # NF x NE x NC
+
+    # Choose the physical root
+    eps_avg = np.sum(fc * ec, axis=1)  # NF x NE
+    dist    = np.abs(roots - eps_avg[...,np.newaxis])
+    bad     = (roots.imag < -1.e-10 * np.abs(roots))
+    dist[bad & ~np.all(bad, axis=-1, keepdims=True)] = np.inf
+    eps = np.take_along_axis(roots, np.argmin(dist, axis=-1)[...,np.newaxis], axis=-1)[...,0]
+
+    # Polish with Newton's method
+    for n in range(npolish):
+        denom = ec + 2.0 * eps[:,np.newaxis,:]
+        func  = np.sum(fc * (ec - eps[:,np.newaxis,:]) / denom, axis=1)
+        deriv = np.sum(-3.0 * fc * ec / denom**2, axis=1)
+        eps   = eps - func / deriv
+    return eps
+
+def _component_cm(c, x, loglog=None):
+    # Components only need the basic CmIndex API, cm(x); pass loglog only when it is set
+    if loglog is None:
+        return c.cm(x)
+    return c.cm(x, loglog=loglog)
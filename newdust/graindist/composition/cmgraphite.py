@@ -1,8 +1,7 @@
 import numpy as np
-from astropy.io import ascii
 from astropy import units as u
 
-from newdust.graindist.composition import _find_cmfile, Composition
+from newdust.graindist.composition import _find_cmfile, read_cmfile, Composition
 
 __all__ = ['CmGraphite']
 
@@ -38,8 +37,8 @@ class CmGraphite(Composition):
             D03file_para = _find_cmfile('callindex.out_CpaD03_0.01')
             D03file_perp = _find_cmfile('callindex.out_CpeD03_0.01')
 
-        D03dat_para = ascii.read(D03file_para, header_start=4, data_start=5)
-        D03dat_perp = ascii.read(D03file_perp, header_start=4, data_start=5)
+        D03dat_para = read_cmfile(D03file_para)
+        D03dat_perp = read_cmfile(D03file_perp)
 
         # The wavelength grid needs to be in ascending order 
         # for np.interp to run correctly
@@ -56,3 +55,5 @@ class CmGraphite(Composition):
             self.wavel = wavel[wsort]
             self.revals  = 1.0 + D03dat_para['Re(n)-1'][wsort]
             self.imvals  = D03dat_para['Im(n)'][wsort]
+
+        self._freeze_tables()
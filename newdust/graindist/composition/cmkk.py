@@ -0,0 +1,159 @@
+import numpy as np
+from scipy import fft
+import astropy.units as u
+
+from newdust.graindist.composition import Composition
+
+__all__ = ['make_cm_kk', 'kk_real_part']
+
+NPTS_KK  = 2**20  # default maximum number of grid points for the FFT
+KK_OVERSAMPLE = 2  # grid points per smallest table interval (in log energy)
+KK_NGAUSS = 4      # Gauss-Legendre nodes for each half of the kernel weight integrals
+
+def kk_real_part(energy, imvals, npts=NPTS_KK):
+    """
+    Calculate Re(m) - 1 from Im(m) with the Kramers-Kronig relation
+
+    Re(m(E)) - 1 = (2/pi) P int_0^inf E' Im(m(E')) / (E'^2 - E^2) dE'
+
+    In terms of u = ln(E), the integral is a convolution,
+    (2/pi) P int Im(m(u')) K(u - u') du' with K(s) = 1 / (1 - exp(2s)),
+    so it is computed with an FFT on a uniform grid in ln(E), and the cost
+    is O(N log N) in the number of grid points. The grid spacing comes from the
+    smallest spacing of the table (KK_OVERSAMPLE points per interval), so narrow
+    features are resolved at all energies, e.g. absorption edges below 1 keV in a
+    table that extends to high energies. Im(m) is taken to be piecewise linear in
+    ln(E) on the grid, and the kernel is integrated exactly over each piece.
+
+    Inputs
+    ------
+    energy : numpy.ndarray : ascending, positive energy (or frequency) values, any units
+
+    imvals : numpy.ndarray : imaginary part of the complex index of refraction at `energy`
+
+    npts : int : maximum number of grid points; if the table needs more, the grid is
+        coarser than the table and a warning is printed
+
+    Returns
+    -------
+    numpy.ndarray : Re(m) - 1 at the input `energy` values
+
+    Im(m) is taken to be zero outside of the tabulated energy range.
+    """
+    energy = np.asarray(energy, dtype=float)
+    imvals = np.asarray(imvals, dtype=float)
+    assert np.shape(energy) == np.shape(imvals)
+    assert np.all(np.diff(energy) > 0.0)
+    assert energy[0] > 0.0
+
+    # Uniform grid in ln(E), as fine as the finest part of the table
+    lne  = np.log(energy)
+    nreq = int(np.ceil(KK_OVERSAMPLE * (lne[-1] - lne[0]) / np.min(np.diff(lne)))) + 1
+    if nreq > npts:
+        print("WARNING: the optical constant table is finer than the Kramers-Kronig grid;")
+        print("WARNING: features narrower than %.2e in ln(E) will be smoothed. Try increasing npts to %d" %
+              ((lne[-1] - lne[0]) / (npts - 1), nreq))
+    NG    = max(2, min(nreq, int(npts)))
+    ugrid = np.linspace(lne[0], lne[-1], NG)
+    kgrid = np.interp(ugrid, lne, imvals)
+
+    # Weights for each offset n = i - j between grid points, -(NG-1) ... NG-1
+    weights = _kk_weights(np.arange(-(NG-1), NG), ugrid[1] - ugrid[0])
+
+    # Linear convolution, zero padded to avoid wrap-around from the periodic FFT
+    nfft  = fft.next_fast_len(3 * NG - 2)
+    conv  = fft.irfft(fft.rfft(kgrid, nfft) * fft.rfft(weights, nfft), nfft)
+    re_m1 = (2.0 / np.pi) * conv[NG-1:2*NG-1]
+    return np.interp(lne, ugrid, re_m1)
+
+def _kk_weights(n, h):
+    """
+    Integral of the Kramers-Kronig kernel K(s) = 1 / (1 - exp(2s)) against the
+    hat function of a grid point, h int_{-1}^{1} (1 - |t|) K(h (n - t)) dt.
+
+    K(s) = -1 / (2s) + S(s), where S is smooth. The principal value of the
+    singular part is known exactly for the hat function, and the smooth part
+    is integrated with Gauss-Legendre quadrature.
+    """
+    n = np.asarray(n, dtype=float)
+    # Singular part: -1/2 P int_{-1}^{1} (1 - |t|) / (n - t) dt
+    sing = -0.5 * (_xlogx(n + 1.0) - 2.0 * _xlogx(n) + _xlogx(n - 1.0))
+
+    # Smooth part, on each half of the hat function
+    xg, wg = np.polynomial.legendre.leggauss(KK_NGAUSS)
+    smooth = np.zeros_like(n)
+    for x, w in zip(xg, wg):
+        t = 0.5 * (x + 1.0)  # nodes on (0, 1)
+        smooth += 0.5 * w * (1.0 - t) * (_kk_smooth(h * (n - t)) + _kk_smooth(h * (n + t)))
+    return sing + h * smooth
+
+def _xlogx(x):
+    # x ln|x|, which goes to zero at x = 0
+    ax = np.abs(x)
+    return x * np.log(np.where(ax > 0.0, ax, 1.0))
+
+def _kk_smooth(s):
+    # S(s) = 1 / (1 - exp(2s)) + 1 / (2s), with its series near s = 0
+    s = np.asarray(s, dtype=float)
+    small = np.abs(s) < 1.e-2
+    s_big = np.where(small, 1.0, s)
+    with np.errstate(over='ignore'):
+        result = -1.0 / np.expm1(2.0 * s_big) + 0.5 / s_big
+    return np.where(small, 0.5 - s / 6.0 + s**3 / 90.0, result)
+
+def make_cm_kk(energy, imvals=None, mac=None, rho=3.0, cmtype='Custom',
+               citation=None, npts=NPTS_KK):
+    """
+    Build a Composition from tabulated absorption, computing a consistent real
+    part of the complex index of refraction with the Kramers-Kronig relation.
+
+    Inputs
+    ------
+    energy : astropy.units.Quantity -or- numpy.ndarray : energy grid for the
+        tabulated absorption; if no units specified, keV is assumed.
+        It should span a wide energy range, because absorption outside of the
+        table is ignored by the Kramers-Kronig integral.
+
+    imvals : numpy.ndarray : imaginary part of the complex index of refraction
+
+    mac : numpy.ndarray : mass absorption coefficient [cm^2 g^-1], used to
+        compute `imvals` if they are not provided
+
+    rho : float : density of the material [g cm^-3]
+
+    cmtype : string : label for the compound
+
+    citation : string : citation for the absorption data
+
+    npts : int : maximum number of grid points for the FFT (see kk_real_part)
+
+    Returns
+    -------
+    newdust.graindist.composition.Composition with `wavel` in keV
+    """
+    assert (imvals is not None) or (mac is not None)
+    if isinstance(energy, u.Quantity):
+        e_kev = energy.to('keV', equivalencies=u.spectral()).value
+    else:
+        e_kev = np.asarray(energy, dtype=float)
+
+    # Sort the table in order of ascending energy
+    esort = np.argsort(e_kev)
+    e_kev = e_kev[esort]
+
+    if imvals is None:
+        # absorption coefficient alpha = mac * rho = 4 pi Im(m) / lambda
+        lam_cm = (e_kev * u.keV).to('cm', equivalencies=u.spectral()).value
+        imvals = np.asarray(mac, dtype=float)[esort] * rho * lam_cm / (4.0 * np.pi)
+    else:
+        imvals = np.asarray(imvals, dtype=float)[esort]
+
+    result = Composition()
+    result.cmtype = cmtype
+    result.rho    = rho
+    result.citation = citation
+    result.wavel  = e_kev * u.keV
+    result.revals = 1.0 + kk_real_part(e_kev, imvals, npts=npts)
+    result.imvals = imvals
+    result._freeze_tables()
+    return result
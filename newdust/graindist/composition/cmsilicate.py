@@ -1,8 +1,7 @@
 import numpy as np
-from astropy.io import ascii
 from astropy import units as u
 
-from newdust.graindist.composition import _find_cmfile, Composition
+from newdust.graindist.composition import _find_cmfile, read_cmfile, Composition
 
 __all__ = ['CmSilicate']
 
@@ -19,7 +18,7 @@ class CmSilicate(Composition):
         self.citation = "Using optical constants for astrosilicate,\nDraine, B. T. 2003, ApJ, 598, 1026\nhttp://adsabs.harvard.edu/abs/2003ApJ...598.1026D"
 
         D03file = _find_cmfile('callindex.out_sil.D03')
-        D03dat  = ascii.read(D03file, header_start=4, data_start=5)
+        D03dat  = read_cmfile(D03file)
 
         # The wavelength grid needs to be in ascending order for np.interp to run correctly
         wavel = D03dat['wave(um)'] * u.micron
@@ -28,3 +27,5 @@ class CmSilicate(Composition):
         self.wavel = wavel[wsort]
         self.revals = 1.0 + D03dat['Re(n)-1'][wsort]
         self.imvals = D03dat['Im(n)'][wsort]
+
+        self._freeze_tables()
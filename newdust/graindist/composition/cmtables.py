@@ -0,0 +1,116 @@
+import os
+import hashlib
+import numpy as np
+from astropy.io import ascii
+
+__all__ = ['read_cmfile', 'clear_cmfile_cache']
+
+# Process-wide cache of parsed optical constant tables, keyed by absolute file path
+_CMFILE_CACHE = dict()
+
+# Binary sidecar files live next to the text tables
+SIDECAR_EXT = '.npz'
+
+def read_cmfile(filename, header_start=4, data_start=5, use_sidecar=True):
+    """
+    Read an optical constants table (e.g. Draine's `callindex.out_*` files),
+    returning a dictionary of numpy.ndarray columns keyed by column name.
+
+    Parsed tables are cached for the lifetime of the process. The first read
+    of a table also writes a binary sidecar (filename + '.npz') storing the
+    parsed columns, along with the size, modification time, and SHA-1 hash of the
+    text table. Later processes load the sidecar instead of re-parsing the
+    text table, as long as the sidecar still matches the text file.
+
+    Inputs
+    ------
+    filename : string : path to the text table
+
+    header_start, data_start : int : passed to astropy.io.ascii.read
+
+    use_sidecar : bool (True) : if False, always parse the text table, without
+        reading or writing the binary sidecar or the in-memory cache
+
+    Returns
+    -------
+    dict : column name -> read-only numpy.ndarray
+    """
+    key = os.path.abspath(filename)
+    stat = os.stat(key)
+    cached = _CMFILE_CACHE.get(key) if use_sidecar else None
+    if cached is not None and cached['stamp'] == (stat.st_size, stat.st_mtime_ns):
+        return cached['columns']
+
+    columns = None
+    if use_sidecar:
+        columns = _read_sidecar(key, stat)
+    if columns is None:
+        table   = ascii.read(key, header_start=header_start, data_start=data_start)
+        columns = dict((name, np.array(table[name])) for name in table.colnames)
+        if use_sidecar:
+            _write_sidecar(key, stat, columns)
+
+    # Cached arrays are shared between all compositions, so protect them
+    for col in columns.values():
+        col.setflags(write=False)
+
+    if use_sidecar:
+        _CMFILE_CACHE[key] = {'stamp':(stat.st_size, stat.st_mtime_ns), 'columns':columns}
+    return columns
+
+def clear_cmfile_cache():
+    """
+    Empty the in-memory cache of optical constant tables. Binary sidecars are left on disk.
+    """
+    _CMFILE_CACHE.clear()
+
+##----- Helper material
+
+def _file_hash(filename):
+    with open(filename, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def _read_sidecar(filename, stat):
+    """
+    Returns the columns stored in the sidecar file, or None if the sidecar
+    is missing, unreadable, or out of date with respect to the text table
+    """
+    sidecar = filename + SIDECAR_EXT
+    if not os.path.exists(sidecar):
+        return None
+    try:
+        with np.load(sidecar, allow_pickle=False) as ff:
+            names = [str(n) for n in ff['names']]
+            data  = ff['data']
+            size, mtime_ns = ff['stamp']
+            sha1  = str(ff['sha1'])
+    except Exception:
+        return None
+
+    if size != stat.st_size:
+        return None
+    # A fresh checkout or copy changes the modification time but not the contents,
+    # so fall back to the file hash before giving up on the sidecar
+    if mtime_ns != stat.st_mtime_ns and sha1 != _file_hash(filename):
+        return None
+    return dict((n, np.array(data[i])) for i, n in enumerate(names))
+
+def _write_sidecar(filename, stat, columns):
+    """
+    Write the parsed columns to a binary sidecar. The write is atomic, so that
+    several processes reading the same table at once never see a partial file.
+    Failure to write (e.g. a read-only install) is not an error.
+    """
+    sidecar = filename + SIDECAR_EXT
+    tmpfile = '{}.{}.tmp{}'.format(filename, os.getpid(), SIDECAR_EXT)
+    names = list(columns.keys())
+    try:
+        np.savez(tmpfile, names=np.array(names),
+                 data=np.array([columns[n] for n in names], dtype=float),
+                 stamp=np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64),
+                 sha1=np.array(_file_hash(filename)))
+        os.replace(tmpfile, sidecar)
+    except (OSError, ValueError):
+        if os.path.exists(tmpfile):
+            os.remove(tmpfile)
+    return
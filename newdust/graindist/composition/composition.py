@@ -1,8 +1,11 @@
+import hashlib
 import numpy as np
 import astropy.units as u
 
 __all__ = ['Composition']
 
+CM_CACHE_SIZE = 8  # number of input grids for which cm() results are remembered
+
 class Composition(object):
     """
     Composition class for storing information about grain material
@@ -20,6 +23,9 @@ class Composition(object):
     revals : numpy.ndarray : real part of the complex index of refraction
     
     imvals : numpy.ndarray : imaginary part of the complex index of refraction
+
+    loglog : bool : if True, interpolate |m-1| and Im(m) in log-log space
+    (power-law behaviour between tabulated points); default is linear interpolation
     """
     def __init__(self):
         self.cmtype = None
@@ -28,6 +34,8 @@ class Composition(object):
         self.wavel = None
         self.revals = 1.0
         self.imvals = 0.0
+        self.loglog = False
+        self._cm_cache = dict()
     
     def rp(self, x):
         """
@@ -43,12 +51,9 @@ class Composition(object):
         -------
         np.interp(x, self.wavel, self.revals, left=1.0, right=1.0)
         """
-        # If the input is an astropy quantity, convert it to the same unit as wavel
-        if isinstance(x, u.Quantity):
-            new_x = x.to(self.wavel.unit, equivalencies=u.spectral()).value
-        # Otherwise, assume the unit is keV
-        else:
-            new_x = (x * u.keV).to(self.wavel.unit, equivalencies=u.spectral()).value
+        new_x = self._convert_x(x)
+        if self.loglog:
+            return _interp_table(new_x, self.wavel.value, [self.revals], [1.0], loglog=True)[0]
         return np.interp(new_x, self.wavel.value, self.revals, left=1.0, right=1.0)
     
     def ip(self, x):
@@ -63,26 +68,69 @@ class Composition(object):
         
         Returns
         -------
-        np.interp(x, self.wavel, self.imvals, left=1.0, right=1.0)
+        np.interp(x, self.wavel, self.imvals, left=0.0, right=0.0)
         """
-        # If the input is an astropy quantity, convert it to the same unit as wavel
-        if isinstance(x, u.Quantity):
-            new_x = x.to(self.wavel.unit, equivalencies=u.spectral()).value
-        # Otherwise, assume the unit is keV
-        else:
-            new_x = (x * u.keV).to(self.wavel.unit, equivalencies=u.spectral()).value
+        new_x = self._convert_x(x)
+        if self.loglog:
+            return _interp_table(new_x, self.wavel.value, [self.imvals], [0.0], loglog=True)[0]
         return np.interp(new_x, self.wavel.value, self.imvals, left=0.0, right=0.0)
     
-    def cm(self, x):
+    def cm(self, x, loglog=None):
         """
         Returns the complex index of refraction using Python complex numbers
 
+        The input grid is converted to the units of self.wavel once, and a single
+        bracket search over the table is shared by the real and imaginary parts.
+        Results are remembered for the most recent input grids, so repeated
+        scattering calculations on the same grid do not repeat the interpolation.
+        Read-only optical constant tables (e.g. those read from file) are recognised
+        by identity, so replacing a table forgets the remembered results; writable
+        tables are recognised by their contents, so they can be changed in place.
+
         Inputs
         ------
         x : if astropy.units.Quantity, convert to same units as self.wavel;
             if numpy.ndarray, assume keV units
+
+        loglog : bool : interpolate in log-log space (Default: None uses self.loglog)
+        """
+        if loglog is None:
+            loglog = self.loglog
+        new_x = np.asarray(self._convert_x(x), dtype=float)
+
+        tables = (self.wavel, self.revals, self.imvals)
+        key = (_hash_array(new_x), loglog, str(self.wavel.unit)) + tuple(_table_key(t) for t in tables)
+        cached = self._cm_cache.get(key)
+        if cached is None:
+            rp, ip = _interp_table(new_x, self.wavel.value,
+                                   [self.revals, self.imvals], [1.0, 0.0], loglog=loglog)
+            # Keep the tables alive with the result, so their ids are not reused
+            cached = (rp + 1j * ip, tables)
+            # Forget the oldest grids when the cache is full
+            for old in list(self._cm_cache)[:max(len(self._cm_cache) - CM_CACHE_SIZE + 1, 0)]:
+                self._cm_cache.pop(old, None)
+            self._cm_cache[key] = cached
+        return cached[0].copy()[()]
+
+    def _freeze_tables(self):
+        """
+        Make the optical constant tables read-only, so that cm() recognises them by identity
+        """
+        for table in (self.wavel, self.revals, self.imvals):
+            if isinstance(table, np.ndarray):
+                table.setflags(write=False)
+
+    def _convert_x(self, x):
+        """
+        Convert the input to the units of self.wavel and return the values.
+        If x is not an astropy.units.Quantity, keV units are assumed.
         """
-        return self.rp(x) + 1j * self.ip(x)
+        # If the input is an astropy quantity, convert it to the same unit as wavel
+        if isinstance(x, u.Quantity):
+            return x.to(self.wavel.unit, equivalencies=u.spectral()).value
+        # Otherwise, assume the unit is keV
+        else:
+            return (x * u.keV).to(self.wavel.unit, equivalencies=u.spectral()).value
     
     def plot(self, ax, lam=None, rppart=True, impart=True, xunit=None, label=''):
         """
@@ -130,3 +178,63 @@ class Composition(object):
             ax.plot(x, ip, ls='--', label='{} Im(m)'.format(label))
         ax.set_xlabel(xunit)
         ax.legend()
+
+#---------------- Helper function for interpolating optical constant tables
+
+def _interp_table(x, xp, fps, fills, loglog=False):
+    """
+    Interpolate several tables that share the same (ascending) grid `xp`,
+    finding the bracketing indices only once.
+
+    x : numpy.ndarray : values at which to interpolate
+
+    xp : numpy.ndarray : ascending grid of tabulated values
+
+    fps : list of numpy.ndarray : tabulated values on the grid `xp`
+
+    fills : list of floats : value returned outside of the grid, for each table in `fps`
+
+    loglog : bool : if True, interpolate log|fp - fill| linearly in log(x) wherever
+        both bracketing values are nonzero and have the same sign; otherwise linear
+
+    Returns a list of numpy.ndarray, one per table, with the same shape as x
+    """
+    x  = np.asarray(x, dtype=float)
+    xp = np.asarray(xp, dtype=float)
+    NP = len(xp)
+
+    # Shared bracket search: xp[i] <= x < xp[i+1]
+    i = np.clip(np.searchsorted(xp, x, side='right') - 1, 0, NP - 2)
+    inside = (x >= xp[0]) & (x <= xp[-1])
+    x0, x1 = xp[i], xp[i+1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.where(x1 > x0, (x - x0) / (x1 - x0), 0.0)
+        if loglog:
+            tlog = np.where((x0 > 0.0) & (x1 > 0.0) & (x1 > x0),
+                            np.log(x / x0) / np.log(x1 / x0), t)
+
+    result = []
+    for fp, fill in zip(fps, fills):
+        fp = np.asarray(fp, dtype=float)
+        y0, y1 = fp[i], fp[i+1]
+        y = y0 + t * (y1 - y0)
+        if loglog:
+            d0, d1 = y0 - fill, y1 - fill
+            ok = (d0 * d1 > 0.0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ylog = fill + np.sign(d0) * np.exp(
+                    np.log(np.abs(d0)) + tlog * (np.log(np.abs(d1)) - np.log(np.abs(d0))))
+            y = np.where(ok, ylog, y)
+        result.append(np.where(inside, y, fill))
+    return result
+
+def _table_key(x):
+    # Read-only tables cannot change, so their identity is enough; others are hashed
+    if isinstance(x, np.ndarray) and not x.flags.writeable:
+        return ('id', id(x))
+    return _hash_array(np.asarray(x))
+
+def _hash_array(x):
+    # Cheap summary of the contents of an array, for use in cache keys
+    x = np.ascontiguousarray(x)
+    return (hashlib.sha1(x.tobytes()).hexdigest(), x.shape, str(x.dtype))
@@ -7,7 +7,7 @@ MD_DEFAULT = 1.e-4  # g cm^-2
 RHO        = 3.0    # g cm^-3
 AMAX       = 0.3  # um
 
-ALLOWED_SIZES  = ['Grain','Powerlaw','ExpCutoff','Astrodust']
+ALLOWED_SIZES  = ['Grain','Powerlaw','ExpCutoff','Astrodust','WD01']
 ALLOWED_COMPS  = ['Drude', 'Silicate', 'Graphite']
 SHAPES = {'Sphere':sh.Sphere()}
 
@@ -39,14 +39,22 @@ class GrainDist(object):
     cgeo  : physical cross-sectional area based on grain shape [cm^2]
     
     vol   : physical grain volume based on grain shape [cm^2]
+
+    wts   : weights for integrating over grain radius [micron],
+    int f(a) da = sum(f(a) * wts) (returns size.wts, or trapezoidal weights if not available)
+
+    The derived quantities `ndens`, `mdens`, `cgeo`, `vol`, and `wts` are computed once and
+    stored. They are recomputed automatically when `md`, `size`, `comp`, `shape`,
+    the size grid (`size.a`), or the material density (`comp.rho`) change.
+    Call `clear_cache` after changing other size distribution parameters in place.
     """
     def __init__(self, dtype, cmtype, shape='Sphere', md=MD_DEFAULT,
-                 amax=AMAX, rho=None, **kwargs):
+                 amax=None, rho=None, **kwargs):
         """
         Inputs
         ------
       
-        dtype : string ('Grain', 'Powerlaw', 'ExpCutoff', 'Astrodust') or 
+        dtype : string ('Grain', 'Powerlaw', 'ExpCutoff', 'Astrodust', 'WD01') or 
         newdust.graindist.sizedist object defining the grain radius distribution
 
         cmtype : string ('Drude', 'Silicate', 'Graphite') or
@@ -61,16 +69,20 @@ class GrainDist(object):
         |   *Powerlaw:* defines the maximum grain radius
         |   *ExpCutoff:* defines the exponential cut-off value, `acut`
         |   *Astrodust:* defines the maximum grain radius
+        |   *WD01:* defines the maximum grain radius
+        (Default: None, uses 0.3 micron, or the WD01 default maximum radius for WD01)
 
         rho : if defined, will be provide as input to the `rho` keyword in composition
 
-        **kwargs : extra inputs passed to sizedist.__init__
+        **kwargs : extra inputs passed to sizedist.__init__.
+        For WD01 with cmtype 'Silicate' or 'Graphite', the `grain` input is taken from `cmtype`.
         """
+        self._cache = dict()
 
         self.md = md
 
         if isinstance(dtype, str):
-            self._assign_sizedist_from_string(dtype, amax, **kwargs)
+            self._assign_sizedist_from_string(dtype, amax, cmtype=cmtype, **kwargs)
         else:
             self.size = dtype
 
@@ -85,18 +97,75 @@ class GrainDist(object):
             self.shape = shape
 
 
+    @property
+    def md(self):
+        return self._md
+
+    @md.setter
+    def md(self, value):
+        self._md = value
+        self.clear_cache()
+
+    @property
+    def size(self):
+        return self._size
+
+    @size.setter
+    def size(self, value):
+        self._size = value
+        self.clear_cache()
+
+    @property
+    def comp(self):
+        return self._comp
+
+    @comp.setter
+    def comp(self, value):
+        self._comp = value
+        self.clear_cache()
+
+    @property
+    def shape(self):
+        return self._shape
+
+    @shape.setter
+    def shape(self, value):
+        self._shape = value
+        self.clear_cache()
+
+    def clear_cache(self):
+        """
+        Forget the stored values of ndens, mdens, cgeo, vol, and wts
+        """
+        self._cache = dict()
+
+    def _cached(self, name, func):
+        # The size grid and material density can be changed in place,
+        # so check that they are the same objects used for the stored values
+        stamp = (self.size.a, self.comp.rho)
+        if self._cache.get('stamp') is None or \
+            self._cache['stamp'][0] is not stamp[0] or self._cache['stamp'][1] != stamp[1]:
+            self._cache = {'stamp':stamp}
+        if name not in self._cache:
+            result = func()
+            if isinstance(result, np.ndarray):
+                result.setflags(write=False)
+            self._cache[name] = result
+        return self._cache[name]
+
     @property
     def a(self):
         return self.size.a
 
     @property
     def ndens(self):
-        return self.size.ndens(self.md, rho=self.comp.rho, shape=self.shape)
+        return self._cached('ndens',
+            lambda: self.size.ndens(self.md, rho=self.comp.rho, shape=self.shape))
 
     @property
     def mdens(self):
-        mg = self.shape.vol(self.a) * self.comp.rho  # mass of each dust grain [g]
-        return self.ndens * mg
+        # mass of each dust grain [g] is vol * rho
+        return self._cached('mdens', lambda: self.ndens * self.vol * self.comp.rho)
 
     @property
     def rho(self):
@@ -104,11 +173,23 @@ class GrainDist(object):
 
     @property
     def cgeo(self):
-        return self.shape.cgeo(self.a)
+        return self._cached('cgeo', lambda: self.shape.cgeo(self.a))
 
     @property
     def vol(self):
-        return self.shape.vol(self.a)
+        return self._cached('vol', lambda: self.shape.vol(self.a))
+
+    @property
+    def wts(self):
+        return self._cached('wts', self._get_wts)
+
+    def _get_wts(self):
+        # Use the size distribution's own quadrature weights, if it has them
+        if hasattr(self.size, 'wts'):
+            return np.array(self.size.wts, dtype=float)
+        if len(self.a) == 1:
+            return np.ones(1)
+        return sizedist.trapz_weights(self.a.to('micron').value)
 
     def plot(self, ax, **kwargs):
         ax.plot(self.a.to('micron').value, self.ndens * np.power(self.a.to('micron').value, 4), **kwargs)
@@ -118,8 +199,10 @@ class GrainDist(object):
         ax.set_yscale('log')
         return
 
-    def _assign_sizedist_from_string(self, dtype, amax, **kwargs):
+    def _assign_sizedist_from_string(self, dtype, amax, cmtype=None, **kwargs):
         assert dtype in ALLOWED_SIZES
+        if amax is None and dtype != 'WD01':
+            amax = AMAX
         if dtype == 'Grain':
             self.size = sizedist.Grain(rad=amax)
         if dtype == 'Powerlaw':
@@ -128,6 +211,14 @@ class GrainDist(object):
             self.size = sizedist.ExpCutoff(acut=amax, **kwargs)
         if dtype == 'Astrodust':
             self.size = sizedist.Astrodust(amax=amax, **kwargs)
+        if dtype == 'WD01':
+            # The WD01 grain type must match the optical constants
+            if isinstance(cmtype, str) and cmtype in sizedist.wd01.ALLOWED_GRAINS:
+                grain = kwargs.setdefault('grain', cmtype)
+                assert grain == cmtype, "WD01 grain type (%s) does not match cmtype (%s)" % (grain, cmtype)
+            if amax is not None:
+                kwargs['amax'] = amax
+            self.size = sizedist.WD01(**kwargs)
         return
 
     def _assign_comp_from_string(self, cmtype, rho):
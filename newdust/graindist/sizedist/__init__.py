@@ -1,7 +1,11 @@
+from .grids import make_agrid, trapz_weights
 from .grain import Grain
 from .powerlaw import Powerlaw
 from .exp_cutoff import ExpCutoff
 from .astrodust import Astrodust
+from .wd01 import WD01, read_wdtable
+from .tabulated import Tabulated
+from .mixture import Mixture
 
 from .. import shape
 
@@ -16,6 +20,12 @@ API
 
 `a` : an array
 
+`wts` : an array of integration weights for `a`, so that int f(a) da = sum(f(a) * wts)
+(optional; if missing, the trapezoidal rule is used)
+
+`amin`, `amax` : grain radius limits of the distribution [astropy.units.Quantity or micron]
+(optional; if missing, the ends of `a` are used)
+
 And must contain the following two methods:
 
 `ndens` (md, rho, shape) returns number density of dust grains [e.g. cm^-2 um^-1]
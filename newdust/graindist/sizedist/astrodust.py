@@ -1,7 +1,7 @@
 import numpy as np
 import astropy.units as u
-from scipy.integrate import trapz
 from newdust.graindist import shape
+from .grids import make_agrid, _grid_weights
 
 __all__ = ['Astrodust']
 
@@ -22,7 +22,7 @@ class Astrodust(object):
     """
     The Astrodust grain size distribution accroding to Hensley & Draine 2022
     """
-    def __init__(self, amin=AMIN, amax=AMAX, na=NA, log=False):
+    def __init__(self, amin=AMIN, amax=AMAX, na=NA, log=False, quad=False):
         """
         Inputs
         ------
@@ -33,6 +33,8 @@ class Astrodust(object):
         NA  : int : number of a values to use in grid of grain radii
 
         log : boolean (False): if True, use log-spaced grid of grain radii
+
+        quad : False or 'gauss' : if 'gauss', use Gauss-Legendre quadrature nodes (in log(a) if `log` is True), see sizedist.make_agrid
         """
         # Set the name of this size disribution
         self.dtype = 'Astrodust'
@@ -47,11 +49,10 @@ class Astrodust(object):
         else:
             amax_um = amax
         
-        # Set up the grid of grain sizes
-        if log:
-            self.a = np.logspace(np.log10(amin_um), np.log10(amax_um), na) * u.micron
-        else:
-            self.a = np.linspace(amin_um, amax_um, na) * u.micron
+        # Set up the grid of grain sizes, and the weights for integrating over it
+        self.a, wts = make_agrid(amin_um, amax_um, na, log=log, quad=quad)
+        self._agrid = (self.a, wts)
+        self.amin, self.amax = amin_um * u.micron, amax_um * u.micron
         
         # Set up the constants according to Hensley & Draine 2022
         self.B = 3.31e-10 # H^-1
@@ -64,6 +65,39 @@ class Astrodust(object):
         self.A4 = 7.96e-3
         self.A5 = -1.68e-3
 
+        # Stores the shape of the size distribution, see _adep
+        self._adep_cache = (None, None, None)
+
+    @property
+    def wts(self):
+        """
+        Weights [micron] for integrating over the grain radii, int f(a) da = sum(f(a) * wts).
+        If self.a has been replaced, trapezoidal weights for the new grid are returned.
+        """
+        return _grid_weights(self.a, self._agrid)
+
+    def _adep(self):
+        """
+        Shape of the Astrodust size distribution on the grid self.a [um^-1].
+        Only recomputed when the grid or the distribution constants change.
+        """
+        pars = (self.B, self.a0.to('micron').value, self.sigma,
+                self.A0, self.A1, self.A2, self.A3, self.A4, self.A5)
+        a_cached, pars_cached, result = self._adep_cache
+        if a_cached is self.a and pars_cached == pars:
+            return result
+
+        a_um  = self.a.to('micron').value
+        # log of the grain radius in angstroms, which is evaluated only once
+        ln_a  = np.log(a_um * u.micron.to('angstrom'))
+        ln_a0 = np.log(pars[1] * u.micron.to('angstrom'))
+        poly  = np.polyval([self.A5, self.A4, self.A3, self.A2, self.A1, 0.0], ln_a)
+
+        result = self.B/a_um*np.exp(-(ln_a - ln_a0)**2/(2*self.sigma**2))\
+                + self.A0/a_um*np.exp(poly)  # um^-1
+        self._adep_cache = (self.a, pars, result)
+        return result
+
 
     def ndens(self, md, rho=RHO, shape=SHAPE):
         """
@@ -83,16 +117,8 @@ class Astrodust(object):
         
         Column density of grains in [cm^-2]
         """
-        a_um = self.a.to('micron').value
-        a0_um = self.a0.to('micron').value
-
         # astro dust distribution
-        adep  = self.B/a_um*np.exp(-(np.log((self.a/self.a0).to('').value)**2)/(2*self.sigma**2))\
-                + self.A0/a_um*np.exp(self.A1*((np.log((self.a/u.angstrom).to('').value)))\
-                + self.A2*((np.log((self.a/u.angstrom).to('').value))**2)\
-                + self.A3*((np.log((self.a/u.angstrom).to('').value))**3)\
-                + self.A4*((np.log((self.a/u.angstrom).to('').value))**4)\
-                + self.A5*((np.log((self.a/u.angstrom).to('').value))**5))  # um^-1
+        adep  = self._adep()  # um^-1
         
         # get the mass dependence, units of g um^-1
         mgra  = shape.vol(self.a) * rho     # g (mass of each grain)
@@ -100,7 +126,7 @@ class Astrodust(object):
         
         # Integrate over dmda and use that with total mass to get the 
         # correct constant for the entire function
-        const = md / trapz(dmda, a_um)  # cm^-2
+        const = md / np.sum(dmda * self.wts)  # cm^-2
         
         # Final units are number column density per grain size unit (default:micron)
         return const * adep  # cm^-2 um^-1
@@ -1,7 +1,7 @@
 import numpy as np
 import astropy.units as u
-from scipy.integrate import trapz
 from newdust.graindist import shape
+from .grids import make_agrid, _grid_weights
 
 __all__ = ['ExpCutoff']
 
@@ -24,7 +24,7 @@ class ExpCutoff(object):
     """
     Power law grain size distribution with an exponential cut-off at the large end
     """
-    def __init__(self, amin=AMIN, acut=ACUT, p=PDIST, na=NA, log=False, nfold=NFOLD):
+    def __init__(self, amin=AMIN, acut=ACUT, p=PDIST, na=NA, log=False, nfold=NFOLD, quad=False):
         """
         Inputs
         ------
@@ -42,6 +42,8 @@ class ExpCutoff(object):
         log : boolean : False (default), True = use log-spaced a values
         
         nfold : number of e-foldings to go beyond `acut`
+
+        quad : False or 'gauss' : if 'gauss', use Gauss-Legendre quadrature nodes (in log(a) if `log` is True), see sizedist.make_agrid
         """
         self.dtype = 'ExpCutoff'
 
@@ -55,16 +57,23 @@ class ExpCutoff(object):
         else:
             acut_um = acut
 
-        # Set up the grid of grain sizes
-        if log:
-            self.a = np.logspace(np.log10(amin_um), np.log10(acut_um * nfold), na) * u.micron
-        else:
-            self.a = np.linspace(amin_um, acut_um * nfold, na) * u.micron
+        # Set up the grid of grain sizes, and the weights for integrating over it
+        self.a, wts = make_agrid(amin_um, acut_um * nfold, na, log=log, quad=quad)
+        self._agrid = (self.a, wts)
+        self.amin, self.amax = amin_um * u.micron, acut_um * nfold * u.micron
 
         # Log the relevant params
         self.p    = p
         self.acut = acut_um * u.micron
 
+    @property
+    def wts(self):
+        """
+        Weights [micron] for integrating over the grain radii, int f(a) da = sum(f(a) * wts).
+        If self.a has been replaced, trapezoidal weights for the new grid are returned.
+        """
+        return _grid_weights(self.a, self._agrid)
+
     def ndens(self, md, rho=RHO, shape=SHAPE):
         """
         Calculate number density of dust grains, given a dust mass column
@@ -94,7 +103,7 @@ class ExpCutoff(object):
         dmda  = adep * mgra              # g um^-p
 
         # integrate to get the correct scaling constant
-        const = md / trapz(dmda, a_um)  # cm^-2 um^p-1
+        const = md / np.sum(dmda * self.wts)  # cm^-2 um^p-1
 
         # Final units are number column density per grain size unit (default:micron)
         return const * adep  # cm^-2 um^-1
@@ -35,6 +35,14 @@ class Grain(object):
         else:
             self.a = np.array([rad]) * u.micron
 
+    @property
+    def wts(self):
+        """
+        Integration weights for the single grain size; ndens is already a column density,
+        so sum(f(a) * wts) returns f(a) at the grain radius
+        """
+        return np.ones(len(self.a))
+
     def ndens(self, md, rho=RHO, shape=SHAPE):
         """
         Calculate number density of dust grains, given a dust mass column
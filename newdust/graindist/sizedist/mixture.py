@@ -0,0 +1,146 @@
+import copy
+import numpy as np
+import astropy.units as u
+
+from newdust.graindist import shape
+from .grids import make_agrid, _grid_weights, _radius_limits
+
+__all__ = ['Mixture']
+
+# Some default values
+RHO      = 3.0     # g cm^-3 (average grain material density)
+
+NA       = 100     # default number for grain size dist resolution
+
+SHAPE    = shape.Sphere()
+
+#------------------------------------
+
+class Mixture(object):
+    """
+    A sum of several size distributions of the same material, on one common grid
+    of grain radii, so that the whole mixture needs only one scattering calculation.
+    Each component carries a fixed fraction of the total dust mass.
+    """
+    def __init__(self, components, mfrac, amin=None, amax=None, na=NA, log=True, quad=False):
+        """
+        Inputs
+        ------
+        components : list of newdust.graindist.sizedist objects (not Grain)
+
+        mfrac : list or numpy.ndarray : fraction of the dust mass in each component (must sum to 1)
+
+        amin, amax : astropy.units.Quantity -or- float : grain radius limits for the common grid;
+            if a float, micron units assumed (Default: the smallest and largest radius limits of the components)
+
+        NA  : int : number of a values to use in grid of grain radii
+
+        log : boolean (True): if True, use log-spaced grid of grain radii
+
+        quad : False or 'gauss' : if 'gauss', use Gauss-Legendre quadrature nodes (in log(a) if `log` is True), see sizedist.make_agrid
+        """
+        mfrac = np.asarray(mfrac, dtype=float)
+        assert np.shape(mfrac) == (len(components),)
+        assert np.all(mfrac >= 0.0)
+        assert np.abs(np.sum(mfrac) - 1.0) < 1.e-6
+        for c in components:
+            assert c.dtype != 'Grain'
+
+        self.dtype = 'Mixture'
+        self.components = components
+        self.mfrac = mfrac
+
+        # Set up the common grid of grain sizes, and the weights for integrating over it
+        limits  = np.array([_radius_limits(c) for c in components])
+        amin_um = np.min(limits[:,0])
+        amax_um = np.max(limits[:,1])
+        if amin is not None:
+            amin_um = amin.to('micron').value if isinstance(amin, u.Quantity) else amin
+        if amax is not None:
+            amax_um = amax.to('micron').value if isinstance(amax, u.Quantity) else amax
+        self.a, wts = make_agrid(amin_um, amax_um, na, log=log, quad=quad)
+        self._agrid = (self.a, wts)
+        self.amin, self.amax = amin_um * u.micron, amax_um * u.micron
+
+    @property
+    def wts(self):
+        """
+        Weights [micron] for integrating over the grain radii, int f(a) da = sum(f(a) * wts).
+        If self.a has been replaced, trapezoidal weights for the new grid are returned.
+        """
+        return _grid_weights(self.a, self._agrid)
+
+    def ndens_components(self, md, rho=RHO, shape=SHAPE):
+        """
+        Number density of dust grains in each component, on the common grid
+
+        Inputs
+        ------
+
+        md : float : total mass column density [g cm^-2]
+
+        rho : float : grain material density [g cm^-3]
+
+        shape : newdust.graindist.shape object (default is a Sphere)
+
+        Returns
+        -------
+
+        numpy.ndarray (NC x NA) : Column density of grains in [cm^-2 um^-1]
+        """
+        a_um = self.a.to('micron').value
+        mgra = shape.vol(self.a) * rho  # g (mass of each grain)
+        result = []
+        for c, f in zip(self.components, self.mfrac):
+            # evaluate the shape of each component on the common grid,
+            # without changing the component, and zero outside of its own radius limits
+            c_copy = copy.copy(c)
+            c_copy.a = self.a
+            adep = c_copy.ndens(1.0, rho=rho, shape=shape)
+            c_min, c_max = _radius_limits(c)
+            adep = np.where((a_um >= c_min * (1.0 - 1.e-10)) & (a_um <= c_max * (1.0 + 1.e-10)), adep, 0.0)
+            # normalize so that the component holds its share of the dust mass
+            result.append(f * md * adep / np.sum(adep * mgra * self.wts))
+        return np.array(result)
+
+    def ndens(self, md, rho=RHO, shape=SHAPE):
+        """
+        Calculate number density of dust grains, given a dust mass column
+
+        Inputs
+        ------
+
+        md : float : mass column density [g cm^-2]
+
+        rho : float : grain material density [g cm^-3]
+
+        shape : newdust.graindist.shape object (default is a Sphere)
+
+        Returns
+        -------
+
+        Column density of grains in [cm^-2]
+        """
+        return np.sum(self.ndens_components(md, rho, shape), axis=0)  # cm^-2 um^-1
+
+    def mdens(self, md, rho=RHO, shape=SHAPE):
+        """
+        Calculate mass density function for the dust grains, given a total dust mass column
+
+        Inputs
+        ------
+
+        md : float : mass column density [g cm^-2]
+
+        rho : float : grain material density [g cm^-3]
+
+        shape : newdust.graindist.shape object (default is a Sphere)
+
+        Returns
+        -------
+
+        Mass column distribution of grains in [cg m^-2 um^-1]
+        """
+        nd = self.ndens(md, rho, shape)  # dn/da [cm^-2 um^-1]
+        mg = shape.vol(self.a) * rho     # grain mass for each radius [g]
+        return nd * mg  # g cm^-2 um^-1
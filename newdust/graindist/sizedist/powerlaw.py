@@ -1,7 +1,7 @@
 import numpy as np
 import astropy.units as u
-from scipy.integrate import trapz
 from newdust.graindist import shape
+from .grids import make_agrid, _grid_weights
 
 __all__ = ['Powerlaw']
 
@@ -23,7 +23,7 @@ class Powerlaw(object):
     """
     A power law grain size distribution
     """
-    def __init__(self, amin=AMIN, amax=AMAX, p=PDIST, na=NA, log=False):
+    def __init__(self, amin=AMIN, amax=AMAX, p=PDIST, na=NA, log=False, quad=False):
         """
         Inputs
         ------
@@ -36,6 +36,8 @@ class Powerlaw(object):
         NA  : int : number of a values to use in grid of grain radii
 
         log : boolean (False): if True, use log-spaced grid of grain radii
+
+        quad : False or 'gauss' : if 'gauss', use Gauss-Legendre quadrature nodes (in log(a) if `log` is True), see sizedist.make_agrid
         """
         # Set the name of this size disribution
         self.dtype = 'Powerlaw'
@@ -50,15 +52,22 @@ class Powerlaw(object):
         else:
             amax_um = amax
         
-        # Set up the grid of grain sizes
-        if log:
-            self.a = np.logspace(np.log10(amin_um), np.log10(amax_um), na) * u.micron
-        else:
-            self.a = np.linspace(amin_um, amax_um, na) * u.micron
+        # Set up the grid of grain sizes, and the weights for integrating over it
+        self.a, wts = make_agrid(amin_um, amax_um, na, log=log, quad=quad)
+        self._agrid = (self.a, wts)
+        self.amin, self.amax = amin_um * u.micron, amax_um * u.micron
         
         # Power-law slope to use
         self.p    = p
 
+    @property
+    def wts(self):
+        """
+        Weights [micron] for integrating over the grain radii, int f(a) da = sum(f(a) * wts).
+        If self.a has been replaced, trapezoidal weights for the new grid are returned.
+        """
+        return _grid_weights(self.a, self._agrid)
+
     def ndens(self, md, rho=RHO, shape=SHAPE):
         """
         Calculate number density of dust grains, given a dust mass column
@@ -88,7 +97,7 @@ class Powerlaw(object):
         
         # Integrate over dmda and use that with total mass to get the 
         # correct constant for the entire function
-        const = md / trapz(dmda, a_um)  # cm^-2 um^p-1
+        const = md / np.sum(dmda * self.wts)  # cm^-2 um^p-1
         
         # Final units are number column density per grain size unit (default:micron)
         return const * adep  # cm^-2 um^-1
@@ -0,0 +1,171 @@
+import numpy as np
+import astropy.units as u
+from scipy.interpolate import CubicSpline
+
+from newdust.graindist import shape
+from .grids import make_agrid, trapz_weights, _grid_weights
+
+__all__ = ['Tabulated']
+
+# Some default values
+RHO      = 3.0     # g cm^-3 (average grain material density)
+
+SHAPE    = shape.Sphere()
+
+#------------------------------------
+
+class Tabulated(object):
+    """
+    A grain size distribution defined by a table of dn/da values, e.g. from a fit
+    or another code. The shape of the table is used; the normalization comes
+    from the dust mass column, as for the other size distributions.
+
+    The table can be resampled onto a new grid of grain radii with a cubic spline
+    (in log-log space if all dn/da values are positive). The size distribution is
+    zero outside of the tabulated range of grain radii.
+    """
+    def __init__(self, a=None, dnda=None, from_file=None,
+                 amin=None, amax=None, na=None, log=True, quad=False):
+        """
+        Inputs
+        ------
+        a : astropy.units.Quantity -or- numpy.ndarray : tabulated grain radii; if no units specified, micron assumed
+
+        dnda : numpy.ndarray : tabulated size distribution, in any units
+
+        from_file : string : Optional, a text file with two columns, grain radius [micron] and dn/da.
+            Lines starting with '#' are ignored.
+
+        amin, amax : astropy.units.Quantity -or- float : grain radius limits for the resampled grid;
+            if a float, micron units assumed (Default: the limits of the table)
+
+        na : int : number of a values to use in the grid of grain radii.
+            If None (default), the tabulated radii are used as the grid.
+
+        log : boolean (True): if True, use log-spaced grid of grain radii when resampling
+
+        quad : False or 'gauss' : if 'gauss', use Gauss-Legendre quadrature nodes (in log(a) if `log` is True), see sizedist.make_agrid
+        """
+        self.dtype = 'Tabulated'
+
+        if from_file is not None:
+            a, dnda = np.loadtxt(from_file, comments='#', unpack=True)
+        assert (a is not None) and (dnda is not None)
+
+        # Store the table in order of ascending radius
+        if isinstance(a, u.Quantity):
+            a_um = a.to('micron').value
+        else:
+            a_um = np.asarray(a, dtype=float)
+        dnda = np.asarray(dnda, dtype=float)
+        assert np.shape(a_um) == np.shape(dnda)
+        isort = np.argsort(a_um)
+        self.a_table    = a_um[isort] * u.micron
+        self.dnda_table = dnda[isort]
+
+        # Set up the spline used for resampling the table
+        self.loglog = bool(np.all(self.dnda_table > 0.0))
+        if self.loglog:
+            self._spline = CubicSpline(np.log(a_um[isort]), np.log(self.dnda_table))
+        else:
+            self._spline = CubicSpline(np.log(a_um[isort]), self.dnda_table)
+
+        # Set up the grid of grain sizes, and the weights for integrating over it
+        amin_um, amax_um = self.a_table.value[0], self.a_table.value[-1]
+        if na is None:
+            assert (amin is None) and (amax is None) and (not quad)
+            self.a = self.a_table
+            wts = trapz_weights(self.a.to('micron').value)
+        else:
+            if amin is not None:
+                amin_um = amin.to('micron').value if isinstance(amin, u.Quantity) else amin
+            if amax is not None:
+                amax_um = amax.to('micron').value if isinstance(amax, u.Quantity) else amax
+            self.a, wts = make_agrid(amin_um, amax_um, na, log=log, quad=quad)
+        self._agrid = (self.a, wts)
+        self.amin, self.amax = amin_um * u.micron, amax_um * u.micron
+
+    @property
+    def wts(self):
+        """
+        Weights [micron] for integrating over the grain radii, int f(a) da = sum(f(a) * wts).
+        If self.a has been replaced, trapezoidal weights for the new grid are returned.
+        """
+        return _grid_weights(self.a, self._agrid)
+
+    def resample(self, a):
+        """
+        Evaluate the tabulated size distribution at any grain radii
+
+        Inputs
+        ------
+        a : astropy.units.Quantity -or- numpy.ndarray : grain radii; if no units specified, micron assumed
+
+        Returns
+        -------
+        numpy.ndarray : dn/da at `a`, in the units of the table (zero outside of the table)
+        """
+        if isinstance(a, u.Quantity):
+            a_um = a.to('micron').value
+        else:
+            a_um = np.asarray(a, dtype=float)
+        lo, hi = self.a_table.value[0], self.a_table.value[-1]
+        inside = (a_um >= lo * (1.0 - 1.e-10)) & (a_um <= hi * (1.0 + 1.e-10))
+        result = np.zeros_like(a_um)
+        result[inside] = self._spline(np.log(np.clip(a_um[inside], lo, hi)))
+        if self.loglog:
+            result[inside] = np.exp(result[inside])
+        return result
+
+    def ndens(self, md, rho=RHO, shape=SHAPE):
+        """
+        Calculate number density of dust grains, given a dust mass column
+
+        Inputs
+        ------
+
+        md : float : mass column density [g cm^-2]
+
+        rho : float : grain material density [g cm^-3]
+
+        shape : newdust.graindist.shape object (default is a Sphere)
+
+        Returns
+        -------
+
+        Column density of grains in [cm^-2]
+        """
+        # shape of the distribution on the grid self.a
+        if self.a is self.a_table:
+            adep = self.dnda_table
+        else:
+            adep = self.resample(self.a)
+
+        # get the mass dependence and integrate to get the normalization
+        mgra  = shape.vol(self.a) * rho  # g (mass of each grain)
+        const = md / np.sum(adep * mgra * self.wts)
+
+        # Final units are number column density per grain size unit (default:micron)
+        return const * adep  # cm^-2 um^-1
+
+    def mdens(self, md, rho=RHO, shape=SHAPE):
+        """
+        Calculate mass density function for the dust grains, given a total dust mass column
+
+        Inputs
+        ------
+
+        md : float : mass column density [g cm^-2]
+
+        rho : float : grain material density [g cm^-3]
+
+        shape : newdust.graindist.shape object (default is a Sphere)
+
+        Returns
+        -------
+
+        Mass column distribution of grains in [cg m^-2 um^-1]
+        """
+        nd = self.ndens(md, rho, shape)  # dn/da [cm^-2 um^-1]
+        mg = shape.vol(self.a) * rho     # grain mass for each radius [g]
+        return nd * mg  # g cm^-2 um^-1
@@ -0,0 +1,289 @@
+import os
+import numpy as np
+import astropy.units as u
+from scipy.special import erf
+
+from newdust.graindist import shape
+from .grids import make_agrid, _grid_weights
+
+__all__ = ['WD01', 'read_wdtable']
+
+# Some default values
+RHO      = 3.0     # g cm^-3 (average grain material density)
+
+NA       = 100     # default number for grain size dist resolution
+
+# min and max grain radii
+AMIN     = 3.5e-4  # micron (equivalent to 3.5 angstrom)
+AMAX     = 1.0     # micron
+
+SHAPE    = shape.Sphere()
+
+# Tables of fit parameters from Weingartner & Draine (2001)
+WD_TABLES = {'MW':'Table1.WD.dat',
+             'LMC2':'Table3_LMC2.WD.dat',
+             'LMCavg':'Table3_LMCavg.WD.dat',
+             'SMC':'Table3_SMC.WD.dat'}
+WD_COLUMNS = ['R_v', 'bc', 'alpha_g', 'beta_g', 'a_tg', 'a_cg', 'C_g',
+              'alpha_s', 'beta_s', 'a_ts', 'C_s']
+ALLOWED_GRAINS = ['Graphite', 'Silicate']
+
+# Constants for the very small carbonaceous grains (WD01 equations 2-3)
+MC       = 12.0107 * u.u.to('g')  # mass of a carbon atom [g]
+RHO_C    = 2.24                   # g cm^-3
+SIG_VSG  = 0.4
+A0_VSG   = np.array([3.5e-8, 3.0e-7])  # cm (3.5 and 30 angstrom)
+BC_FRAC  = np.array([0.75, 0.25])      # fraction of bc in each log-normal component
+ACS      = 0.1  # micron, exponential cut-off scale for silicate grains
+
+# Process-wide cache of the parsed tables
+_WD_CACHE = dict()
+
+#------------------------------------
+
+class WD01(object):
+    """
+    Grain size distributions for carbonaceous (Graphite) or silicate grains,
+    according to Weingartner & Draine 2001, ApJ, 548, 296.
+    The fit parameters are taken from the tables in newdust/graindist/tables.
+    """
+    def __init__(self, R_v=3.1, bc=0.0, gal='MW', grain='Graphite',
+                 amin=AMIN, amax=AMAX, na=NA, log=True, quad=False):
+        """
+        Inputs
+        ------
+        R_v : float : ratio of total to selective extinction (only used for gal='MW')
+
+        bc : float : abundance of carbon in very small grains, in units of 10^-5 C atoms per H
+
+        gal : string ('MW', 'LMC2', 'LMCavg', 'SMC') : which table of fit parameters to use
+
+        grain : string ('Graphite' or 'Silicate') : which grain population to model
+
+        amin : astropy.units.Quantity -or- float :  minimum grain radius; if a float, micron units assumed
+
+        amax : astropy.units.Quantity -or- float : maximum grain radius; if a float, micron units assumed
+
+        NA  : int : number of a values to use in grid of grain radii
+
+        log : boolean (True): if True, use log-spaced grid of grain radii
+
+        quad : False or 'gauss' : if 'gauss', use Gauss-Legendre quadrature nodes (in log(a) if `log` is True), see sizedist.make_agrid
+        """
+        assert grain in ALLOWED_GRAINS
+        self.dtype = 'WD01'
+        self.gal   = gal
+        self.grain = grain
+
+        # Put amin and amax into units of micron
+        if isinstance(amin, u.Quantity):
+            amin_um = amin.to('micron').value
+        else:
+            amin_um = amin
+        if isinstance(amax, u.Quantity):
+            amax_um = amax.to('micron').value
+        else:
+            amax_um = amax
+
+        # Set up the grid of grain sizes, and the weights for integrating over it
+        self.a, wts = make_agrid(amin_um, amax_um, na, log=log, quad=quad)
+        self._agrid = (self.a, wts)
+        self.amin, self.amax = amin_um * u.micron, amax_um * u.micron
+
+        # Find the fit parameters for this model
+        self.table = read_wdtable(gal)
+        self.row   = self.find_row(R_v, bc)
+        self.R_v   = self.table['R_v'][self.row]
+        self.bc    = self.table['bc'][self.row]
+
+    @property
+    def wts(self):
+        """
+        Weights [micron] for integrating over the grain radii, int f(a) da = sum(f(a) * wts).
+        If self.a has been replaced, trapezoidal weights for the new grid are returned.
+        """
+        return _grid_weights(self.a, self._agrid)
+
+    def find_row(self, R_v, bc):
+        """
+        Returns the index of the table row with the requested R_v and bc values
+        """
+        match = np.isclose(self.table['bc'], bc)
+        if self.gal == 'MW':
+            match &= np.isclose(self.table['R_v'], R_v)
+        if not np.any(match):
+            print("ERROR: No WD01 model for gal=%s, R_v=%s, bc=%s" % (self.gal, R_v, bc))
+        assert np.any(match)
+        return int(np.where(match)[0][0])
+
+    def dnda(self, rows=None):
+        """
+        Grain size distribution per H atom, for many rows of the fit parameter table
+        at once, on the grid self.a
+
+        Inputs
+        ------
+        rows : int or list of int : table rows to evaluate (Default: all rows)
+
+        Returns
+        -------
+        numpy.ndarray (NR x NA) [H^-1 um^-1]
+        """
+        if rows is None:
+            rows = np.arange(len(self.table['bc']))
+        rows = np.atleast_1d(rows)
+        pars = dict((k, self.table[k][rows]) for k in WD_COLUMNS)
+        return _wd01_dnda(self.a.to('micron').value, pars, self.grain)
+
+    def md_per_H(self, rho=RHO, shape=SHAPE, rows=None):
+        """
+        Dust mass per H atom for each table row [g H^-1], e.g. md = md_per_H * N_H.
+        Returns a float if `rows` is a single row (Default: self.row)
+        """
+        if rows is None:
+            rows = self.row
+        mgra = shape.vol(self.a) * rho  # g (mass of each grain)
+        result = np.sum(self.dnda(rows) * mgra * self.wts, axis=1)
+        if np.ndim(rows) == 0:
+            return result[0]
+        return result
+
+    def ndens(self, md, rho=RHO, shape=SHAPE):
+        """
+        Calculate number density of dust grains, given a dust mass column
+
+        Inputs
+        ------
+
+        md : float : mass column density [g cm^-2]
+
+        rho : float : grain material density [g cm^-3]
+
+        shape : newdust.graindist.shape object (default is a Sphere)
+
+        Returns
+        -------
+
+        Column density of grains in [cm^-2]
+        """
+        return self.ndens_rows(md, rho, shape, rows=self.row)[0]
+
+    def ndens_rows(self, md, rho=RHO, shape=SHAPE, rows=None):
+        """
+        Calculate the number density of dust grains for many rows of the fit
+        parameter table at once, each normalized to the dust mass column `md`
+
+        Inputs
+        ------
+        md : float or numpy.ndarray (NR) : mass column density [g cm^-2]
+
+        rho : float : grain material density [g cm^-3]
+
+        shape : newdust.graindist.shape object (default is a Sphere)
+
+        rows : int or list of int : table rows to evaluate (Default: all rows)
+
+        Returns
+        -------
+        numpy.ndarray (NR x NA) : Column density of grains in [cm^-2 um^-1]
+        """
+        adep  = self.dnda(rows)          # H^-1 um^-1
+        mgra  = shape.vol(self.a) * rho  # g (mass of each grain)
+        const = np.asarray(md) / np.sum(adep * mgra * self.wts, axis=1)  # H cm^-2
+        return const[:,np.newaxis] * adep  # cm^-2 um^-1
+
+    def mdens(self, md, rho=RHO, shape=SHAPE):
+        """
+        Calculate mass density function for the dust grains, given a total dust mass column
+
+        Inputs
+        ------
+
+        md : float : mass column density [g cm^-2]
+
+        rho : float : grain material density [g cm^-3]
+
+        shape : newdust.graindist.shape object (default is a Sphere)
+
+        Returns
+        -------
+
+        Mass column distribution of grains in [cg m^-2 um^-1]
+        """
+        nd = self.ndens(md, rho, shape)  # dn/da [cm^-2 um^-1]
+        mg = shape.vol(self.a) * rho     # grain mass for each radius [g]
+        return nd * mg  # g cm^-2 um^-1
+
+#------------------------------------
+
+def read_wdtable(gal='MW'):
+    """
+    Read a table of WD01 fit parameters. Tables are parsed only once per process.
+
+    Inputs
+    ------
+    gal : string ('MW', 'LMC2', 'LMCavg', 'SMC')
+
+    Returns
+    -------
+    dict : column name -> read-only numpy.ndarray. Column 'bc' is in units of 10^-5 C atoms per H,
+    radii are in micron, and R_v is NaN for the LMC and SMC tables.
+    """
+    assert gal in WD_TABLES
+    if gal in _WD_CACHE:
+        return _WD_CACHE[gal]
+
+    filename = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'tables', WD_TABLES[gal])
+    data = []
+    with open(filename, 'r') as f:
+        for line in f:
+            if line.startswith('#') or len(line.strip()) == 0:
+                continue
+            data.append([np.nan if x == '--' else float(x) for x in line.split()])
+    data = np.array(data)
+    assert data.shape[1] == len(WD_COLUMNS)
+
+    result = dict()
+    for i, k in enumerate(WD_COLUMNS):
+        result[k] = data[:,i]
+        result[k].setflags(write=False)
+    _WD_CACHE[gal] = result
+    return result
+
+def _wd01_dnda(a_um, pars, grain):
+    """
+    Vectorized WD01 size distribution (equations 2-6)
+
+    a_um : numpy.ndarray (NA) : grain radii [micron]
+
+    pars : dict of numpy.ndarray (NR) : fit parameters
+
+    grain : 'Graphite' or 'Silicate'
+
+    Returns NR x NA numpy.ndarray [H^-1 um^-1]
+    """
+    a_cm = a_um * u.micron.to('cm')
+    if grain == 'Graphite':
+        alpha, beta, a_t, a_c, C = [pars[k][:,np.newaxis] for k in ['alpha_g', 'beta_g', 'a_tg', 'a_cg', 'C_g']]
+    if grain == 'Silicate':
+        alpha, beta, a_t, C = [pars[k][:,np.newaxis] for k in ['alpha_s', 'beta_s', 'a_ts', 'C_s']]
+        a_c = ACS
+
+    # curvature term, F(a; beta, a_t)
+    x = a_um / a_t
+    curv = np.where(beta >= 0.0, 1.0 + np.abs(beta) * x, 1.0 / (1.0 + np.abs(beta) * x))
+    # exponential cut-off above a_t
+    cutoff = np.exp(-np.power(np.clip(a_um - a_t, 0.0, None) / a_c, 3))
+
+    result = C / a_cm * np.power(x, alpha) * curv * cutoff  # H^-1 cm^-1
+
+    # Log-normal distributions of very small carbonaceous grains
+    if grain == 'Graphite':
+        bc  = pars['bc'][:,np.newaxis] * 1.e-5  # C atoms per H
+        sig = SIG_VSG
+        for a0, frac in zip(A0_VSG, BC_FRAC):
+            B = (3.0 / np.power(2.0*np.pi, 1.5)) * np.exp(-4.5 * sig**2) / (RHO_C * a0**3 * sig) * \
+                frac * bc * MC / (1.0 + erf(3.0*sig/np.sqrt(2.0) + np.log(a0/3.5e-8)/(sig*np.sqrt(2.0))))
+            result = result + B / a_cm * np.exp(-0.5 * np.power(np.log(a_cm/a0) / sig, 2))
+
+    return result * u.micron.to('cm')  # H^-1 um^-1
@@ -1,15 +1,24 @@
+import copy
+import hashlib
+from concurrent import futures
 import numpy as np
-from scipy.integrate import trapz
 import astropy.units as u
 
 from . import graindist
 from . import scatteringmodel
+from .scatteringmodel.scatteringmodel import ALLOWED_OUTPUTS
 
 __all__ = ['SingleGrainPop','GrainPop','make_MRN','make_MRN_RGDrude']
 
 MD_DEFAULT    = 1.e-4  # g cm^-2
 AMIN, AMAX, P = 0.005, 0.3, 3.5  # um, um, unitless
 RHO_AVG       = 3.0  # g cm^-3
+CHUNK_SIZE    = 100  # default number of wavelength/energy values per block for iter_ext
+QMAX          = 6.0  # upper bound on the extinction efficiency, used for pruning
+PRUNE_MM1     = 0.3  # largest |m-1| for which min(QMAX, 4 x |m-1|) bounds the Mie extinction efficiency
+
+# Scattering model attributes that hold results, with wavelength/energy as the first axis
+SCATM_RESULTS = ['qsca', 'qext', 'qabs', 'diff', 'int_diff', 'gsca', 'qback']
 
 # Make this a subclass of GrainDist at some point
 class SingleGrainPop(graindist.GrainDist):
@@ -33,10 +42,19 @@ class SingleGrainPop(graindist.GrainDist):
     for this grain population
 
     diff : astropy.units.Quantity : [cm^2 rad^-2] differential scattering cross-section 
-    as a function of wavelength/energy, grain size, and angle (NE x NA x NTH)
+    as a function of wavelength/energy, grain size, and angle (NE x NA x NTH);
+    None unless calculate_ext was run with outputs='all'
 
     int_diff : astropy.units.Quantity : [rad^-2] differential cross-section integrated 
-    over grain size distribution effectively dtau / dOmega$  (NE x NTH)
+    over grain size distribution effectively dtau / dOmega$  (NE x NTH);
+    None if calculate_ext was run with outputs='tau'
+
+    prune_mask : numpy.ndarray bool : cells (NE x NA) that were calculated,
+    None if calculate_ext was run without `prune`
+
+    prune_err : numpy.ndarray float : estimate of the optical depth left out by pruning (NE),
+    an upper bound on the error on tau_ext, tau_sca, and tau_abs for |m-1| << 1 (see prune_cells);
+    None if calculate_ext was run without `prune`
     """
     def __init__(self, dtype, cmtype, stype, shape='Sphere', md=MD_DEFAULT, scatm_from_file=None, **kwargs):
         """
@@ -67,6 +85,8 @@ class SingleGrainPop(graindist.GrainDist):
         self.tau_ext  = None  # NE
         self.diff     = None  # NE x NA x NTH [cm^2 ster^-1]
         self.int_diff = None  # NE x NTH [ster^-1], differential xsect integrated over grain size
+        self.prune_mask = None  # NE x NA
+        self.prune_err  = None  # NE
 
         # Handling scattering model FITS input, if requested
         if scatm_from_file is not None:
@@ -89,7 +109,7 @@ class SingleGrainPop(graindist.GrainDist):
             self.scatm = scatteringmodel.Mie()
 
     # Run scattering model calculation, then compute optical depths
-    def calculate_ext(self, lam, theta=0.0, **kwargs):
+    def calculate_ext(self, lam, theta=0.0, extend=False, outputs='all', prune=None, **kwargs):
         """
         Calculate the extinction model.
 
@@ -100,52 +120,323 @@ class SingleGrainPop(graindist.GrainDist):
         theta : astropy.units.Quantity -or- numpy.ndarray -or- float
             Scattering angles for computing the differential scattering cross-section;
             if no units specified, defaults to radian
+
+        extend : bool (False) : if True, only calculate the values of `lam` that have not been
+            calculated already, and merge them with the previous results. The merged results
+            are sorted in order of increasing `lam` value. `theta` must be the same as before.
+
+        outputs : string ('all', 'int_diff', or 'tau') : which results to calculate and store.
+            'all' stores tau_*, diff, and int_diff; 'int_diff' stores tau_* and int_diff,
+            and the scattering model sums the differential scattering cross-section over
+            grain radius itself; 'tau' stores tau_* only, and the scattering model skips the
+            differential scattering cross-section (diff and int_diff are None)
+
+        prune : float : if provided, skip the (energy, radius) cells whose contribution
+            to tau_ext is negligible, see prune_cells. At each energy, the cells with the
+            smallest estimated contributions are skipped as long as their sum is at most `prune`
+            times the sum of all the estimates. The estimate of what was left out is stored in
+            `prune_err` (NE), and the calculated cells in `prune_mask`. Skipped cells also have
+            no scattering halo. Only available where |m-1| <= PRUNE_MM1 (e.g. X-ray energies),
+            and can not be used with `extend`.
         
         **kwargs passed to self.scatm.calculate
         """
-        self.scatm.calculate(lam, self.a, self.comp, theta=theta, **kwargs)
+        scatm_kwargs = _scatm_kwargs(kwargs, outputs, self._geo_weights())
+        self.prune_mask, self.prune_err = None, None
+        if prune is not None:
+            assert not extend, "prune can not be used with extend"
+            self.prune_mask, self.prune_err = self.prune_cells(lam, prune)
+            scatm_kwargs['mask'] = self.prune_mask
+        if extend and self.lam is not None:
+            lam = self._missing_lam(lam, theta)
+            if np.size(lam) > 0:
+                old = self._scatm_results()
+                self.scatm.calculate(lam, self.a, self.comp, theta=theta, **scatm_kwargs)
+                self._merge_scatm_results(old)
+        else:
+            self.scatm.calculate(lam, self.a, self.comp, theta=theta, **scatm_kwargs)
         self.lam      = self.scatm.pars['lam']
-        self._calculate_tau()
+        self._calculate_tau(outputs=outputs)
 
-    # Compute optical depths only
-    def _calculate_tau(self):
-        NE, NA, NTH = np.shape(self.scatm.diff)
-        # Recall cgeo is cm^2 and ndens is cm^-2 um^-1
-        # In single size grain case
-        if len(self.a) == 1:
-            self.tau_ext = self.ndens * self.scatm.qext[:,0] * self.cgeo
-            self.tau_sca = self.ndens * self.scatm.qsca[:,0] * self.cgeo
-            self.tau_abs = self.ndens * self.scatm.qabs[:,0] * self.cgeo
-        # Otherwise, integrate over grain size (axis=1)
+    def prune_cells(self, lam, tol):
+        """
+        Choose the (energy, radius) cells to calculate for a relative tolerance `tol`,
+        see calculate_ext.
+
+        The contribution of each cell to tau_ext is estimated as ndens x cgeo x wts x Q,
+        where Q is min(QMAX, 4 x |m-1|) for Mie scattering, which bounds the extinction
+        efficiency when |m-1| << 1 (anomalous diffraction), and the RG efficiency itself for
+        RGscattering. The Mie estimate is not a bound for large |m-1| (e.g. graphite in the UV),
+        so it is only used where |m-1| <= PRUNE_MM1.
+
+        lam : astropy.units.Quantity -or- numpy.ndarray
+            Wavelength or energy values; if no units specified, defaults to keV
+
+        tol : float : fraction of the summed upper bounds that can be left out at each energy
+
+        Returns
+        -------
+        numpy.ndarray (NE x NA, bool) : True for the cells to calculate,
+        numpy.ndarray (NE) : estimate of the optical depth of the skipped cells
+        """
+        assert tol >= 0.0
+        if not isinstance(lam, u.Quantity):
+            lam = lam * u.keV
+        lam_cm = np.atleast_1d(lam.to('cm', equivalencies=u.spectral()).value)
+        a_cm   = self.a.to('cm').value
+        mm1    = np.abs(np.atleast_1d(self.comp.cm(lam_cm * u.cm)) - 1.0)  # NE
+        assert np.all(mm1 <= PRUNE_MM1), \
+            "prune needs |m-1| <= %.2f (e.g. X-ray energies), where Qext can be bounded" % PRUNE_MM1
+        x      = 2.0 * np.pi * a_cm[np.newaxis,:] / lam_cm[:,np.newaxis]  # NE x NA
+        if isinstance(self.scatm, scatteringmodel.RGscattering):
+            q_ub = scatteringmodel.rgscat._qsca(x, mm1[:,np.newaxis])
         else:
-            geo_fac = self.ndens * self.cgeo  # array of length NA, unit is um^-1
-            geo_2d  = np.repeat(geo_fac.reshape(1, NA), NE, axis=0)  # NE x NA
-            a_um = self.a.to('micron').value
-            self.tau_ext = trapz(geo_2d * self.scatm.qext, a_um, axis=1)
-            self.tau_sca = trapz(geo_2d * self.scatm.qsca, a_um, axis=1)
-            self.tau_abs = trapz(geo_2d * self.scatm.qabs, a_um, axis=1)
+            q_ub = np.minimum(QMAX, 4.0 * x * mm1[:,np.newaxis])
+        bound  = q_ub * self._geo_weights()[np.newaxis,:]  # NE x NA
+
+        # Skip the smallest bounds at each energy, while their sum is within tolerance
+        isort  = np.argsort(bound, axis=1)
+        cumsum = np.cumsum(np.take_along_axis(bound, isort, axis=1), axis=1)
+        skip_sorted = cumsum <= tol * cumsum[:,-1:]
+        mask = np.ones_like(bound, dtype=bool)
+        np.put_along_axis(mask, isort, ~skip_sorted, axis=1)
+        err  = np.sum(np.where(mask, 0.0, bound), axis=1)
+        return mask, err
+
+    def _missing_lam(self, lam, theta=0.0):
+        """
+        Returns the values of `lam` that have not been calculated yet, in the units of self.lam
+        """
+        # The new results can only be merged if they use the same scattering angles
+        theta_old = self.scatm.pars['theta'].to('radian').value
+        theta_new = theta.to('radian').value if isinstance(theta, u.Quantity) else theta
+        assert np.size(theta_new) == np.size(theta_old) and \
+            np.allclose(theta_new, theta_old, rtol=1.e-10, atol=0.0), \
+            "extend requires the same theta values as the previous calculation"
+
+        if not isinstance(lam, u.Quantity):
+            lam = lam * u.keV
+        new = np.unique(np.atleast_1d(lam.to(self.lam.unit, equivalencies=u.spectral()).value))
+        old = np.atleast_1d(self.lam.value)
+        done = np.any(np.isclose(new[:,np.newaxis], old[np.newaxis,:], rtol=1.e-10, atol=0.0), axis=1)
+        return new[~done] * self.lam.unit
+
+    def _scatm_results(self):
+        # Results of the most recent scattering calculation, with their wavelength/energy grid
+        result = dict((k, getattr(self.scatm, k)) for k in SCATM_RESULTS
+                      if getattr(self.scatm, k, None) is not None)
+        result['lam'] = self.scatm.pars['lam']
+        return result
+
+    def _merge_scatm_results(self, old):
+        # Merge the results of a scattering calculation with older results, sorted by lam value
+        unit    = old['lam'].unit
+        lam_new = self.scatm.pars['lam'].to(unit, equivalencies=u.spectral()).value
+        lam_all = np.append(np.atleast_1d(old['lam'].value), lam_new)
+        isort   = np.argsort(lam_all)
+        for k in SCATM_RESULTS:
+            new = getattr(self.scatm, k, None)
+            if k in old and new is not None:
+                merged = np.concatenate([old[k], new], axis=0)
+                setattr(self.scatm, k, merged[isort])
+            elif new is not None or k in old:
+                # not available for all of the values, so drop it
+                setattr(self.scatm, k, None)
+        self.scatm.pars['lam'] = lam_all[isort] * unit
+
+    def share_ext(self, other, outputs='all'):
+        """
+        Use the scattering model results of another SingleGrainPop, which must have
+        the same grain radii, optical constants, and type of scattering model,
+        then compute the optical depths for this grain population.
+        The efficiency arrays are shared, not copied.
+
+        other : SingleGrainPop
+
+        outputs : string ('all', 'int_diff', or 'tau') : see calculate_ext
+        """
+        assert type(other.scatm) == type(self.scatm)
+        assert np.array_equal(other.a.to('micron').value, self.a.to('micron').value)
+        assert other.prune_mask is None, "pruned cells depend on the size distribution and can not be shared"
+        for attr in SCATM_RESULTS:
+            if hasattr(other.scatm, attr):
+                setattr(self.scatm, attr, getattr(other.scatm, attr))
+        self.scatm.pars = dict(other.scatm.pars)
+        self.lam = self.scatm.pars['lam']
+        self.prune_mask, self.prune_err = None, None
+        assert outputs in ALLOWED_OUTPUTS
+        self._calculate_tau(outputs=outputs)
+
+    # Compute optical depths only
+    def _calculate_tau(self, outputs='all'):
+        self.tau_ext, self.tau_sca, self.tau_abs, self.int_diff = \
+            self._integrate_scatm(self.scatm, int_diff=(outputs != 'tau'))
 
         # Recall that scatm.diff is diffrential scattering efficiency [ster^-1]
         # diff shape is NE x NA x NTH
-        area_2d = np.repeat(self.cgeo.reshape(1, NA), NE, axis=0) # cm^2
-        area_3d = np.repeat(area_2d.reshape(NE, NA, 1), NTH, axis=2)
-        self.diff = self.scatm.diff * area_3d * u.Unit('cm^2 rad^-2') # NE x NA x NTH, [cm^2 ster^-1]
-
-        # If a single grain size, operate in 2D (shape: NE x NTH)
-        if np.size(self.a) == 1:
-            int_diff = np.sum(self.scatm.diff * self.cgeo[0] * self.ndens[0], axis=1)
-        # Otherwise, integrate differential scattering cross-section over NA
+        if outputs == 'all' and self.scatm.diff is not None:
+            self.diff = np.einsum('ijk,j->ijk', self.scatm.diff, self.cgeo) * \
+                u.Unit('cm^2 rad^-2') # NE x NA x NTH, [cm^2 ster^-1]
         else:
-            a_um = self.a.to('micron').value
-            agrid        = np.repeat(
-                np.repeat(a_um.reshape(1, NA, 1), NE, axis=0),
-                NTH, axis=2)
-            ndgrid       = np.repeat(
-                np.repeat(self.ndens.reshape(1, NA, 1), NE, axis=0),
-                NTH, axis=2)
-            int_diff = trapz(self.scatm.diff * area_3d * ndgrid, agrid, axis=1)
+            # Mie and RGscattering do not calculate diff unless it is requested, but other
+            # scattering models might, so do not hold on to it once int_diff is done
+            self.diff = None
+            self.scatm.diff = None
+
+    def _integrate_scatm(self, scatm, int_diff=True):
+        """
+        Integrate the results of a scattering model calculation over the size distribution.
+        Returns tau_ext, tau_sca, tau_abs (NE), and int_diff (NE x NTH) [ster^-1];
+        int_diff is None if it is not requested, or if the scattering model has no `diff`
+        """
+        # Recall cgeo is cm^2 and ndens is cm^-2 um^-1
+        # Integrate over grain size (axis=1) with the size distribution weights [um];
+        # in the single size grain case, the weight is 1
+        geo_fac = self._geo_weights()  # array of length NA, unitless
+        tau_ext = np.dot(scatm.qext, geo_fac)
+        tau_sca = np.dot(scatm.qsca, geo_fac)
+        tau_abs = np.dot(scatm.qabs, geo_fac)
+
+        if not int_diff:
+            return tau_ext, tau_sca, tau_abs, None
+
+        if scatm.diff is not None:
+            # Integrate differential scattering cross-section over NA (shape: NE x NTH),
+            # without making any NE x NA x NTH temporary arrays
+            int_diff = np.einsum('ijk,j->ik', scatm.diff, geo_fac)
+        elif getattr(scatm, 'int_diff', None) is not None:
+            # The scattering model did the integral, with the weights of the grain population
+            # that ran the calculation, so rescale it for this one
+            scale = _weight_scale(geo_fac, scatm.pars['weights'])
+            assert scale is not None, "int_diff was calculated for a different grain size distribution"
+            int_diff = scatm.int_diff * scale
+        else:
+            return tau_ext, tau_sca, tau_abs, None
+        return tau_ext, tau_sca, tau_abs, int_diff * u.Unit('rad^-2')
+
+    def _geo_weights(self):
+        # ndens * cgeo * wts, which maps efficiencies to optical depths (NA, unitless)
+        return self.ndens * self.cgeo * self.wts
+
+    # Stream the extinction calculation in blocks of wavelength/energy
+    def iter_ext(self, lam, chunk_size=CHUNK_SIZE, theta=0.0, outputs='int_diff', **kwargs):
+        """
+        Calculate the extinction model in blocks of `chunk_size` wavelength/energy values,
+        yielding the results for each block as soon as it is done. Only one block of
+        scattering model results is held in memory at a time, and the attributes of this
+        SingleGrainPop (including self.scatm) are not changed.
+
+        lam : astropy.units.Quantity -or- numpy.ndarray
+            Wavelength or energy values for calculating the cross-sections;
+            if no units specified, defaults to keV
+
+        chunk_size : int : number of wavelength/energy values in each block
+
+        theta : astropy.units.Quantity -or- numpy.ndarray -or- float
+            Scattering angles for computing the differential scattering cross-section;
+            if no units specified, defaults to radian
+
+        outputs : string ('int_diff' or 'tau') : if 'tau', int_diff is not calculated (None)
+
+        **kwargs passed to self.scatm.calculate
+
+        Yields
+        ------
+        dict with keys 'lam' (block of wavelength/energy values), 'tau_ext', 'tau_sca',
+        'tau_abs' (NE_block), and 'int_diff' (NE_block x NTH) [ster^-1]
+        """
+        scatm_kwargs = _scatm_kwargs(kwargs, outputs, self._geo_weights())
+        scatm = copy.copy(self.scatm)
+        for lam_chunk in _lam_chunks(lam, chunk_size):
+            scatm.calculate(lam_chunk, self.a, self.comp, theta=theta, **scatm_kwargs)
+            yield _chunk_result(scatm.pars['lam'],
+                                *self._integrate_scatm(scatm, int_diff=(outputs != 'tau')))
+
+    # Extinction for many volume fractions of an effective-medium composition
+    def calculate_ext_vfrac(self, lam, vfrac, theta=0.0, outputs='tau', **kwargs):
+        """
+        Calculate the extinction model for many volume fractions (e.g. a grid of porosities)
+        of the effective-medium composition self.comp, in a single scattering calculation.
+        The scattering models take one complex index of refraction per wavelength/energy,
+        so the NF x NE indices from self.comp.cm_vfrac are stacked along the
+        wavelength/energy axis. The attributes of this SingleGrainPop are not changed.
+
+        lam : astropy.units.Quantity -or- numpy.ndarray
+            Wavelength or energy values for calculating the cross-sections;
+            if no units specified, defaults to keV
+
+        vfrac : numpy.ndarray (NF x NC) : volume fractions of the NC components of self.comp
+
+        theta : astropy.units.Quantity -or- numpy.ndarray -or- float
+            Scattering angles for computing the differential scattering cross-section;
+            if no units specified, defaults to radian
+
+        outputs : string ('int_diff' or 'tau') : if 'tau', int_diff is not calculated (None)
+
+        **kwargs passed to self.scatm.calculate
 
-        self.int_diff = int_diff * u.Unit('rad^-2')  # NE x NTH, [ster^-1]
+        Returns
+        -------
+        dict with keys 'lam', 'tau_ext', 'tau_sca', 'tau_abs' (NF x NE), and
+        'int_diff' (NF x NE x NTH) [ster^-1]. The dust mass column is self.md for every set of
+        volume fractions, so the number of grains scales with 1 / (material density).
+        """
+        assert hasattr(self.comp, 'cm_vfrac'), "calculate_ext_vfrac needs an effective-medium composition"
+        assert outputs in ['int_diff', 'tau']
+        if not isinstance(lam, u.Quantity):
+            lam = lam * u.keV
+        lam   = np.atleast_1d(lam)
+        vfrac = np.atleast_2d(np.asarray(vfrac, dtype=float))  # NF x NC
+        NF, NE = len(vfrac), len(lam)
+        mvals = np.atleast_2d(self.comp.cm_vfrac(lam, vfrac))  # NF x NE
+        rho   = np.dot(vfrac, [c.rho for c in self.comp.components])  # NF
+        assert np.all(rho > 0.0)
+
+        scatm = copy.copy(self.scatm)
+        stacked = _StackedIndex(self.comp.cmtype, mvals.flatten())
+        scatm.calculate(np.tile(lam, NF), self.a, stacked, theta=theta,
+                        **_scatm_kwargs(kwargs, outputs, self._geo_weights()))
+        tau_ext, tau_sca, tau_abs, int_diff = self._integrate_scatm(scatm, int_diff=(outputs != 'tau'))
+
+        # Same dust mass, so the number of grains scales with 1 / rho
+        scale  = self.rho / rho
+        result = _chunk_result(lam, *[None if t is None else t.reshape((NF, NE) + np.shape(t)[1:]) *
+                                      scale.reshape((NF,) + (1,) * np.ndim(t))
+                                      for t in [tau_ext, tau_sca, tau_abs, int_diff]])
+        return result
+
+    # Evaluate many sightlines from one extinction calculation
+    def batch_tau(self, md, rho=None, keyword='ext'):
+        """
+        Optical depths for N sightlines from the most recent run of calculate_ext,
+        without any new scattering calculations
+
+        md : float or numpy.ndarray (N) : dust mass column for each sightline [g cm^-2]
+
+        rho : float or numpy.ndarray (N) : grain material density [g cm^-3] (Default: self.rho);
+            only changes the number of grains for a given mass, the optical constants are held fixed
+
+        keyword : string ('ext', 'sca', 'abs') : which optical depth to return
+
+        Returns
+        -------
+        numpy.ndarray (N x NE)
+        """
+        assert self.lam is not None, "Need to run calculate_ext"
+        return _batch_tau([self], _sightline_coeffs([self], md, None, rho), keyword)
+
+    def batch_int_diff(self, md, rho=None):
+        """
+        Differential scattering cross-section integrated over the grain size distribution
+        (dtau / dOmega) for N sightlines, from the most recent run of calculate_ext
+        (see batch_tau for the inputs)
+
+        Returns
+        -------
+        astropy.units.Quantity (N x NE x NTH) [rad^-2]
+        """
+        assert self.lam is not None, "Need to run calculate_ext"
+        return _batch_int_diff([self], _sightline_coeffs([self], md, None, rho))
 
     # Plot information about the grain size distribution
     def plot_sdist(self, ax, **kwargs):
@@ -292,7 +583,7 @@ class GrainPop(object):
         # No wavelength/energy grid assigned until the calculation is done
         self.lam = None
         
-    def calculate_ext(self, lam, **kwargs):
+    def calculate_ext(self, lam, unique=True, executor=None, max_workers=None, extend=False, **kwargs):
         """
         Calculate the extinction model.
 
@@ -303,20 +594,119 @@ class GrainPop(object):
         theta : astropy.units.Quantity -or- numpy.ndarray -or- float
             Scattering angles for computing the differential scattering cross-section;
             if no units specified, defaults to radian
+
+        unique : bool (True) : if True, grain populations with the same scattering model,
+            optical constants, and grain radii share a single scattering calculation,
+            and only the optical depths are computed separately for each population
+
+        executor : None, 'thread', 'process', or concurrent.futures.Executor :
+            if not None, run the scattering calculations for the grain populations
+            concurrently, in a pool of threads or processes (or in the executor provided)
+
+        max_workers : int : number of threads or processes to use when `executor` is a string
+            (Default: None, which uses the concurrent.futures default)
+
+        extend : bool (False) : if True, only calculate the values of `lam` that have not been
+            calculated already, and merge them with the previous results (see SingleGrainPop.calculate_ext)
+
+        outputs : string ('all', 'int_diff', or 'tau') : which results to calculate and store
+            for each grain population (see SingleGrainPop.calculate_ext)
         
-        **kwargs passed to SingleGrainPop.scatm.calculate for each grain population in the list
+        **kwargs passed to SingleGrainPop.calculate_ext for each grain population in the list
         """
         # Assing units if an Astropy Quantity is not input
         input_lam = lam
         if not isinstance(lam, u.Quantity):
             input_lam = lam * u.keV
-        
-        # Run extinction calculation on each SingleGrainPop in the list
+
+        # Find the grain populations that need their own scattering calculation
+        outputs = kwargs.get('outputs', 'all')
+        done, todo, dups = dict(), [], []
         for gp in self.gpoplist:
-            gp.calculate_ext(input_lam, **kwargs)
+            key = _scatm_key(gp, input_lam, kwargs) if unique else None
+            if key is not None and key in done and _can_share(gp, done[key], outputs):
+                dups.append((gp, done[key]))
+            else:
+                done.setdefault(key, gp)
+                todo.append(gp)
+
+        # Run extinction calculation on each SingleGrainPop in the list
+        if executor is None:
+            for gp in todo:
+                gp.calculate_ext(input_lam, extend=extend, **kwargs)
+        elif isinstance(executor, str):
+            assert executor in ['thread', 'process']
+            if executor == 'thread':
+                pool = futures.ThreadPoolExecutor(max_workers=max_workers)
+            if executor == 'process':
+                pool = futures.ProcessPoolExecutor(max_workers=max_workers)
+            with pool:
+                _calculate_ext_pool(pool, todo, input_lam, kwargs, extend=extend)
+        else:
+            _calculate_ext_pool(executor, todo, input_lam, kwargs, extend=extend)
+
+        for gp, gp_ref in dups:
+            gp.share_ext(gp_ref, outputs=outputs)
 
         # If everything went fine, store inthe input wavlength/energy grid
         self.lam = input_lam
+        if extend:
+            self.lam = self.gpoplist[0].lam
+
+    def iter_ext(self, lam, chunk_size=CHUNK_SIZE, unique=True, theta=0.0, outputs='int_diff', **kwargs):
+        """
+        Calculate the extinction model in blocks of `chunk_size` wavelength/energy values,
+        yielding the results summed over all of the grain populations for each block as
+        soon as it is done (see SingleGrainPop.iter_ext). The grain populations are not changed.
+
+        lam : astropy.units.Quantity -or- numpy.ndarray
+            Wavelength or energy values for calculating the cross-sections;
+            if no units specified, defaults to keV
+
+        chunk_size : int : number of wavelength/energy values in each block
+
+        unique : bool (True) : if True, grain populations with the same scattering model,
+            optical constants, and grain radii share a single scattering calculation
+
+        theta : astropy.units.Quantity -or- numpy.ndarray -or- float
+            Scattering angles for computing the differential scattering cross-section;
+            if no units specified, defaults to radian
+
+        outputs : string ('int_diff' or 'tau') : if 'tau', int_diff is not calculated (None)
+
+        **kwargs passed to SingleGrainPop.scatm.calculate for each grain population in the list
+
+        Yields
+        ------
+        dict with keys 'lam' (block of wavelength/energy values), 'tau_ext', 'tau_sca',
+        'tau_abs' (NE_block), and 'int_diff' (NE_block x NTH) [ster^-1]
+        """
+        input_lam = lam
+        if not isinstance(lam, u.Quantity):
+            input_lam = lam * u.keV
+
+        # One scattering model per distinct calculation, so that the grain populations are not changed
+        scatms, refs = dict(), []
+        for i, gp in enumerate(self.gpoplist):
+            key = _scatm_key(gp, input_lam, dict(kwargs, theta=theta)) if unique else None
+            if key is None or (key in scatms and not _can_share(gp, scatms[key][0], outputs)):
+                key = ('gpop', i)
+            if key not in scatms:
+                scatms[key] = (gp, copy.copy(gp.scatm))
+            refs.append(key)
+
+        for lam_chunk in _lam_chunks(input_lam, chunk_size):
+            for gp_ref, scatm in scatms.values():
+                scatm.calculate(lam_chunk, gp_ref.a, gp_ref.comp, theta=theta,
+                                **_scatm_kwargs(kwargs, outputs, gp_ref._geo_weights()))
+            total = None
+            for gp, key in zip(self.gpoplist, refs):
+                result = gp._integrate_scatm(scatms[key][1], int_diff=(outputs != 'tau'))
+                if total is None:
+                    total = list(result)
+                else:
+                    total = [None if t is None else t + r for t, r in zip(total, result)]
+            yield _chunk_result(scatms[refs[0]][1].pars['lam'], *total)
 
     # Makes this object work like a dictionary
     def __getitem__(self, key):
@@ -376,6 +766,54 @@ class GrainPop(object):
                 result += gp.tau_abs
         return result
 
+    #----- Evaluate many sightlines from one extinction calculation
+
+    def sightline_coeffs(self, md, weights=None, rho=None):
+        """
+        Returns the matrix (N x NP) that scales the results of each of the NP grain populations
+        to N sightlines with different dust mass columns and grain mixtures
+
+        Inputs
+        ------
+        md : float or numpy.ndarray (N) : total dust mass column for each sightline [g cm^-2]
+
+        weights : numpy.ndarray (NP or N x NP) : fraction of the dust mass in each grain population
+            (Default: None, uses the mass fractions of this GrainPop)
+
+        rho : float or numpy.ndarray (N or N x NP) : grain material density [g cm^-3]
+            (Default: None, uses the density of each grain population).
+            The density only changes the number of grains for a given mass;
+            the optical constants of each population are held fixed.
+        """
+        return _sightline_coeffs(self.gpoplist, md, weights, rho)
+
+    def batch_tau(self, md, weights=None, rho=None, keyword='ext'):
+        """
+        Optical depths for N sightlines from the most recent run of calculate_ext,
+        without any new scattering calculations (see sightline_coeffs for the inputs)
+
+        keyword : string ('ext', 'sca', 'abs') : which optical depth to return
+
+        Returns
+        -------
+        numpy.ndarray (N x NE)
+        """
+        assert self.lam is not None, "Need to run calculate_ext"
+        return _batch_tau(self.gpoplist, self.sightline_coeffs(md, weights, rho), keyword)
+
+    def batch_int_diff(self, md, weights=None, rho=None):
+        """
+        Differential scattering cross-section integrated over the grain size distributions
+        (dtau / dOmega) for N sightlines, from the most recent run of calculate_ext
+        (see sightline_coeffs for the inputs)
+
+        Returns
+        -------
+        astropy.units.Quantity (N x NE x NTH) [rad^-2]
+        """
+        assert self.lam is not None, "Need to run calculate_ext"
+        return _batch_int_diff(self.gpoplist, self.sightline_coeffs(md, weights, rho))
+
     def plot_ext(self, ax, keyword, unit=None, **kwargs):
         """
         Plot the sum of the extinction properties across all grain populations
@@ -512,3 +950,158 @@ def make_MRN_RGDrude(amin=AMIN, amax=AMAX, p=P, rho=RHO_AVG, md=MD_DEFAULT, **kw
     dru     = graindist.composition.CmDrude(rho=rho)
     mrn_rgd = SingleGrainPop(pl, dru, 'RG', md=md)
     return mrn_rgd
+
+##----- Helper material
+
+# Scattering models whose results depend on the composition only through cm.cm(lam)
+SHAREABLE_SCATM = (scatteringmodel.Mie, scatteringmodel.RGscattering)
+
+def _array_key(x):
+    # Hashable summary of an array, number, or astropy.units.Quantity
+    if isinstance(x, u.Quantity):
+        return (_array_key(x.value), str(x.unit))
+    if isinstance(x, (np.ndarray, float, int, list)):
+        x = np.asarray(x)
+        return (hashlib.sha1(np.ascontiguousarray(x).tobytes()).hexdigest(), x.shape, str(x.dtype))
+    return repr(x)
+
+def _scatm_key(gp, lam, kwargs):
+    """
+    Returns a key that is the same for grain populations whose scattering calculations
+    are identical, or None if the calculation can not be shared
+    """
+    if type(gp.scatm) not in SHAREABLE_SCATM:
+        return None
+    # Pruned cells depend on the size distribution of each population
+    if kwargs.get('prune') is not None:
+        return None
+    # Compare compositions by their complex index of refraction on the requested grid
+    cm_key = _array_key(np.asarray(gp.comp.cm(lam)))
+    kw_key = tuple((k, _array_key(kwargs[k])) for k in sorted(kwargs) if k != 'outputs')
+    return (type(gp.scatm).__name__, gp.scatm.stype, gp.comp.cmtype, cm_key,
+            _array_key(gp.a.to('micron').value), _array_key(lam), kw_key)
+
+def _run_scatm(scatm, lam, a, comp, kwargs):
+    # Runs in a worker thread or process; returns the scattering model with its results
+    scatm.calculate(lam, a, comp, **kwargs)
+    return scatm
+
+def _calculate_ext_pool(pool, gpoplist, lam, kwargs, extend=False):
+    """
+    Run the scattering calculations for a list of SingleGrainPop objects in an executor,
+    then compute the optical depths of each population in this process
+    """
+    scatm_kwargs = dict(kwargs)
+    outputs   = scatm_kwargs.pop('outputs', 'all')
+    prune     = scatm_kwargs.pop('prune', None)
+    assert prune is None or not extend, "prune can not be used with extend"
+    jobs = []
+    for gp in gpoplist:
+        gp_lam, old = lam, None
+        gp_kwargs = _scatm_kwargs(scatm_kwargs, outputs, gp._geo_weights())
+        gp.prune_mask, gp.prune_err = None, None
+        if prune is not None:
+            gp.prune_mask, gp.prune_err = gp.prune_cells(lam, prune)
+            gp_kwargs['mask'] = gp.prune_mask
+        if extend and gp.lam is not None:
+            gp_lam = gp._missing_lam(lam, scatm_kwargs.get('theta', 0.0))
+            old    = gp._scatm_results()
+        if np.size(gp_lam) == 0:
+            jobs.append(None)
+        else:
+            jobs.append((pool.submit(_run_scatm, gp.scatm, gp_lam, gp.a, gp.comp, gp_kwargs), old))
+
+    for gp, job in zip(gpoplist, jobs):
+        if job is not None:
+            result = job[0].result()
+            # results from a process pool come back as a copy of the scattering model
+            if result is not gp.scatm:
+                gp.scatm.__dict__.update(result.__dict__)
+            if job[1] is not None:
+                gp._merge_scatm_results(job[1])
+        gp.lam = gp.scatm.pars['lam']
+        gp._calculate_tau(outputs=outputs)
+
+def _scatm_kwargs(kwargs, outputs, weights=None):
+    # Keywords for the scattering model: for outputs='int_diff', the scattering model sums
+    # the differential cross-section over grain radius itself, with the `weights` (NA)
+    assert outputs in ALLOWED_OUTPUTS
+    result = dict(kwargs)
+    result['outputs'] = outputs
+    if outputs == 'int_diff':
+        result['weights'] = weights
+    return result
+
+def _weight_scale(geo_fac, weights):
+    # Returns c such that geo_fac = c * weights, or None if they are not proportional
+    w2 = np.dot(weights, weights)
+    scale = np.dot(geo_fac, weights) / w2 if w2 > 0.0 else 0.0
+    if np.allclose(geo_fac, scale * weights, rtol=1.e-10, atol=0.0):
+        return scale
+    return None
+
+def _can_share(gp, gp_ref, outputs):
+    # With outputs='int_diff', the scattering model result is summed over the size distribution
+    # of gp_ref, so it can only be shared by grain populations with proportional weights
+    return outputs != 'int_diff' or _weight_scale(gp._geo_weights(), gp_ref._geo_weights()) is not None
+
+class _StackedIndex(object):
+    """
+    Stand-in composition for the scattering models, which returns precomputed values
+    of the complex index of refraction, one for each wavelength/energy it is called with
+    """
+    def __init__(self, cmtype, mvals):
+        self.cmtype = cmtype
+        self.mvals  = mvals
+
+    def cm(self, x):
+        assert np.size(x) == np.size(self.mvals)
+        return self.mvals
+
+def _lam_chunks(lam, chunk_size):
+    # Split the wavelength/energy grid into blocks of at most chunk_size values
+    assert chunk_size >= 1
+    if not isinstance(lam, u.Quantity):
+        lam = lam * u.keV
+    lam = np.atleast_1d(lam)
+    for i in range(0, len(lam), int(chunk_size)):
+        yield lam[i:i+int(chunk_size)]
+
+def _chunk_result(lam, tau_ext, tau_sca, tau_abs, int_diff):
+    # Results for one block of wavelength/energy values, as yielded by iter_ext
+    return {'lam':lam, 'tau_ext':tau_ext, 'tau_sca':tau_sca,
+            'tau_abs':tau_abs, 'int_diff':int_diff}
+
+def _sightline_coeffs(gpoplist, md, weights=None, rho=None):
+    """
+    Returns the N x NP matrix that scales the results of NP grain populations to N sightlines.
+    Optical depths are proportional to the number of grains, md * weight / rho.
+    """
+    NP     = len(gpoplist)
+    md_gp  = np.array([gp.md for gp in gpoplist])
+    rho_gp = np.array([gp.rho for gp in gpoplist])
+    md     = np.atleast_1d(np.asarray(md, dtype=float))  # N
+    if weights is None:
+        weights = md_gp / np.sum(md_gp)
+    weights = np.asarray(weights, dtype=float)
+    if weights.ndim < 2:
+        weights = np.broadcast_to(weights, (len(md), NP))
+    assert np.shape(weights)[-1] == NP
+    assert np.all(weights >= 0.0)
+    if rho is None:
+        rho = rho_gp[np.newaxis,:]
+    rho = np.asarray(rho, dtype=float)
+    if rho.ndim == 1:
+        rho = rho[:,np.newaxis]  # one density per sightline
+    return md[:,np.newaxis] * weights / md_gp * (rho_gp / rho)  # N x NP
+
+def _batch_tau(gpoplist, coeffs, keyword='ext'):
+    assert keyword in ['ext', 'sca', 'abs']
+    tau = np.array([getattr(gp, 'tau_' + keyword) for gp in gpoplist])  # NP x NE
+    return np.dot(coeffs, tau)  # N x NE
+
+def _batch_int_diff(gpoplist, coeffs):
+    assert all(gp.int_diff is not None for gp in gpoplist), \
+        "int_diff was not calculated, rerun calculate_ext with outputs='int_diff'"
+    int_diff = np.array([gp.int_diff.to('rad^-2').value for gp in gpoplist])  # NP x NE x NTH
+    return np.tensordot(coeffs, int_diff, axes=([1], [0])) * u.Unit('rad^-2')  # N x NE x NTH
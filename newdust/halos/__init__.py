@@ -1,2 +1,3 @@
 from .halo import Halo
 from .galhalo import *
+from .response import *
@@ -12,8 +12,9 @@ import astropy.constants as c
 
 from astropy.io import fits
 
-from .halo import Halo
+from .halo import Halo, _arf_area, _lam_mask, _fake_radial_image
 from ..grainpop import *
+from ..grainpop import _sightline_coeffs, _batch_tau, _batch_int_diff
 
 __all__ = ['UniformGalHalo','ScreenGalHalo','path_diff','time_delay','UniformGalHaloCP15','ScreenGalHaloCP15']
 
@@ -25,7 +26,7 @@ class UniformGalHalo(Halo):
         self.description = 'Uniform'
         self.md = None
 
-    def calculate(self, gpop, nx=500, **kwargs):
+    def calculate(self, gpop, nx=500, outputs='int_diff', **kwargs):
         """
         Calculate the X-ray scattering intensity for dust distributed
         uniformly along the line of sight
@@ -36,7 +37,11 @@ class UniformGalHalo(Halo):
 
         nx : int
             Number of x-values to use for calculation (Default: 500)
-        
+
+        outputs : string ('int_diff' or 'all')
+            Results to store on `gpop`, see SingleGrainPop.calculate_ext.
+            The halo only needs 'int_diff'; use 'all' to also keep `gpop.diff` (Default: 'int_diff')
+
         **kwargs are passed to grainpop extinction calculator
 
         Returns
@@ -44,32 +49,25 @@ class UniformGalHalo(Halo):
         None. Updates the md, norm_int, and taux attributes.
         """
         assert isinstance(gpop, SingleGrainPop)
+        assert outputs in ['int_diff', 'all']
         self.md    = gpop.mdens
 
-        NE, NA     = np.size(self.lam), np.size(gpop.a)
+        NE         = np.size(self.lam)
         self.norm_int = np.zeros(shape=(NE, np.size(self.theta)))
 
         xgrid      = np.linspace(1.0/nx, 1.0, nx)
-        xmesh      = np.repeat(
-            np.repeat(xgrid.reshape(1, 1, nx), NE, axis=0),
-            NA, axis=1)
-        ndmesh     = np.repeat(
-            np.repeat(gpop.ndens.reshape(1, NA, 1), NE, axis=0),
-            nx, axis=2)
-        assert np.shape(xmesh) == (NE, NA, nx)
-        assert np.shape(ndmesh) == (NE, NA, nx)
 
         # `al` (alpha) is the observed angular distance of the 
         # scattering halo image from the point source center
         i_th = 0
         for al in self.theta:
             thscat = al / xgrid  # nx, goes from small to large angle
-            gpop.calculate_ext(self.lam, theta=thscat, **kwargs)
-            dsig  = gpop.diff.to('cm^2 arcsec^-2').value # NE x NA x nx, [cm^2 arcec^-2]
-            itemp  = dsig * ndmesh / xmesh**2  # NE x NA x nx, [um^-1 arcsec^-2]
+            # only the differential cross-section integrated over grain size is needed
+            gpop.calculate_ext(self.lam, theta=thscat, outputs=outputs, **kwargs)
+            dtau  = gpop.int_diff.to('arcsec^-2').value # NE x nx, [arcsec^-2]
+            itemp = dtau / xgrid**2  # NE x nx, [arcsec^-2]
 
-            intx      = trapz(itemp, xgrid, axis=2)  # NE x NA, [um^-1 arcsec^-2]
-            intensity = trapz(intx, gpop.a.to('micron').value, axis=1)  # NE, [arcsec^-2]
+            intensity = trapz(itemp, xgrid, axis=1)  # NE, [arcsec^-2]
             self.norm_int[:,i_th] = intensity
             i_th += 1
         # attach the units from the above calculation
@@ -77,6 +75,54 @@ class UniformGalHalo(Halo):
 
         self.taux  = gpop.tau_sca
 
+    def calculate_batch(self, gpop, md, weights=None, rho=None, nx=500, outputs='int_diff', **kwargs):
+        """
+        Calculate the X-ray scattering intensity for N sightlines with dust distributed
+        uniformly along the line of sight, which differ only in their dust mass column
+        and mixture of grain populations. The scattering calculation is run only once.
+
+        Parameters
+        ----------
+        gpop : newdust.grainpop.SingleGrainPop or newdust.grainpop.GrainPop
+
+        md : float or numpy.ndarray (N) : total dust mass column for each sightline [g cm^-2]
+
+        weights : numpy.ndarray (NP or N x NP) : fraction of the dust mass in each grain population
+            (only for a GrainPop; Default: None, uses the mass fractions of `gpop`)
+
+        rho : float or numpy.ndarray (N or N x NP) : grain material density [g cm^-3]
+            (Default: None, uses the density of each grain population)
+
+        nx : int
+            Number of x-values to use for calculation (Default: 500)
+
+        outputs : string ('int_diff' or 'all')
+            Results to store on `gpop`, see SingleGrainPop.calculate_ext.
+            The halo only needs 'int_diff'; use 'all' to also keep `gpop.diff` (Default: 'int_diff')
+
+        **kwargs are passed to grainpop extinction calculator
+
+        Returns
+        -------
+        astropy.units.Quantity (N x NE x NTH) : norm_int for each sightline [arcsec^-2],
+        numpy.ndarray (N x NE) : taux for each sightline.
+        The attributes of this Halo are not changed.
+        """
+        assert outputs in ['int_diff', 'all']
+        gplist = _gpoplist(gpop, weights)
+        coeffs = _sightline_coeffs(gplist, md, weights, rho)
+        NS, NE = len(coeffs), np.size(self.lam)
+        norm_int = np.zeros(shape=(NS, NE, np.size(self.theta)))
+
+        xgrid = np.linspace(1.0/nx, 1.0, nx)
+        for i_th, al in enumerate(self.theta):
+            thscat = al / xgrid  # nx, goes from small to large angle
+            gpop.calculate_ext(self.lam, theta=thscat, outputs=outputs, **kwargs)
+            dtau   = _batch_int_diff(gplist, coeffs).to('arcsec^-2').value # N x NE x nx, [arcsec^-2]
+            norm_int[:,:,i_th] = trapz(dtau / xgrid**2, xgrid, axis=2)  # N x NE, [arcsec^-2]
+
+        return norm_int * u.Unit('arcsec^-2'), _batch_tau(gplist, coeffs, 'sca')
+
 class ScreenGalHalo(Halo):
     def __init__(self, *args, **kwargs):
         Halo.__init__(self, *args, **kwargs)
@@ -84,7 +130,7 @@ class ScreenGalHalo(Halo):
         self.md   = None
         self.x    = None
 
-    def calculate(self, gpop, x=0.5, **kwargs):
+    def calculate(self, gpop, x=0.5, outputs='int_diff', **kwargs):
         """
         Calculate the X-ray scattering intensity for dust in an
         infinitesimally thin wall somewhere on the line of sight.
@@ -96,6 +142,10 @@ class ScreenGalHalo(Halo):
         x : float (0.0, 1.0]
             1.0 - (distance to screen / distance to X-ray source)
 
+        outputs : string ('int_diff' or 'all')
+            Results to store on `gpop`, see SingleGrainPop.calculate_ext.
+            The halo only needs 'int_diff'; use 'all' to also keep `gpop.diff` (Default: 'int_diff')
+
         **kwargs are passed to grainpop extinction calculator
         
         Returns
@@ -104,27 +154,63 @@ class ScreenGalHalo(Halo):
         """
         assert isinstance(gpop, SingleGrainPop)
         assert (x > 0.0) & (x <= 1.0)
+        assert outputs in ['int_diff', 'all']
         self.md   = gpop.mdens
         self.x    = x
 
-        NE, NA, NTH = np.size(self.lam), np.size(gpop.a), np.size(self.theta)
-
         thscat = self.theta / x
-        gpop.calculate_ext(self.lam, theta=thscat, **kwargs)
-        dsig   = gpop.diff.to('cm^2 arcsec^-2') # NE x NA x NTH, [cm^2 arcsec^-2]
+        # only the differential cross-section integrated over grain size is needed
+        gpop.calculate_ext(self.lam, theta=thscat, outputs=outputs, **kwargs)
+        dtau   = gpop.int_diff.to('arcsec^-2') # NE x NTH, [arcsec^-2]
 
-        ndmesh = np.repeat(
-            np.repeat(gpop.ndens.reshape(1, NA, 1), NE, axis=0),
-            NTH, axis=2) * u.Unit('cm^-2')
-        # dust column density, size distribution per micron (hidden unit)
-
-        itemp  = np.power(x, -2.0) * dsig * ndmesh  # NE x NA x NTH, [um^-1 arcsec^-2]
-        intensity = trapz(itemp, gpop.a.to('micron').value, axis=1)  # NE x NTH, [arcsec^-2]
-        #print(intensity.unit)
+        intensity = np.power(x, -2.0) * dtau  # NE x NTH, [arcsec^-2]
 
         self.norm_int = intensity
         self.taux     = gpop.tau_sca
 
+    def calculate_batch(self, gpop, md, weights=None, rho=None, x=0.5, outputs='int_diff', **kwargs):
+        """
+        Calculate the X-ray scattering intensity for N sightlines with dust in an
+        infinitesimally thin wall, which differ only in their dust mass column
+        and mixture of grain populations. The scattering calculation is run only once.
+
+        Parameters
+        ----------
+        gpop : newdust.grainpop.SingleGrainPop or newdust.grainpop.GrainPop
+
+        md : float or numpy.ndarray (N) : total dust mass column for each sightline [g cm^-2]
+
+        weights : numpy.ndarray (NP or N x NP) : fraction of the dust mass in each grain population
+            (only for a GrainPop; Default: None, uses the mass fractions of `gpop`)
+
+        rho : float or numpy.ndarray (N or N x NP) : grain material density [g cm^-3]
+            (Default: None, uses the density of each grain population)
+
+        x : float (0.0, 1.0]
+            1.0 - (distance to screen / distance to X-ray source)
+
+        outputs : string ('int_diff' or 'all')
+            Results to store on `gpop`, see SingleGrainPop.calculate_ext.
+            The halo only needs 'int_diff'; use 'all' to also keep `gpop.diff` (Default: 'int_diff')
+
+        **kwargs are passed to grainpop extinction calculator
+
+        Returns
+        -------
+        astropy.units.Quantity (N x NE x NTH) : norm_int for each sightline [arcsec^-2],
+        numpy.ndarray (N x NE) : taux for each sightline.
+        The attributes of this Halo are not changed.
+        """
+        assert (x > 0.0) & (x <= 1.0)
+        assert outputs in ['int_diff', 'all']
+        gplist = _gpoplist(gpop, weights)
+        coeffs = _sightline_coeffs(gplist, md, weights, rho)
+
+        thscat = self.theta / x
+        gpop.calculate_ext(self.lam, theta=thscat, outputs=outputs, **kwargs)
+        dtau   = _batch_int_diff(gplist, coeffs).to('arcsec^-2') # N x NE x NTH, [arcsec^-2]
+        return np.power(x, -2.0) * dtau, _batch_tau(gplist, coeffs, 'sca')
+
     #------- Deal with variable scattering halo images ----#
     def variable_profile(self, time, lc, dist=8.0, tnow=None):
         """
@@ -163,25 +249,19 @@ class ScreenGalHalo(Halo):
 
         assert tnow > tzero, "Invalid value for tnow"
 
-        # cross section data in arcsec, convert to radian
-        theta_rad = self.theta/3600./180.*np.pi
-
-        ne, ntheta = len(self.lam), len(self.theta)
-        inten  = np.zeros(shape=(ne, ntheta))
-        lctm   = (time-tzero)
-
-        for i in range(len(self.lam)):
-            deltat = time_delay(self.theta, self.x, dist) * u.second.to(u.day)
-            t      = tnow - deltat
-            for j in range(ntheta):
-                inten[i,j] += np.interp(t[j], time, lc * self.norm_int[i,j] * self.fabs[i])
-
+        # The delay depends only on the observation angle, so the light curve
+        # is interpolated once and then scaled for every energy
+        deltat = time_delay(self.theta.to('arcsec').value, self.x, dist) * u.second.to(u.day)
+        lc_now = np.interp(tnow - deltat, time, lc)  # NTH
+        norm_int = self.norm_int.to('arcsec^-2').value
+        fabs   = self.fabs.value if isinstance(self.fabs, u.Quantity) else np.asarray(self.fabs)
+        inten  = norm_int * fabs[:,np.newaxis] * lc_now[np.newaxis,:]
         return inten
 
     def fake_variable_image(self, time, lc, arf,
                             exposure=10.e3, tnow=None, dist=8.0,
                             pix_scale=0.5, num_pix=[2400,2400],
-                            lmin=None, lmax=None, save_file=None):
+                            lmin=None, lmax=None, save_file=None, seed=None):
         """
         Make a fake image of a variable scattering halo
         using a telescope ARF as input.
@@ -225,13 +305,17 @@ class ScreenGalHalo(Halo):
         save_file : string (Default:None)
             Filename to use if you want to save the output to a FITS file
 
+        seed : None, int, numpy.random.SeedSequence, or numpy.random.Generator
+            Seed for the Poisson random numbers, so that the same seed gives the same image
+
         Returns
         -------
-        2D numpy.ndarray of shape (nx, ny), representing the image of
+        2D numpy.ndarray of shape (ny, nx), representing the image of
         a dust scattering halo. The halo intensity at different
-        energies are converted into counts using the ARF. Then a
-        Poisson distribution is used to simulate the number of counts
-        in each pixel.
+        energies are converted into counts using the ARF and summed
+        over energy on the theta grid. Then a Poisson distribution is
+        used to simulate the number of counts in each pixel, in one draw
+        (see Halo.fake_image).
 
         If the user supplies a file name string using the save_file
         keyword, a FITS file will be saved.
@@ -245,50 +329,12 @@ class ScreenGalHalo(Halo):
         var_profile = self.variable_profile(time, lc, tnow=time_now, dist=dist)
         # intensity cube (NE x NTH), phot/cm^2/s/arcsec^2
 
-        # Decide which energy indexes to use
-        if lmin is None:
-            imin = 0
-        else:
-            imin = min(np.arange(len(self.lam))[self.lam >= lmin])
-        if lmax is None:
-            iend = len(self.lam)
-        else:
-            iend = max(np.arange(len(self.lam))[self.lam <= lmax])
-
-        # set up image grid
-        xlen, ylen = num_pix
-        xcen, ycen = xlen//2, ylen//2
-        ccdx, ccdy = np.meshgrid(np.arange(xlen), np.arange(ylen))
-        radius = np.sqrt((ccdx - xcen)**2 + (ccdy - ycen)**2)
-
-        # Typical ARF files have columns 'ENERG_LO', 'ENERG_HI', 'SPECRESP'
-        arf_data = fits.open(arf)['SPECRESP'].data
-        arf_x = 0.5*(arf_data['ENERG_LO'] + arf_data['ENERG_HI'])
-        arf_y = arf_data['SPECRESP']
-        arf   = InterpolatedUnivariateSpline(arf_x, arf_y, k=1)
-
-        # Conversion erg -> ct for each energy bin
-        if self.lam_unit in ['Angs', 'Angstrom', 'angs', 'angstrom']:
-            ener = self.lam * u.angstrom
-        elif self.lam_unit in ['kev', 'keV']:
-            ener = self.lam * u.keV
-        else:
-            ener = self.lam * u.Unit(self.lam_unit)
-        int_conv = arf(ener.to(u.keV, equivalencies=u.spectral()))
-        # cm^2 ct/phot
-
-        r_asec = radius * pix_scale
-        result = np.zeros_like(radius)
-        for i in np.arange(imin, iend):
-            h_interp = InterpolatedUnivariateSpline(
-                    self.theta, var_profile[i,:] * int_conv[i], k=1,
-                    ext=1) # ct/s/arcsec^2
-            # corresponding counts at each radial value in the grid
-            pix_flux = h_interp(r_asec) * pix_scale**2 * exposure # cts
-            # use poisson statistics to get a random value
-            pix_random = np.random.poisson(pix_flux)
-            # add it to the final result
-            result += pix_random
+        # Halo counts/arcsec^2 summed over energy, on the theta grid
+        int_conv = _arf_area(arf, self.lam) * exposure  # cm^2 s
+        int_conv = np.where(_lam_mask(self.lam, lmin, lmax), int_conv, 0.0)
+        profile = np.dot(int_conv, var_profile)
+        result  = _fake_radial_image(self.theta.to('arcsec').value, profile,
+                                     pix_scale, num_pix, seed=seed)
 
         if save_file is not None:
             hdu  = fits.PrimaryHDU(result)
@@ -532,6 +578,14 @@ def _is_small_angle(radians):
         return True
 
 
+def _gpoplist(gpop, weights=None):
+    # List of the SingleGrainPop objects that make up `gpop`
+    if isinstance(gpop, GrainPop):
+        return gpop.gpoplist
+    assert isinstance(gpop, SingleGrainPop)
+    assert weights is None
+    return [gpop]
+
 def path_diff(alpha, x):
     """
     | Calculates path difference associated with a particular alpha and x : alpha^2*(1-x)/(2x), units of D (distance to X-ray source)
@@ -561,4 +615,4 @@ def time_delay(alpha, x, dkpc):
     """
     delta_x = path_diff(alpha, x)
     d_cm    = dkpc * 1.e3 * u.pc.to('cm')  # cm
-    return delta_x * (d_cm / c.c).to('s').value # seconds
+    return delta_x * (d_cm * u.cm / c.c).to('s').value # seconds
@@ -1,16 +1,22 @@
 import numpy as np
-from scipy.interpolate import interp1d, InterpolatedUnivariateSpline
-from scipy.integrate import trapz
+from scipy import fft
 from astropy.io import fits
 import astropy.units as u
 
 from .. import helpers
+from .response import read_arf
 
 __all__ = ['Halo']
 
 ALLOWED_FTYPE = ['abs','ext']
 ALLOWED_FUNIT = ['cgs','phot','count','none']
 
+ROW_CHUNK   = 256      # number of image rows evaluated at a time, to limit the memory used
+NBISECT     = 40       # bisection steps for sampling event radii, well below float32 precision
+EVENT_CHUNK = 1000000  # number of events sampled at a time, to limit the memory used
+FHT_DECADE  = 128      # points per decade of the log-radius grid for the Hankel transforms
+FHT_PAD     = 1000.0   # the log-radius grid extends this factor beyond the halo and PSF radii
+
 class Halo(object):
     """
     An X-ray scattering halo.
@@ -68,6 +74,25 @@ class Halo(object):
         if from_file is not None:
             self._read_from_file(from_file)
 
+    @property
+    def norm_int(self):
+        return self._norm_int
+
+    @norm_int.setter
+    def norm_int(self, value):
+        # A new intensity grid makes the enclosed intensity table out of date
+        self._norm_int = value
+        self._cum_int  = None
+
+    @property
+    def theta(self):
+        return self._theta
+
+    @theta.setter
+    def theta(self, value):
+        self._theta   = value
+        self._cum_int = None
+
     def calculate_intensity(self, flux, ftype='abs'):
         """
         Calculate the scattering halo intensity from a flux spectrum.
@@ -167,104 +192,123 @@ class Halo(object):
             result.calculate_intensity(flux, ftype='abs')
         return result
 
-    def ecf(self, th, n, log=False):
+    def enclosed(self, th):
         """
-        Return the fraction of (energy-integrated) scattering halo flux enclosed by theta < th
+        Normalized halo intensity enclosed by theta < th, for every energy,
+        int_0^th norm_int(theta) 2 pi theta dtheta
+
+        The first call builds a table of the enclosed intensity at each theta value (NE x NTH),
+        which is exact for norm_int interpolated linearly between the theta values, constant
+        inside the smallest theta value, and zero outside the largest theta value. Every
+        call after that is a binary search and one segment integral per radius, for all of
+        the energies at once. The table is rebuilt when norm_int or theta are set again,
+        but not if the norm_int array is changed in place.
 
         Inputs
         ------
 
-        th0 : astropy.units.Quantity -or- float:
-            Maximum theta value for calculating enclosed fraction;
-            if no unit specified, ARCSEC is assumed
-        
-        n : int : number of theta values to use for inteprolating
-
-        log : bool : If True, uses a log-spaced theta grid for the integral;
-            If False, uses a linear spaced theta grid.
+        th : astropy.units.Quantity -or- float -or- numpy.ndarray (NR) :
+            Maximum theta values; if no unit specified, ARCSEC is assumed.
+            Values beyond max(theta) are clipped to it, i.e. there is no halo
+            intensity outside of max(theta).
 
         Returns
         -------
-        float : trapz(self.intensity * 2 pi theta_arcsec, theta_arcsec)
+        numpy.ndarray (NE) for a single th value -or- (NE x NR) for an array of th values
 
         SMALL ANGLE SCATTERING IS ASSUMED!
         """
-        # Will break if we attempt to run this without an intensity calculation
-        assert self.intensity is not None
+        th_asec, norm_int, cum_int = self._enclosed_table()
+        thmax = np.clip(_arcsec_values(th), 0.0, th_asec[-1])
+        i  = np.clip(np.searchsorted(th_asec, thmax, side='right') - 1, 0, len(th_asec) - 2)
+        result = cum_int[:,i] + _segment_integral(th_asec, norm_int, i, np.maximum(thmax, th_asec[0]))
+        # Inside the smallest theta value, the intensity is constant
+        disk = norm_int[:,0].reshape((len(norm_int),) + (1,) * np.ndim(thmax)) * np.pi * thmax**2
+        return np.where(thmax < th_asec[0], disk, result)
+
+    def _enclosed_table(self):
+        # Theta [arcsec], norm_int [arcsec^-2], and the enclosed intensity table, built once
+        assert self.norm_int is not None
+        if self._cum_int is None:
+            th_asec  = self.theta.to('arcsec').value
+            norm_int = _arcsec2_values(self.norm_int)
+            self._cum_int = (th_asec, norm_int, _cumulative_integral(th_asec, norm_int))
+        return self._cum_int
 
-        if isinstance(th, u.Quantity):
-            thmax = th.to('arcsec').value
-        else:
-            thmax = th * u.arcsec
-        
-        # Halo theta values, which will serve as grid
-        th_asec = self.theta.to('arcsec').value
+    def ecf(self, th, n=None, log=None):
+        """
+        Return the fraction of (energy-integrated) scattering halo flux enclosed by theta < th,
+        from a lookup of the enclosed intensity table (see Halo.enclosed)
 
-        # Make sure that the value of interest is within the calculated grid
-        assert thmax > np.min(th_asec) & thmax < np.max(th_sec)
+        Inputs
+        ------
 
-        # Get a new grid of intensity values over which to integrate
-        if log:
-            th_grid = np.logspace(np.log10(np.min(th_asec)), 
-                                  np.log10(np.max(th_asec)), n)
-        else:
-            th_grid  = np.linspace(np.min(th_asec), np.max(th_asec), n)
+        th : astropy.units.Quantity -or- float -or- numpy.ndarray (NR) :
+            Maximum theta values for calculating enclosed fraction;
+            if no unit specified, ARCSEC is assumed
         
-        I_grid = np.interp(th_grid, th_asec, self.intensity)
-        fh_tot = np.sum(self.fhalo) # total flux in the halo
-        enclosed = trapz(I_grid * 2.0 * np.pi * th_grid, th_grid)
-        return enclosed / fh_tot
+        n, log : no longer used, the integral over the theta grid is exact
+
+        Returns
+        -------
+        float -or- numpy.ndarray (NR) : 
+            sum(fabs x int_0^th norm_int 2 pi theta dtheta) / sum(fabs x taux)
+
+        SMALL ANGLE SCATTERING IS ASSUMED!
+        """
+        # Will break if we attempt to run this without an intensity calculation
+        assert self.fabs is not None
+        fabs = np.atleast_1d(_values(self.fabs))
+        enclosed = np.tensordot(fabs, self.enclosed(th), axes=(0, 0))
+        return enclosed / np.sum(fabs * self.taux)
     
-    def frac_halo(self, th, n, log=False):
+    def frac_halo(self, th, n=None, log=None):
         """
-        Calculate fraction of halo, as a function of energy, enclosed by theta < th
+        Calculate fraction of halo, as a function of energy, enclosed by theta < th,
+        from a lookup of the enclosed intensity table (see Halo.enclosed)
 
         Inputs
         ------
 
-        th0 : astropy.units.Quantity -or- float:
-            Maximum theta value for calculating enclosed fraction;
+        th : astropy.units.Quantity -or- float -or- numpy.ndarray (NR) :
+            Maximum theta values for calculating enclosed fraction;
             if no unit specified, ARCSEC is assumed
         
-        n : int : number of theta values to use for inteprolating
-
-        log : bool : If True, uses a log-spaced theta grid for the integral;
-            If False, uses a linear spaced theta grid.
+        n, log : no longer used, the integral over the theta grid is exact
 
         Returns
         -------
-        float : trapz(self.intensity * 2 pi theta_arcsec, theta_arcsec)
+        numpy.ndarray (NE) -or- (NE x NR) : int_0^th norm_int 2 pi theta dtheta / taux
 
         SMALL ANGLE SCATTERING IS ASSUMED!
         """
-        # Will break if we attempt to run this without an intensity calculation
-        assert self.norm_intensity is not None
+        enclosed = self.enclosed(th)
+        taux = np.atleast_1d(self.taux)
+        return enclosed / taux.reshape((len(taux),) + (1,) * (np.ndim(enclosed) - 1))
 
-        if isinstance(th, u.Quantity):
-            thmax = th.to('arcsec').value
-        else:
-            thmax = th * u.arcsec
-        
-        # Halo theta values, which will serve as grid
-        th_asec = self.theta.to('arcsec').value
+    def annulus(self, th_in, th_out):
+        """
+        Scattering halo spectrum in the annulus th_in < theta < th_out,
+        from lookups of the enclosed intensity table (see Halo.enclosed)
+
+        Inputs
+        ------
 
-        # Make sure that the value of interest is within the calculated grid
-        assert thmax > np.min(th_asec) & thmax < np.max(th_sec)
+        th_in, th_out : astropy.units.Quantity -or- float -or- numpy.ndarray (NR) :
+            Inner and outer radii of the annuli; if no unit specified, ARCSEC is assumed
 
-        # Get a new grid of intensity values over which to integrate
-        if log:
-            th_grid = np.logspace(np.log10(np.min(th_asec)), 
-                                  np.log10(np.max(th_asec)), n)
-        else:
-            th_grid  = np.linspace(np.min(th_asec), np.max(th_asec), n)
-        
-        result = []
-        for i in range(len(self.lam)):
-            I_grid = np.interp(th_grid, th_asec, self.norm_int[i,:])
-            enclosed = trapz(I_grid * 2.0 * np.pi * th_grid, th_grid)
-            result.append[enclosed]
-        return np.array(result).flatten() # unitless, size NE
+        Returns
+        -------
+        numpy.ndarray or astropy.units.Quantity (NE) -or- (NE x NR) [fabs.unit] :
+            fabs x int_th_in^th_out norm_int 2 pi theta dtheta
 
+        SMALL ANGLE SCATTERING IS ASSUMED!
+        """
+        assert self.fabs is not None
+        th_in, th_out = np.broadcast_arrays(_arcsec_values(th_in), _arcsec_values(th_out))
+        frac = self.enclosed(th_out) - self.enclosed(th_in)
+        fabs = np.atleast_1d(self.fabs)
+        return fabs.reshape((len(fabs),) + (1,) * (np.ndim(frac) - 1)) * frac
 
     def write(self, filename, overwrite=True):
         """
@@ -316,9 +360,67 @@ class Halo(object):
         self.description = filename
 
     ##------ Make a fake image with a telescope arf
+    def convolve_psf(self, psf_theta, psf):
+        """
+        Convolve the scattering halo with an azimuthally symmetric telescope PSF.
+
+        The radial profiles of all energies are convolved at once, with fast Hankel
+        transforms (scipy.fft.fht) on a log-spaced radius grid: the 2D Fourier transform
+        of a radial profile is its zero-order Hankel transform, so the convolution is a
+        product of transforms. The grid extends FHT_PAD times beyond the halo and PSF radii,
+        so the periodic edges of the transforms stay away from the profiles. As in the rest
+        of Halo, profiles are interpolated linearly between the theta values, are constant
+        inside the smallest theta value, and are zero outside the largest theta value,
+        so the convolved halo is dimmer within about a PSF width of the largest theta value.
+
+        Inputs
+        ------
+        psf_theta : astropy.units.Quantity -or- numpy.ndarray (NP) :
+            Radial grid of the PSF; if no unit specified, ARCSEC is assumed
+
+        psf : numpy.ndarray (NP) -or- (NE x NP) : radial PSF profile, for all energies or
+            for each energy. It is normalized to a unit integral, int psf 2 pi theta dtheta = 1,
+            so the halo flux is conserved.
+
+        Returns
+        -------
+        Halo with the same lam, theta, and taux values, and the convolved norm_int [arcsec^-2]
+
+        SMALL ANGLE SCATTERING IS ASSUMED!
+        """
+        assert self.norm_int is not None
+        th_asec  = self.theta.to('arcsec').value
+        norm_int = _arcsec2_values(self.norm_int)
+        NE = np.shape(norm_int)[0]
+        psf_th   = _arcsec_values(psf_theta)
+        psf      = np.atleast_2d(_values(psf))
+        assert np.shape(psf)[1] == len(psf_th) and np.shape(psf)[0] in [1, NE]
+        assert th_asec[0] > 0.0 and psf_th[0] > 0.0
+
+        # Log-spaced radius grid covering both profiles
+        rmin = min(th_asec[0], psf_th[0]) / FHT_PAD
+        rmax = max(th_asec[-1], psf_th[-1]) * FHT_PAD
+        n    = int(np.ceil(np.log10(rmax / rmin) * FHT_DECADE))
+        dln  = np.log(rmax / rmin) / (n - 1)
+        r    = rmin * np.exp(np.arange(n) * dln)
+
+        halo_r = _interp_profile(r, th_asec, norm_int)
+        psf_r  = _interp_profile(r, psf_th, psf)
+        psf_r  = psf_r / (np.sum(psf_r * 2.0 * np.pi * r**2, axis=1) * dln)[:,np.newaxis]
+        conv   = _hankel_convolve(r, dln, halo_r, psf_r)  # NE x n
+
+        result = Halo(self.lam, self.theta)
+        result.description = self.description
+        # The transforms ring at a small fraction of the peak, which must not give negative intensities
+        result.norm_int = np.clip(_interp_profile(th_asec, r, conv), 0.0, None) * u.Unit('arcsec^-2')
+        result.taux     = self.taux
+        if self.fabs is not None:
+            result.calculate_intensity(self.fabs, ftype='abs')
+        return result
+
     def fake_image(self, arf, src_flux, exposure,
                    pix_scale=0.5, num_pix=[2400,2400],
-                   lmin=None, lmax=None, save_file=None, **kwargs):
+                   lmin=None, lmax=None, save_file=None, seed=None, **kwargs):
         """Make a fake image file using a telescope ARF as input.
 
         Parameters
@@ -351,68 +453,32 @@ class Halo(object):
         save_file : string (Default:None)
             Filename to use if you want to save the output to a .fits
 
+        seed : None, int, numpy.random.SeedSequence, or numpy.random.Generator
+            Seed for the Poisson random numbers, so that the same seed gives the same image
+
         Returns
         -------
-        2D numpy.ndarray of shape (nx, ny), representing the image of
+        2D numpy.ndarray of shape (ny, nx), representing the image of
         a dust scattering halo. The halo intensity at different
-        energies are converted into counts using the ARF. Then a
-        Poisson distribution is used to simulate the number of counts
-        in each pixel.
+        energies are converted into counts using the ARF and summed
+        over energy on the theta grid. Then a Poisson distribution is
+        used to simulate the number of counts in each pixel, in one draw
+        (a sum of Poisson values is a Poisson value). Pixels outside of
+        the largest theta value are zero.
 
         If the user supplies a file name string using the save_file
         keyword, a FITS file will be saved.
         """
         assert len(src_flux) == len(self.lam)
 
-        xlen, ylen = num_pix
-        xcen, ycen = xlen//2, ylen//2
-        ccdx, ccdy = np.meshgrid(np.arange(xlen), np.arange(ylen))
-        radius = np.sqrt((ccdx - xcen)**2 + (ccdy - ycen)**2)
-
-        # Typical ARF files have columns 'ENERG_LO', 'ENERG_HI', 'SPECRESP'
-        arf_data = fits.open(arf)['SPECRESP'].data
-        arf_x = 0.5*(arf_data['ENERG_LO'] + arf_data['ENERG_HI'])
-        arf_y = arf_data['SPECRESP']
-        arf   = InterpolatedUnivariateSpline(arf_x, arf_y, k=1)
-
         # Source counts to use for each energy bin
-        if self.lam_unit == 'angs':
-            ltemp      = self.lam * u.angstrom
-            ltemp_kev  = ltemp.to(u.keV, equivalencies=u.spectral()).value
-            arf_temp   = arf(ltemp_kev)[::-1]
-            src_counts = src_flux * arf_temp * exposure
-        else:
-            src_counts = src_flux * arf(self.lam) * exposure
+        src_counts = _values(src_flux) * _arf_area(arf, self.lam) * exposure
+        src_counts = np.where(_lam_mask(self.lam, lmin, lmax), src_counts, 0.0)
 
-        # Decide which energy indexes to use
-        if lmin is None:
-            imin = 0
-        else:
-            imin = min(np.arange(len(self.lam))[self.lam >= lmin])
-        if lmax is None:
-            iend = len(self.lam)
-        else:
-            iend = max(np.arange(len(self.lam))[self.lam <= lmax])
-
-        #iend = imax
-        #if imax < 0:
-        #    iend = np.arange(len(self.lam)+1)[imax]
-
-        # Add up randomized image for each energy index value
-        r_asec = radius * pix_scale
-        result = np.zeros_like(radius)
-        for i in np.arange(imin, iend):
-            # interp object for halo grid (arcsec, counts/arcsec^2)
-            h_interp = InterpolatedUnivariateSpline(
-                self.theta, self.norm_int[i,:] * src_counts[i], k=1) # counts/arcsec^2
-            # Get the corresponding counts at each radial value in the grid
-            pix_counts = h_interp(r_asec) * pix_scale**2  # counts per pixel
-            # Some of the interpolated values are below zero. This is not okay. Set those to zero.
-            pix_counts[pix_counts < 0.0] = 0.0
-            # Use poisson statistics to get a random value
-            pix_random = np.random.poisson(pix_counts)
-            # add it to the final result
-            result += pix_random
+        # Halo counts/arcsec^2 summed over energy, on the theta grid
+        profile = np.dot(src_counts, _arcsec2_values(self.norm_int))
+        result  = _fake_radial_image(self.theta.to('arcsec').value, profile,
+                                     pix_scale, num_pix, seed=seed)
 
         if save_file is not None:
             hdu  = fits.PrimaryHDU(result)
@@ -420,3 +486,241 @@ class Halo(object):
             hdul.writeto(save_file, overwrite=True)
 
         return result
+
+    def fake_events(self, arf, src_flux, exposure, pix_scale=0.5,
+                    lmin=None, lmax=None, seed=None, save_file=None):
+        """Simulate a list of scattering halo photon events using a telescope ARF as input.
+
+        Instead of an image with Poisson noise in every pixel (see fake_image), the number
+        of events is drawn once, and each event is given an energy and a radius by inverse-CDF
+        sampling of norm_int x src_flux x ARF, so the cost is proportional to the number
+        of events. The radial profile is interpolated linearly between the theta values and
+        is constant inside the smallest theta value, as in Halo.enclosed, and the azimuth is uniform.
+
+        Parameters
+        ----------
+        arf : string
+            Filename of telescope ARF
+
+        src_flux : numpy.ndarray [phot/cm^2/s]
+            Describes the absorbed (without X-ray scattering) flux
+            model for the central X-ray point source. Must correspond
+            to the values in Halo.lam
+
+        exposure : float [seconds]
+            Exposure time to use
+
+        pix_scale : float [arcsec]
+            Size of a pixel, for the X and Y event coordinates
+
+        lmin : float
+            Minimum halo.lam value
+            (Default:None uses entire range)
+
+        lmax : float
+            Maximum halo.lam value
+            (Default:None uses entire range)
+
+        seed : None, int, or numpy.random.SeedSequence
+            Seed for the random numbers. Independent streams are spawned from it for the
+            number of events, energies, radii, and azimuths, so the same seed always gives
+            the same events. For simulations that run in parallel, give each one a child of
+            a single numpy.random.SeedSequence (SeedSequence.spawn).
+
+        save_file : string (Default:None)
+            Filename to use if you want to save the event list to a .fits
+
+        Returns
+        -------
+        astropy.io.fits.FITS_rec with one row per event and the columns
+        X, Y [pixel] (relative to the point source) and ENERGY [keV] (Halo.lam value).
+
+        If the user supplies a file name string using the save_file
+        keyword, a FITS file with an EVENTS table will be saved.
+        """
+        assert len(src_flux) == len(self.lam)
+        th_asec, norm_int, cum_int = self._enclosed_table()
+        NE, NTH = np.shape(norm_int)
+
+        # Expected halo counts in each energy bin, within the theta grid
+        src_counts = _values(src_flux) * _arf_area(arf, self.lam) * exposure
+        expected   = np.where(_lam_mask(self.lam, lmin, lmax), src_counts * cum_int[:,-1], 0.0)
+        assert np.all(expected >= 0.0), "Halo intensity must not be negative"
+
+        if not isinstance(seed, np.random.SeedSequence):
+            seed = np.random.SeedSequence(seed)
+        rng_num, rng_lam, rng_th, rng_phi = [np.random.default_rng(s) for s in seed.spawn(4)]
+
+        # Energies, from the cumulative distribution of counts over the energy bins
+        num = rng_num.poisson(np.sum(expected))
+        cdf = np.cumsum(expected)
+        x, y, energy = np.zeros(num), np.zeros(num), np.zeros(num)
+        for start in range(0, num, EVENT_CHUNK):
+            n  = min(EVENT_CHUNK, num - start)
+            ie = np.searchsorted(cdf, rng_lam.uniform(0.0, cdf[-1], n), side='right')
+            ie = np.clip(ie, 0, NE - 1)
+            radius = _sample_radius(th_asec, norm_int, cum_int, ie, rng_th.uniform(0.0, 1.0, n))
+            phi    = rng_phi.uniform(0.0, 2.0 * np.pi, n)
+            x[start:start+n] = radius * np.cos(phi) / pix_scale
+            y[start:start+n] = radius * np.sin(phi) / pix_scale
+            energy[start:start+n] = self.lam[ie].to('keV', equivalencies=u.spectral()).value
+
+        hdu = fits.BinTableHDU.from_columns(
+              [fits.Column(name='X', array=x, format='E', unit='pixel'),
+               fits.Column(name='Y', array=y, format='E', unit='pixel'),
+               fits.Column(name='ENERGY', array=energy, format='E', unit='keV')])
+        hdu.header['EXTNAME']  = 'EVENTS'
+        hdu.header['EXPOSURE'] = (exposure, 'Exposure time [s]')
+        hdu.header['PIXSCALE'] = (pix_scale, 'Size of a pixel [arcsec]')
+
+        if save_file is not None:
+            hdul = fits.HDUList([fits.PrimaryHDU(), hdu])
+            hdul.writeto(save_file, overwrite=True)
+
+        return hdu.data
+
+def _arf_area(arf, lam):
+    """
+    Effective area [cm^2] from a telescope ARF file, interpolated linearly onto
+    the wavelength or energy values `lam` (zero outside of the ARF)
+    """
+    arf_data = read_arf(arf)
+    arf_x = 0.5*(arf_data['energ_lo'] + arf_data['energ_hi'])
+    lam_kev = lam.to('keV', equivalencies=u.spectral()).value
+    return np.interp(lam_kev, arf_x, arf_data['specresp'], left=0.0, right=0.0)
+
+def _lam_mask(lam, lmin=None, lmax=None):
+    # Wavelength or energy values with lmin <= lam <= lmax, in the units of lam
+    result = np.ones(np.size(lam), dtype=bool)
+    if lmin is not None:
+        result &= (np.atleast_1d(lam.value) >= lmin)
+    if lmax is not None:
+        result &= (np.atleast_1d(lam.value) <= lmax)
+    return result
+
+def _fake_radial_image(th_asec, profile, pix_scale, num_pix, seed=None, row_chunk=ROW_CHUNK):
+    """
+    Poisson image of a radial profile [counts arcsec^-2] on the theta grid [arcsec],
+    centered on pixel (nx//2, ny//2). The profile is interpolated linearly, is constant
+    inside the smallest theta value, and is zero outside the largest theta value.
+    Only the pixels within the largest theta value are evaluated, `row_chunk` rows at a time.
+    """
+    xlen, ylen = num_pix
+    xcen, ycen = xlen//2, ylen//2
+    rng    = np.random.default_rng(seed)
+    result = np.zeros((ylen, xlen))
+
+    rmax = th_asec[-1] / pix_scale  # pixels
+    ylo  = max(0, int(np.ceil(ycen - rmax)))
+    yhi  = min(ylen, int(np.floor(ycen + rmax)) + 1)
+    for start in range(ylo, yhi, row_chunk):
+        dy   = np.arange(start, min(start + row_chunk, yhi)) - ycen
+        half = np.sqrt(max(rmax**2 - np.min(np.abs(dy))**2, 0.0))
+        xlo  = max(0, int(np.ceil(xcen - half)))
+        xhi  = min(xlen, int(np.floor(xcen + half)) + 1)
+        dx   = np.arange(xlo, xhi) - xcen
+        r_asec = np.sqrt(dy[:,np.newaxis]**2 + dx[np.newaxis,:]**2) * pix_scale
+        pix_counts = np.interp(r_asec, th_asec, profile, right=0.0) * pix_scale**2
+        result[start:start+len(dy), xlo:xhi] = rng.poisson(np.clip(pix_counts, 0.0, None))
+    return result
+
+def _values(x):
+    # Values of an array or astropy.units.Quantity
+    return x.value if isinstance(x, u.Quantity) else np.asarray(x)
+
+def _arcsec_values(th):
+    # Angles in arcsec; ARCSEC is assumed if no unit specified
+    if isinstance(th, u.Quantity):
+        return th.to('arcsec').value
+    return np.asarray(th, dtype=float)
+
+def _arcsec2_values(norm_int):
+    # Intensity in arcsec^-2; arcsec^-2 is assumed if no unit specified
+    if isinstance(norm_int, u.Quantity):
+        return norm_int.to('arcsec^-2').value
+    return np.asarray(norm_int, dtype=float)
+
+def _segment_integral(th, norm_int, i, thmax):
+    """
+    Integral of norm_int 2 pi theta from th[i] to thmax, for norm_int (NE x NTH) interpolated
+    linearly between th[i] and th[i+1]. `i` and `thmax` have the same shape, and the result
+    has the shape of norm_int[:,i].
+    """
+    return _linear_integral(th[i], th[i+1], norm_int[:,i], norm_int[:,i+1], thmax)
+
+def _linear_integral(t0, t1, i0, i1, thmax):
+    # Integral of (i0 + slope (theta - t0)) 2 pi theta from t0 to thmax, slope = (i1 - i0) / (t1 - t0)
+    slope = (i1 - i0) / (t1 - t0)
+    dt2 = thmax**2 - t0**2
+    return 2.0 * np.pi * (i0 * dt2 / 2.0 + slope * ((thmax**3 - t0**3) / 3.0 - t0 * dt2 / 2.0))
+
+def _sample_radius(th, norm_int, cum_int, ie, uniform):
+    """
+    Inverse-CDF sampling of radii [arcsec] from the enclosed intensity table (NE x NTH)
+    of energy bins `ie`, for uniform random numbers between 0 and 1
+    """
+    NE, NTH = np.shape(norm_int)
+    target  = uniform * cum_int[ie,-1]
+    # Inside th[0] the intensity is constant, so the enclosed intensity goes as radius^2
+    cum0    = cum_int[ie,0]
+    disk    = target < cum0
+    r_disk  = th[0] * np.sqrt(np.where(disk, target, 0.0) / np.where(disk, cum0, 1.0))
+
+    # Find the theta interval with a binary search of each energy bin's table
+    iseg   = np.zeros(len(ie), dtype=int)
+    order  = np.argsort(ie, kind='stable')
+    bounds = np.searchsorted(ie[order], np.arange(NE + 1))
+    for i in np.arange(NE)[np.diff(bounds) > 0]:
+        ii = order[bounds[i]:bounds[i+1]]
+        iseg[ii] = np.searchsorted(cum_int[i], target[ii], side='right') - 1
+    iseg = np.clip(iseg, 0, NTH - 2)
+
+    # Then the radius within the interval, by bisection of the exact segment integral
+    rest   = target - cum_int[ie,iseg]
+    t0, t1 = th[iseg], th[iseg+1]
+    i0, i1 = norm_int[ie,iseg], norm_int[ie,iseg+1]
+    lo, hi = t0.copy(), t1.copy()
+    for k in range(NBISECT):
+        mid   = 0.5 * (lo + hi)
+        below = _linear_integral(t0, t1, i0, i1, mid) < rest
+        lo = np.where(below, mid, lo)
+        hi = np.where(below, hi, mid)
+    return np.where(disk, r_disk, 0.5 * (lo + hi))
+
+def _interp_profile(x, xp, fp):
+    """
+    Linear interpolation of radial profiles fp (N x NP) on the ascending grid xp (NP)
+    onto x, constant inside xp[0] and zero outside xp[-1]. Returns N x len(x).
+    """
+    i = np.clip(np.searchsorted(xp, x, side='right') - 1, 0, len(xp) - 2)
+    t = np.clip((x - xp[i]) / (xp[i+1] - xp[i]), 0.0, 1.0)
+    result = fp[:,i] * (1.0 - t) + fp[:,i+1] * t
+    result[:,x > xp[-1]] = 0.0
+    return result
+
+def _hankel_convolve(r, dln, f, g):
+    """
+    2D convolution of azimuthally symmetric profiles f and g (N x n, or 1 x n)
+    on the log-spaced radius grid r (n), with spacing dln in log(r):
+
+        h(r) = 2 pi int F(k) G(k) J_0(kr) k dk,  F(k) = int f(r) J_0(kr) r dr
+    """
+    # scipy.fft.fht uses an integrand of k dr, and k_j r_(n-1-j) = exp(offset)
+    offset = fft.fhtoffset(dln, mu=0.0)
+    k  = np.exp(offset) / r[::-1]
+    fk = fft.fht(f * r, dln, mu=0.0, offset=offset) / k
+    gk = fft.fht(g * r, dln, mu=0.0, offset=offset) / k
+    return 2.0 * np.pi * fft.ifht(fk * gk * k, dln, mu=0.0, offset=offset) / r
+
+def _cumulative_integral(th, norm_int):
+    """
+    Exact integral of norm_int 2 pi theta from 0 to each value of th, for norm_int (NE x NTH)
+    interpolated linearly between the values of th (NTH) and constant inside th[0]
+    """
+    t0, t1 = th[:-1], th[1:]
+    i0, i1 = norm_int[:,:-1], norm_int[:,1:]
+    segments = 2.0 * np.pi * (t1 - t0) / 6.0 * (i0 * (2.0 * t0 + t1) + i1 * (t0 + 2.0 * t1))
+    result = np.zeros_like(norm_int, dtype=float)
+    result[:,0]  = norm_int[:,0] * np.pi * th[0]**2
+    result[:,1:] = result[:,:1] + np.cumsum(segments, axis=1)
+    return result
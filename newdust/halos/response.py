@@ -0,0 +1,224 @@
+import os
+import numpy as np
+from scipy import sparse
+from astropy.io import fits
+import astropy.units as u
+
+__all__ = ['Response', 'read_arf', 'read_rmf', 'clear_response_cache']
+
+# Process-wide cache of instrument response files, keyed by absolute file path
+_RESPONSE_CACHE = dict()
+
+RMF_EXTNAMES = ['MATRIX', 'SPECRESP MATRIX']
+
+class Response(object):
+    """
+    A telescope response, for folding scattering halo models into predicted counts.
+
+    The ARF and RMF files are read once per process (see read_arf and read_rmf), and the
+    redistribution matrix is stored as a sparse matrix, so folding many spectra at once
+    is a pair of sparse matrix products.
+
+    Attributes
+    ----------
+
+    energ_lo, energ_hi : numpy.ndarray (NE) [keV]
+        Energy bins of the response (from the RMF if there is one, otherwise from the ARF)
+
+    specresp : numpy.ndarray (NE) [cm^2]
+        Effective area on the energy bins
+
+    matrix : scipy.sparse.csr_matrix (NE x NCHAN)
+        Probability that a photon in each energy bin is detected in each channel;
+        the identity matrix (one channel per energy bin) if there is no RMF
+
+    e_min, e_max : numpy.ndarray (NCHAN) [keV]
+        Nominal energy bounds of the channels
+    """
+    def __init__(self, arf, rmf=None):
+        arf_data = read_arf(arf)
+        if rmf is None:
+            self.energ_lo = arf_data['energ_lo']
+            self.energ_hi = arf_data['energ_hi']
+            self.specresp = arf_data['specresp']
+            self.matrix   = sparse.identity(len(self.energ_lo), format='csr')
+            self.e_min, self.e_max = self.energ_lo, self.energ_hi
+        else:
+            rmf_data = read_rmf(rmf)
+            self.energ_lo = rmf_data['energ_lo']
+            self.energ_hi = rmf_data['energ_hi']
+            self.matrix   = rmf_data['matrix']
+            self.e_min    = rmf_data['e_min']
+            self.e_max    = rmf_data['e_max']
+            # The ARF is usually on the same energy bins as the RMF; if not, interpolate it
+            arf_mid = 0.5 * (arf_data['energ_lo'] + arf_data['energ_hi'])
+            if len(arf_mid) == len(self.energ_lo) and \
+                np.allclose(arf_data['energ_lo'], self.energ_lo, rtol=1.e-6, atol=0.0):
+                self.specresp = arf_data['specresp']
+            else:
+                print("WARNING: ARF and RMF energy grids differ, interpolating the ARF onto the RMF grid")
+                self.specresp = np.interp(self.energy.value, arf_mid, arf_data['specresp'], left=0.0, right=0.0)
+
+    @property
+    def energy(self):
+        """
+        Middle of the response energy bins, e.g. for the lam values of a Halo
+        """
+        return 0.5 * (self.energ_lo + self.energ_hi) * u.keV
+
+    @property
+    def nchan(self):
+        return np.shape(self.matrix)[1]
+
+    def fold(self, spectrum, lam, exposure=1.0):
+        """
+        Fold photon spectra through the response.
+
+        Inputs
+        ------
+
+        spectrum : numpy.ndarray or astropy.units.Quantity (NE_lam) -or- (NE_lam x N) [phot/cm^2/s]
+            Bin-integrated photon flux at each `lam` value, for one or N spectra
+
+        lam : astropy.units.Quantity -or- numpy.ndarray (NE_lam)
+            Wavelength or energy values of the spectrum; if no units specified, defaults to keV.
+            The flux at each `lam` value is placed in the response energy bin that contains it,
+            so `lam` should sample the response energy bins (e.g. Response.energy);
+            values outside of the response are ignored.
+
+        exposure : float [seconds]
+            Exposure time
+
+        Returns
+        -------
+        numpy.ndarray (NCHAN) -or- (N x NCHAN) : predicted counts in each channel
+        """
+        spec = spectrum.value if isinstance(spectrum, u.Quantity) else np.asarray(spectrum, dtype=float)
+        if not isinstance(lam, u.Quantity):
+            lam = lam * u.keV
+        lam_kev = np.atleast_1d(lam.to('keV', equivalencies=u.spectral()).value)
+        assert np.shape(spec)[0] == len(lam_kev)
+
+        rate = _bin_matrix(lam_kev, self.energ_lo, self.energ_hi).dot(spec)  # NE [x N], phot/cm^2/s
+        rate = rate * self.specresp.reshape((len(self.specresp),) + (1,) * (np.ndim(rate) - 1))
+        return self.matrix.T.dot(rate).T * exposure
+
+    def fold_annuli(self, halo, th_in, th_out, exposure=1.0):
+        """
+        Predicted counts of a scattering halo in each channel, for many annuli at once.
+
+        Inputs
+        ------
+
+        halo : newdust.halos.Halo : with fabs [phot/cm^2/s] set by Halo.calculate_intensity
+
+        th_in, th_out : astropy.units.Quantity -or- float -or- numpy.ndarray (NR)
+            Inner and outer radii of the annuli; if no unit specified, ARCSEC is assumed
+
+        exposure : float [seconds]
+            Exposure time
+
+        Returns
+        -------
+        numpy.ndarray (NCHAN) -or- (NR x NCHAN) : predicted counts in each channel, for each annulus
+        """
+        return self.fold(halo.annulus(th_in, th_out), halo.lam, exposure=exposure)
+
+def read_arf(filename):
+    """
+    Read a telescope ARF file (SPECRESP extension), caching the result for the
+    lifetime of the process, until the file changes.
+
+    Returns
+    -------
+    dict : 'energ_lo', 'energ_hi' [keV], 'specresp' [cm^2] -> read-only numpy.ndarray
+    """
+    return _cached_read(filename, 'arf', _read_arf)
+
+def read_rmf(filename):
+    """
+    Read a telescope RMF file (MATRIX or SPECRESP MATRIX, and EBOUNDS extensions),
+    caching the result for the lifetime of the process, until the file changes.
+
+    Returns
+    -------
+    dict : 'energ_lo', 'energ_hi' [keV], 'e_min', 'e_max' [keV] -> read-only numpy.ndarray,
+        'matrix' -> scipy.sparse.csr_matrix (NE x NCHAN)
+    """
+    return _cached_read(filename, 'rmf', _read_rmf)
+
+def clear_response_cache():
+    """
+    Empty the in-memory cache of ARF and RMF files.
+    """
+    _RESPONSE_CACHE.clear()
+
+##----- Helper material
+
+def _cached_read(filename, ftype, reader):
+    key  = (os.path.abspath(filename), ftype)
+    stat = os.stat(key[0])
+    cached = _RESPONSE_CACHE.get(key)
+    if cached is not None and cached['stamp'] == (stat.st_size, stat.st_mtime_ns):
+        return cached['data']
+    data = reader(key[0])
+    # Cached arrays are shared between all responses, so protect them
+    for val in data.values():
+        if isinstance(val, np.ndarray):
+            val.setflags(write=False)
+    _RESPONSE_CACHE[key] = {'stamp':(stat.st_size, stat.st_mtime_ns), 'data':data}
+    return data
+
+def _read_arf(filename):
+    # Typical ARF files have columns 'ENERG_LO', 'ENERG_HI', 'SPECRESP'
+    with fits.open(filename) as hdul:
+        arf_data = hdul['SPECRESP'].data
+        result = dict()
+        result['energ_lo'] = np.array(arf_data['ENERG_LO'], dtype=float)
+        result['energ_hi'] = np.array(arf_data['ENERG_HI'], dtype=float)
+        result['specresp'] = np.array(arf_data['SPECRESP'], dtype=float)
+    return result
+
+def _read_rmf(filename):
+    with fits.open(filename) as hdul:
+        extnames = [hdu.name for hdu in hdul]
+        matrix_ext = [name for name in RMF_EXTNAMES if name in extnames]
+        assert len(matrix_ext) > 0, "No MATRIX extension in {}".format(filename)
+        hdu  = hdul[matrix_ext[0]]
+        data = hdu.data
+        ebounds = hdul['EBOUNDS'].data
+        channel = np.array(ebounds['CHANNEL'], dtype=int)
+        first   = np.min(channel)  # channel numbering usually starts at 0 or 1
+        nchan   = len(channel)
+
+        rows, cols, vals = [], [], []
+        for i in range(len(data)):
+            f_chan = np.atleast_1d(data['F_CHAN'][i]).astype(int)
+            n_chan = np.atleast_1d(data['N_CHAN'][i]).astype(int)
+            ngrp   = int(data['N_GRP'][i])
+            resp   = np.atleast_1d(data['MATRIX'][i]).astype(float)
+            chans  = [np.arange(f, f + n) for f, n in zip(f_chan[:ngrp], n_chan[:ngrp])]
+            chans  = np.concatenate(chans) - first if ngrp > 0 else np.array([], dtype=int)
+            rows.append(np.full(len(chans), i))
+            cols.append(chans)
+            vals.append(resp[:len(chans)])
+
+        result = dict()
+        result['energ_lo'] = np.array(data['ENERG_LO'], dtype=float)
+        result['energ_hi'] = np.array(data['ENERG_HI'], dtype=float)
+        result['e_min']    = np.array(ebounds['E_MIN'], dtype=float)
+        result['e_max']    = np.array(ebounds['E_MAX'], dtype=float)
+        result['matrix']   = sparse.csr_matrix(
+            (np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+            shape=(len(data), nchan))
+    return result
+
+def _bin_matrix(lam_kev, energ_lo, energ_hi):
+    """
+    Sparse matrix (NE x NE_lam) that places each energy value in the bin
+    energ_lo <= E < energ_hi that contains it (bins are ascending and contiguous)
+    """
+    i = np.searchsorted(energ_lo, lam_kev, side='right') - 1
+    inside = (i >= 0) & (lam_kev < energ_hi[np.clip(i, 0, len(energ_hi) - 1)])
+    return sparse.csr_matrix((np.ones(np.sum(inside)), (i[inside], np.arange(len(lam_kev))[inside])),
+                             shape=(len(energ_lo), len(lam_kev)))
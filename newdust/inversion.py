@@ -0,0 +1,130 @@
+import numpy as np
+import astropy.units as u
+from scipy import linalg
+
+from .graindist import sizedist
+
+__all__ = ['invert_tau']
+
+ALPHAS  = np.logspace(-6, 0, 13)  # default relative regularization strengths
+NITER   = 5000    # maximum number of FISTA iterations for each regularization strength
+TOL     = 1.e-10  # relative change in the solution that stops the iterations
+RIDGE   = 1.e-10  # relative size of the ridge term that makes the smoothness matrix positive definite
+
+def invert_tau(gpop, tau, sigma=None, alphas=ALPHAS, order=2, niter=NITER, tol=TOL):
+    """
+    Recover the grain size distribution from an observed optical depth curve, without
+    a parametric form for dn/da. The kernel that maps the size distribution to optical
+    depth, Q_ext(E, a) x cgeo(a) x wts(a), is built once from the scattering model of
+    `gpop`, which must already be calculated at the energies (or wavelengths) of `tau`.
+
+    The unknown is the mass-weighted size distribution, a^4 dn/da, on the grain radii of
+    `gpop`. For each regularization strength, this solves the non-negative least squares
+    problem
+
+        min || (K x - tau) / sigma ||^2 + alpha * s * || D x ||^2 , x >= 0
+
+    where D takes the `order`-th differences of x in log(a), and s = trace(K^T K) / trace(D^T D)
+    makes `alpha` a relative strength. Both quadratic forms are factored once, with a single
+    generalized eigendecomposition, which gives the unconstrained solution for every alpha
+    at once. The non-negative solutions are found with FISTA (accelerated projected gradient),
+    starting from the unconstrained solution. No new scattering calculations are needed.
+
+    Inputs
+    ------
+    gpop : newdust.grainpop.SingleGrainPop : grain radii, composition, and the scattering
+        model results (gpop.calculate_ext must have been run)
+
+    tau : numpy.ndarray (NE) : observed extinction optical depth at gpop.lam
+
+    sigma : numpy.ndarray (NE) : uncertainty on `tau` (Default: None, all ones)
+
+    alphas : numpy.ndarray (NL) : relative regularization strengths
+
+    order : int (1 or 2) : order of the differences used for the smoothness penalty
+
+    niter : int : maximum number of FISTA iterations for each alpha
+
+    tol : float : stop when the relative change in the solution is below `tol`
+
+    Returns
+    -------
+    dict with the results for each of the NL regularization strengths:
+    |   'alpha' : numpy.ndarray (NL) : regularization strengths
+    |   'ndens' : numpy.ndarray (NL x NA) : size distributions [cm^-2 um^-1]
+    |   'md' : numpy.ndarray (NL) : dust mass column of each solution [g cm^-2]
+    |   'sizedist' : list of newdust.graindist.sizedist.Tabulated objects (use with md above)
+    |   'tau' : numpy.ndarray (NL x NE) : model optical depths
+    |   'chi2' : numpy.ndarray (NL) : sum of squared, normalized residuals
+    |   'rough' : numpy.ndarray (NL) : smoothness penalty, || D x ||^2, e.g. for an L-curve
+    """
+    assert gpop.scatm.qext is not None, "Need to run calculate_ext"
+    assert order in [1, 2]
+    tau = np.asarray(tau, dtype=float)
+    NE, NA = np.shape(gpop.scatm.qext)
+    assert np.shape(tau) == (NE,)
+    assert NA > order
+    if sigma is None:
+        sigma = np.ones(NE)
+    sigma  = np.asarray(sigma, dtype=float)
+    alphas = np.atleast_1d(np.asarray(alphas, dtype=float))
+
+    # Kernel for the mass-weighted size distribution, x = a^4 dn/da,
+    # scaled to order unity so that the solver works with well-sized numbers
+    a_um   = gpop.a.to('micron').value
+    kernel = gpop.scatm.qext * (gpop.cgeo * gpop.wts / a_um**4)[np.newaxis,:]  # NE x NA
+    kernel = kernel / sigma[:,np.newaxis]
+    kscale = np.max(np.abs(kernel))
+    kernel = kernel / kscale
+    data   = tau / sigma
+
+    # Quadratic forms of the fit and of the smoothness penalty, factored once
+    diffs  = np.diff(np.eye(NA), n=order, axis=0)  # (NA-order) x NA, in units of log(a) steps
+    A = np.dot(kernel.T, kernel)
+    B = np.dot(diffs.T, diffs)
+    b = np.dot(kernel.T, data)
+    s = np.trace(A) / np.trace(B)
+    B = s * B + RIDGE * np.trace(A) / NA * np.eye(NA)
+    mu, V = linalg.eigh(A, B)  # A V = B V diag(mu), with V^T B V = I
+    mu = np.clip(mu, 0.0, None)
+    Vb = np.dot(V.T, b)
+    Amax, Bmax = np.max(linalg.eigvalsh(A)), np.max(linalg.eigvalsh(B))
+
+    xs = []
+    for alpha in alphas:
+        # Unconstrained solution (A + alpha B) x = b, from the generalized eigenvectors
+        x0 = np.dot(V, Vb / (mu + alpha))
+        xs.append(_fista_nonneg(A + alpha * B, b, np.clip(x0, 0.0, None),
+                                2.0 * (Amax + alpha * Bmax), niter, tol))
+    xs = np.array(xs)  # NL x NA
+
+    ndens = xs / kscale / a_um**4  # cm^-2 um^-1
+    mgra  = gpop.shape.vol(gpop.a) * gpop.rho  # g
+    md    = np.sum(ndens * mgra * gpop.wts, axis=1)
+    model = np.dot(xs, kernel.T) * sigma  # NL x NE
+    result = dict()
+    result['alpha'] = alphas
+    result['ndens'] = ndens
+    result['md']    = md
+    result['sizedist'] = [sizedist.Tabulated(gpop.a, nd) for nd in ndens]
+    result['tau']   = model
+    result['chi2']  = np.sum(((model - tau) / sigma)**2, axis=1)
+    result['rough'] = np.sum(np.dot(xs, diffs.T)**2, axis=1)
+    return result
+
+def _fista_nonneg(H, b, x0, lipschitz, niter=NITER, tol=TOL):
+    """
+    Minimize x^T H x - 2 b^T x subject to x >= 0 with FISTA
+    (Beck & Teboulle 2009), where `lipschitz` bounds the largest eigenvalue of 2 H
+    """
+    x, y, t = x0, x0, 1.0
+    step = 2.0 / lipschitz
+    for i in range(niter):
+        x_new = np.clip(y - step * (np.dot(H, y) - b), 0.0, None)
+        t_new = 0.5 * (1.0 + np.sqrt(1.0 + 4.0 * t**2))
+        y = x_new + ((t - 1.0) / t_new) * (x_new - x)
+        change = np.sqrt(np.sum((x_new - x)**2))
+        x, t = x_new, t_new
+        if change <= tol * max(np.sqrt(np.sum(x**2)), 1.e-300):
+            break
+    return x
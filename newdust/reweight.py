@@ -0,0 +1,281 @@
+import copy
+import numpy as np
+import astropy.units as u
+
+from . import graindist
+from . import scatteringmodel
+from .graindist.sizedist.grids import _radius_limits
+
+__all__ = ['SizeReweight']
+
+ALLOWED_COMPS = {'Drude':graindist.composition.CmDrude,
+                 'Silicate':graindist.composition.CmSilicate,
+                 'Graphite':graindist.composition.CmGraphite}
+ALLOWED_SHAPES = {'Sphere':graindist.shape.Sphere()}
+
+class SizeReweight(object):
+    """
+    Computes the extinction efficiencies of one grain composition on a master grid
+    of grain radii, once, so that the optical depths of any number of size
+    distributions on that grid can be evaluated as a single matrix product.
+    This is useful for fitting size distribution parameters, because the
+    scattering calculation does not depend on them.
+
+    Attributes
+    ----------
+    a : astropy.units.Quantity : master grid of grain radii (NA)
+
+    wts : numpy.ndarray : weights [micron] for integrating over the master grid
+
+    comp : newdust.graindist.composition object
+
+    shape : newdust.graindist.shape object
+
+    scatm : newdust.scatteringmodel object, holding the efficiencies (NE x NA)
+    and differential scattering efficiencies (NE x NA x NTH)
+
+    lam : astropy.units.Quantity : wavelength or energy used for the calculation
+
+    cgeo : numpy.ndarray : geometric cross-section of the grains on the master grid [cm^2]
+
+    vol : numpy.ndarray : volume of the grains on the master grid [cm^3]
+
+    Size distributions are passed to the evaluation methods as `ndens` arrays of shape
+    NA (one distribution) or NS x NA (NS distributions) [cm^-2 um^-1]. They can be
+    made with the ndens_* methods, which are vectorized over the distribution parameters.
+    """
+    def __init__(self, a, cmtype, stype='Mie', shape='Sphere', wts=None):
+        """
+        Inputs
+        ------
+
+        a : newdust.graindist.sizedist object -or- astropy.units.Quantity -or- numpy.ndarray :
+            master grid of grain radii; if a sizedist object, its grid and integration weights are used.
+            If no units specified, defaults to micron.
+            The grid should span every size distribution that will be evaluated.
+
+        cmtype : string ('Drude', 'Silicate', 'Graphite') or
+            newdust.graindist.composition object defining the optical constants and compound density
+
+        stype : string ('Mie' or 'RG') or newdust.scatteringmodel object
+
+        shape : string ('Sphere' is the only option) or newdust.graindist.shape object
+
+        wts : numpy.ndarray : integration weights [micron] for the grid `a`;
+            if None, the sizedist weights or the trapezoidal rule are used
+        """
+        if hasattr(a, 'ndens'):
+            if wts is None:
+                wts = getattr(a, 'wts', None)
+            a = a.a
+        if not isinstance(a, u.Quantity):
+            a = np.asarray(a, dtype=float) * u.micron
+        self.a = a
+        if wts is None:
+            wts = graindist.sizedist.trapz_weights(a.to('micron').value)
+        assert np.size(wts) == np.size(a)
+        self.wts = np.asarray(wts, dtype=float)
+
+        if isinstance(cmtype, str):
+            assert cmtype in ALLOWED_COMPS
+            self.comp = ALLOWED_COMPS[cmtype]()
+        else:
+            self.comp = cmtype
+
+        if isinstance(shape, str):
+            assert shape in ALLOWED_SHAPES
+            self.shape = ALLOWED_SHAPES[shape]
+        else:
+            self.shape = shape
+
+        if isinstance(stype, str):
+            assert stype in ['RG', 'Mie']
+            if stype == 'RG':
+                self.scatm = scatteringmodel.RGscattering()
+            if stype == 'Mie':
+                self.scatm = scatteringmodel.Mie()
+        else:
+            self.scatm = stype
+
+        self.lam  = None
+        self.cgeo = self.shape.cgeo(self.a)
+        self.vol  = self.shape.vol(self.a)
+
+    def calculate_ext(self, lam, theta=0.0, **kwargs):
+        """
+        Run the scattering model calculation on the master grid
+
+        lam : astropy.units.Quantity -or- numpy.ndarray
+            Wavelength or energy values for calculating the cross-sections;
+            if no units specified, defaults to keV
+
+        theta : astropy.units.Quantity -or- numpy.ndarray -or- float
+            Scattering angles for computing the differential scattering cross-section;
+            if no units specified, defaults to radian
+
+        **kwargs passed to self.scatm.calculate
+        """
+        self.scatm.calculate(lam, self.a, self.comp, theta=theta, **kwargs)
+        self.lam = self.scatm.pars['lam']
+
+    #----- Evaluate the extinction properties for many size distributions
+
+    def geo_weights(self, ndens):
+        """
+        Returns ndens * cgeo * wts, the matrix that maps efficiencies on the master grid
+        to optical depths (NA or NS x NA, unitless)
+        """
+        ndens = np.asarray(ndens, dtype=float)
+        assert np.shape(ndens)[-1] == np.size(self.a)
+        return ndens * self.cgeo * self.wts
+
+    def tau_ext(self, ndens):
+        """
+        Extinction optical depth for each size distribution (NE or NS x NE)
+        """
+        return self._tau(ndens, self.scatm.qext)
+
+    def tau_sca(self, ndens):
+        """
+        Scattering optical depth for each size distribution (NE or NS x NE)
+        """
+        return self._tau(ndens, self.scatm.qsca)
+
+    def tau_abs(self, ndens):
+        """
+        Absorption optical depth for each size distribution (NE or NS x NE)
+        """
+        return self._tau(ndens, self.scatm.qabs)
+
+    def int_diff(self, ndens):
+        """
+        Differential scattering cross-section integrated over each size distribution,
+        effectively dtau / dOmega [rad^-2] (NE x NTH or NS x NE x NTH)
+        """
+        self._check_calculated()
+        geo_fac = self.geo_weights(ndens)
+        result  = np.tensordot(geo_fac, self.scatm.diff, axes=([-1], [1]))
+        return result * u.Unit('rad^-2')
+
+    def _tau(self, ndens, qvals):
+        self._check_calculated()
+        # (NS x NA) . (NA x NE) -> NS x NE
+        return np.dot(self.geo_weights(ndens), qvals.T)
+
+    def _check_calculated(self):
+        assert self.lam is not None, "Need to run calculate_ext"
+
+    #----- Size distributions on the master grid, vectorized over their parameters
+
+    def ndens_powerlaw(self, md, p, amin=None, amax=None, rho=None):
+        """
+        Power law size distributions, dn/da propto a^-p for amin <= a <= amax, evaluated on the
+        master grid. All inputs are broadcast against each other, to give NS distributions.
+
+        Inputs
+        ------
+        md : float or numpy.ndarray : dust mass column [g cm^-2]
+
+        p : float or numpy.ndarray : power law slope
+
+        amin, amax : float or numpy.ndarray : grain radius limits [micron];
+            defaults to the limits of the master grid
+
+        rho : float or numpy.ndarray : grain material density [g cm^-3]; defaults to self.comp.rho
+
+        Returns
+        -------
+        numpy.ndarray (NS x NA) [cm^-2 um^-1]
+        """
+        a_um = self.a.to('micron').value
+        amin, amax, rho = self._defaults(amin, amax, rho)
+        md, p, amin, amax, rho = _broadcast_pars(md, p, amin, amax, rho)
+        adep = np.power(a_um, -p[:,np.newaxis]) * self._size_mask(amin, amax)
+        return self._normalize(adep, md, rho)
+
+    def ndens_expcutoff(self, md, p, acut, amin=None, amax=None, rho=None):
+        """
+        Power law size distributions with an exponential cut-off,
+        dn/da propto a^-p exp(-a/acut), evaluated on the master grid.
+        All inputs are broadcast against each other, to give NS distributions.
+
+        Inputs
+        ------
+        md : float or numpy.ndarray : dust mass column [g cm^-2]
+
+        p : float or numpy.ndarray : power law slope
+
+        acut : float or numpy.ndarray : cut-off grain radius [micron]
+
+        amin, amax : float or numpy.ndarray : grain radius limits [micron];
+            defaults to the limits of the master grid
+
+        rho : float or numpy.ndarray : grain material density [g cm^-3]; defaults to self.comp.rho
+
+        Returns
+        -------
+        numpy.ndarray (NS x NA) [cm^-2 um^-1]
+        """
+        a_um = self.a.to('micron').value
+        amin, amax, rho = self._defaults(amin, amax, rho)
+        md, p, acut, amin, amax, rho = _broadcast_pars(md, p, acut, amin, amax, rho)
+        adep = np.power(a_um, -p[:,np.newaxis]) * np.exp(-a_um / acut[:,np.newaxis])
+        adep *= self._size_mask(amin, amax)
+        return self._normalize(adep, md, rho)
+
+    def ndens_sizedist(self, sizedists, md, rho=None):
+        """
+        Evaluate the shape of any newdust.graindist.sizedist object on the master grid.
+        Each distribution is zero outside of its own grain radius limits (its `amin` and
+        `amax` attributes, or the ends of its grid of radii if it does not have them).
+
+        Inputs
+        ------
+        sizedists : sizedist object or list of sizedist objects (NS)
+
+        md : float or numpy.ndarray : dust mass column [g cm^-2]
+
+        rho : float or numpy.ndarray : grain material density [g cm^-3]; defaults to self.comp.rho
+
+        Returns
+        -------
+        numpy.ndarray (NS x NA) [cm^-2 um^-1]
+        """
+        if not isinstance(sizedists, list):
+            sizedists = [sizedists]
+        adep = []
+        for sd in sizedists:
+            # evaluate on the master grid without changing the input object,
+            # and zero outside of its own radius limits
+            sd_copy = copy.copy(sd)
+            sd_copy.a = self.a
+            sd_min, sd_max = _radius_limits(sd)
+            mask  = self._size_mask(np.array([sd_min]), np.array([sd_max]))[0]
+            adep.append(sd_copy.ndens(1.0, rho=1.0, shape=self.shape) * mask)
+        rho = self._defaults(None, None, rho)[2]
+        md, rho, _ = _broadcast_pars(md, rho, np.zeros(len(sizedists)))
+        return self._normalize(np.array(adep), md, rho)
+
+    def _defaults(self, amin, amax, rho):
+        # Default to the limits of the master grid and the density of the composition
+        a_um = self.a.to('micron').value
+        if amin is None: amin = a_um[0]
+        if amax is None: amax = a_um[-1]
+        if rho is None: rho = self.comp.rho
+        return amin, amax, rho
+
+    def _size_mask(self, amin, amax):
+        a_um = self.a.to('micron').value
+        return (a_um >= amin[:,np.newaxis] * (1.0 - 1.e-10)) & \
+               (a_um <= amax[:,np.newaxis] * (1.0 + 1.e-10))
+
+    def _normalize(self, adep, md, rho):
+        # Scale each distribution so that it integrates to the dust mass column
+        mgra = self.vol * rho[:,np.newaxis]  # NS x NA, g (mass of each grain)
+        mtot = np.sum(adep * mgra * self.wts, axis=1)  # g cm^2 um^-1
+        return adep * (md / mtot)[:,np.newaxis]  # cm^-2 um^-1
+
+def _broadcast_pars(*args):
+    # Broadcast the distribution parameters against each other, as flat arrays of length NS
+    result = np.broadcast_arrays(*[np.atleast_1d(np.asarray(x, dtype=float)) for x in args])
+    return [np.array(x.ravel()) for x in result]
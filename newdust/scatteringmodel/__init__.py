@@ -17,6 +17,10 @@ calculate( lam : scalar or np.array [wavelength or energy grid, keV default]
            cm  : newdust.graindist.composition cm object (abstract class)
            unit = : string ['kev', 'angs']
            theta = : scalar or np.array [angles to calculate differential scattering, arcsec, default 0.0]
+           outputs = : string ['all', 'int_diff', or 'tau'; if 'tau', skip `diff` and set it to None;
+                      if 'int_diff', set `int_diff` instead of `diff`]
+           mask = : np.array (NE x NA, bool) [optional, only calculate the cells where True; zero elsewhere]
+           weights = : np.array (NA) [weights for summing over grain radius, required for outputs='int_diff']
            **kwargs
            )
 
@@ -24,6 +28,7 @@ qsca : np.array, scattering efficiency [unitless]
 qabs : np.array, absorption efficiency [unitless]
 qext : np.array, extinction efficiency [unitless]
 diff : np.array, differentifal scattering cross section [ster^-1]
+int_diff : np.array, `diff` summed over grain radius with `weights` (NE x NTH) [ster^-1]
 pars : dict, stores the parameters used to run `calculate`
 
 write_table( outfile : string [filename for writing a FITS table of efficiency values] )
@@ -1,7 +1,7 @@
 import numpy as np
 import astropy.units as u
 from .. import helpers
-from .scatteringmodel import ScatteringModel
+from .scatteringmodel import ScatteringModel, ALLOWED_OUTPUTS, _row_blocks
 
 __all__ = ['Mie']
 
@@ -36,7 +36,7 @@ class Mie(ScatteringModel):
         self.gsca  = None
         self.qback = None
 
-    def calculate(self, lam, a, cm, theta=0.0, memlim=MAX_RAM):
+    def calculate(self, lam, a, cm, theta=0.0, memlim=MAX_RAM, outputs='all', mask=None, weights=None):
         """
         Calculate the extinction efficiences using the Mie formula for spherical particles.
 
@@ -55,8 +55,20 @@ class Mie(ScatteringModel):
             Scattering angles for computing the differential scattering cross-section;
             if no units specified, defaults to radian
 
-        Updates the `qsca`, `qext`, `qabs`, `diff`, `gsca`, and `qback` attributes
+        outputs : string ('all', 'int_diff', or 'tau') : if 'tau', the scattering
+            intensity pattern is not calculated and `diff` is set to None; if 'int_diff',
+            the intensity pattern is summed over grain radius (`int_diff`), a block of
+            energies at a time, and `diff` is set to None
+
+        mask : numpy.ndarray (NE x NA, bool) : if provided, only the cells where `mask`
+            is True are calculated; all results are zero for the other cells
+
+        weights : numpy.ndarray (NA) : weights for summing the intensity pattern over
+            grain radius, required for outputs='int_diff'
+
+        Updates the `qsca`, `qext`, `qabs`, `diff`, `int_diff`, `gsca`, and `qback` attributes
         """
+        assert outputs in ALLOWED_OUTPUTS
         # Store the parameters
         lam_cm0, a_cm0, theta_rad0 = self._store_parameters(lam, a, cm, theta)
         NE, NA, NTH = np.size(lam_cm0), np.size(a_cm0), np.size(theta_rad0)
@@ -77,7 +89,27 @@ class Mie(ScatteringModel):
         # Size parameter (grain circumference to incoming wavelength)
         x      = 2.0 * np.pi * a_cm / lam_cm
 
-        qsca, qext, qback, gsca, Cdiff = _mie_helper(x, refrel, theta=theta_rad_1d, memlim=memlim)
+        if mask is not None:
+            mask = np.asarray(mask, dtype=bool)
+
+        int_diff = None
+        if outputs == 'int_diff':
+            assert weights is not None and np.size(weights) == NA, \
+                "outputs='int_diff' needs the weights for summing over grain radius"
+            weights  = np.asarray(weights, dtype=float).flatten()
+            qsca, qext, qback, gsca = [np.zeros(shape=(NE, NA)) for i in range(4)]
+            int_diff = np.zeros(shape=(NE, NTH))
+            for rows in _row_blocks(NE, NA * NTH):
+                block_mask = None if mask is None else mask[rows]
+                block = _mie_cells(x[rows], refrel[rows], block_mask, theta_rad_1d, memlim=memlim, diff=True)
+                qsca[rows], qext[rows], qback[rows], gsca[rows] = block[:4]
+                if np.ndim(block[4]) == 3:
+                    int_diff[rows] = np.einsum('ijk,j->ik', block[4], weights)
+            Cdiff = None
+            self.pars['weights'] = weights
+        else:
+            qsca, qext, qback, gsca, Cdiff = _mie_cells(x, refrel, mask, theta_rad_1d, memlim=memlim,
+                                                         diff=(outputs != 'tau'))
 
         self.qsca  = qsca  # NE x NA
         self.qext  = qext
@@ -85,16 +117,46 @@ class Mie(ScatteringModel):
         self.qback = qback
         self.gsca  = gsca
         self.diff  = Cdiff # ster^-1,  NE x NA x NTH
+        self.int_diff = int_diff  # ster^-1 (times the units of `weights`), NE x NTH
 
 #---------------- Helper function that does the actual calculation
 
-def _mie_helper(x, refrel, theta, memlim=MAX_RAM):
+def _mie_cells(x, refrel, mask, theta, memlim=MAX_RAM, diff=True):
+    # Run _mie_helper on all of the cells, or on the cells selected by `mask`
+    if mask is None:
+        return _mie_helper(x, refrel, theta=theta, memlim=memlim, diff=diff)
+    return _mie_masked(x, refrel, mask, theta, memlim=memlim, diff=diff)
+
+def _mie_masked(x, refrel, mask, theta, memlim=MAX_RAM, diff=True):
+    """
+    Run _mie_helper on the selected cells only, as one flat list of cells,
+    and put the results back on the NE x NA (x NTH) grid, with zeros elsewhere
+    """
+    NE, NA = np.shape(x)
+    mask = np.asarray(mask, dtype=bool)
+    assert np.shape(mask) == (NE, NA)
+    result = [np.zeros(shape=(NE, NA)) for i in range(4)]
+    result.append(np.zeros(shape=(NE, NA, len(theta))) if diff else None)
+    if not np.any(mask):
+        return tuple(result)
+
+    sel = _mie_helper(x[mask].reshape(1, -1), refrel[mask].reshape(1, -1),
+                      theta=theta, memlim=memlim, diff=diff)
+    for r, q in zip(result, sel):
+        if r is not None:
+            r[mask] = np.reshape(q, (np.sum(mask),) + r.shape[2:]) if np.ndim(q) > 0 else q
+    return tuple(result)
+
+def _mie_helper(x, refrel, theta, memlim=MAX_RAM, diff=True):
     """
     theta is array of length NTH, units of radians
     
     x and refrel are NE x NA
     
     need to make outputs that are NE x NA x NTH
+
+    if diff is False, the scattering intensity pattern is skipped
+    and Cdiff is returned as None
     """
     assert np.shape(x) == np.shape(refrel)
     assert len(np.shape(x)) <= 2
@@ -104,21 +166,22 @@ def _mie_helper(x, refrel, theta, memlim=MAX_RAM):
     NTH    = len(theta)
 
     # Make 3D array for the calculations on angular dependence
-    theta_rad_3d  = np.repeat(
-        np.repeat(theta.reshape(1, 1, NTH), NE, axis=0),
-        NA, axis=1)
-    x_3d      = np.repeat(x.reshape(NE,NA,1), NTH, axis=2)
-
-    amu       = np.abs(np.cos(theta_rad_3d))
-    indl90    = (theta_rad_3d < np.pi/2.0)
-    indg90    = (theta_rad_3d >= np.pi/2.0)
-
-    s1    = np.zeros(shape=(NE, NA, NTH), dtype='complex')
-    s2    = np.zeros(shape=(NE, NA, NTH), dtype='complex')
-    pi    = np.zeros(shape=(NE, NA, NTH), dtype='complex')
-    pi0   = np.zeros(shape=(NE, NA, NTH), dtype='complex')
-    pi1   = np.zeros(shape=(NE, NA, NTH), dtype='complex') + 1.0
-    tau   = np.zeros(shape=(NE, NA, NTH), dtype='complex')
+    if diff:
+        theta_rad_3d  = np.repeat(
+            np.repeat(theta.reshape(1, 1, NTH), NE, axis=0),
+            NA, axis=1)
+        x_3d      = np.repeat(x.reshape(NE,NA,1), NTH, axis=2)
+
+        amu       = np.abs(np.cos(theta_rad_3d))
+        indl90    = (theta_rad_3d < np.pi/2.0)
+        indg90    = (theta_rad_3d >= np.pi/2.0)
+
+        s1    = np.zeros(shape=(NE, NA, NTH), dtype='complex')
+        s2    = np.zeros(shape=(NE, NA, NTH), dtype='complex')
+        pi    = np.zeros(shape=(NE, NA, NTH), dtype='complex')
+        pi0   = np.zeros(shape=(NE, NA, NTH), dtype='complex')
+        pi1   = np.zeros(shape=(NE, NA, NTH), dtype='complex') + 1.0
+        tau   = np.zeros(shape=(NE, NA, NTH), dtype='complex')
 
     y      = x * refrel
     ymod   = np.abs(y)
@@ -220,8 +283,9 @@ def _mie_helper(x, refrel, theta, memlim=MAX_RAM):
         bn[ig] = (refrel[ig] * d_n[ig] + en / x[ig]) * psi[ig] - psi1[ig]
         bn[ig] = bn[ig] / ((refrel[ig] * d_n[ig] + en/x[ig]) * xi[ig] - xi1[ig])
 
-        an_3d = np.repeat(an.reshape(NE,NA,1), NTH, axis=2)
-        bn_3d = np.repeat(bn.reshape(NE,NA,1), NTH, axis=2)
+        if diff:
+            an_3d = np.repeat(an.reshape(NE,NA,1), NTH, axis=2)
+            bn_3d = np.repeat(bn.reshape(NE,NA,1), NTH, axis=2)
 
         # *** Augment sums for Qsca and g=<cos(theta)>
         # NOTE from LIA: In IDL version, bhmie casts double(an)
@@ -249,10 +313,11 @@ def _mie_helper(x, refrel, theta, memlim=MAX_RAM):
         # values.  Cosmological halo functions will utilize this
         # Diff this way.
 
-        pi  = pi1
-        tau = en * amu * pi - (en + 1.0) * pi0
+        if diff:
+            pi  = pi1
+            tau = en * amu * pi - (en + 1.0) * pi0
 
-        if np.size(indl90) != 0:
+        if diff and np.size(indl90) != 0:
             antmp = an_3d[...,indl90]
             bntmp = bn_3d[...,indl90]  # For case where multiple E and theta are specified
             s1[...,indl90] = s1[...,indl90] + fn * (antmp * pi[...,indl90] + bntmp * tau[...,indl90])
@@ -274,7 +339,7 @@ def _mie_helper(x, refrel, theta, memlim=MAX_RAM):
         # LIA : Previous code used tau(j) from the previous loop.  How do I
         # get around this?
 
-        if np.size(indg90) != 0:
+        if diff and np.size(indg90) != 0:
             antmp = an_3d[...,indg90]
             bntmp = bn_3d[...,indg90]
             s1[...,indg90] = s1[...,indg90] + fn * p * (antmp * pi[...,indg90] - bntmp * tau[...,indg90])
@@ -294,8 +359,9 @@ def _mie_helper(x, refrel, theta, memlim=MAX_RAM):
         #     For each angle J, compute pi_n+1
         #     from PI = pi_n , PI0 = pi_n-1
 
-        pi1  = ((2.0 * en + 1.0) * amu * pi - (en + 1.0) * pi0) / en
-        pi0  = pi
+        if diff:
+            pi1  = ((2.0 * en + 1.0) * amu * pi - (en + 1.0) * pi0) / en
+            pi0  = pi
 
         pi1_ext = ((2.0 * en + 1.0) * 1.0 * pi_ext - (en + 1.0) * pi0_ext) / en
         pi0_ext = pi_ext
@@ -313,6 +379,9 @@ def _mie_helper(x, refrel, theta, memlim=MAX_RAM):
     qext = (4.0 / np.power(x,2)) * s1_ext.real
     qback = np.power(np.abs(s1_back)/x, 2) / np.pi
 
+    if not diff:
+        return (qsca, qext, qback, gsca, None)
+
     Cdiff = 0.0
     bad_theta = (np.abs(theta_rad_3d) > np.pi)  # Set to 0 values where theta > !pi
     s1[...,bad_theta] = 0
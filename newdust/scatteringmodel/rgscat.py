@@ -1,7 +1,7 @@
 import numpy as np
 import astropy.units as u
 from .. import helpers
-from .scatteringmodel import ScatteringModel
+from .scatteringmodel import ScatteringModel, ALLOWED_OUTPUTS, _row_blocks
 
 __all__ = ['RGscattering']
 
@@ -17,7 +17,7 @@ class RGscattering(ScatteringModel):
         self.stype = 'RGscat'
         self.citation = 'Calculating RG-Drude approximation\nMauche & Gorenstein (1986), ApJ 302, 371\nSmith & Dwek (1998), ApJ, 503, 831'
 
-    def calculate(self, lam, a, cm, theta=0.0):
+    def calculate(self, lam, a, cm, theta=0.0, outputs='all', mask=None, weights=None):
         """
         Calculate the extinction efficiences with the Rayleigh-Gans approximation.
 
@@ -36,8 +36,20 @@ class RGscattering(ScatteringModel):
             Scattering angles for computing the differential scattering cross-section;
             if no units specified, defaults to radian
 
-        Updates the `qsca`, `qext`, `qabs`, and `diff` attributes
+        outputs : string ('all', 'int_diff', or 'tau') : if 'tau', only the efficiencies
+            are calculated and `diff` is set to None; if 'int_diff', the differential
+            cross-section is summed over grain radius (`int_diff`), a block of energies
+            at a time, and `diff` is set to None
+
+        mask : numpy.ndarray (NE x NA, bool) : if provided, only the cells where `mask`
+            is True are calculated; all results are zero for the other cells
+
+        weights : numpy.ndarray (NA) : weights for summing the differential cross-section
+            over grain radius, required for outputs='int_diff'
+
+        Updates the `qsca`, `qext`, `qabs`, `diff`, and `int_diff` attributes
         """
+        assert outputs in ALLOWED_OUTPUTS
         # Store the parameters
         lam_cm0, a_cm0, theta_rad0 = self._store_parameters(lam, a, cm, theta)
         NE, NA, NTH = np.size(lam_cm0), np.size(a_cm0), np.size(theta_rad0)
@@ -61,11 +73,40 @@ class RGscattering(ScatteringModel):
         sigma_rad = sigma.to('radian').value # (NE x NA)
         
         # Calculate the scattering efficiencies (1-d)
-        qsca = _qsca(x, mm1)
+        if mask is None:
+            qsca = _qsca(x, mm1)
+        else:
+            mask = np.asarray(mask, dtype=bool)
+            assert np.shape(mask) == (NE, NA)
+            qsca = np.zeros(shape=(NE, NA))
+            qsca[mask] = _qsca(x[mask], mm1[mask])
         self.qsca = qsca
         self.qext = qsca
         self.qabs = self.qext - self.qsca
 
+        self.diff     = None
+        self.int_diff = None
+        if outputs == 'tau':
+            return
+
+        if outputs == 'int_diff':
+            assert weights is not None and np.size(weights) == NA, \
+                "outputs='int_diff' needs the weights for summing over grain radius"
+            weights = np.asarray(weights, dtype=float).flatten()
+            # Amplitude / geometric cross-section, times the weights (NE x NA)
+            amp = _dsig(a_cm, x, mm1) / (np.pi * a_cm**2) * weights[np.newaxis,:]
+            self.int_diff = _sum_thdep(amp, sigma_rad, theta_rad_1d, mask)  # ster^-1
+            self.pars['weights'] = weights
+            return
+
+        if mask is not None:
+            # Only the angular dependence of the selected cells
+            amp  = _dsig(a_cm[mask], x[mask], mm1[mask]) / (np.pi * a_cm[mask]**2)
+            self.diff = np.zeros(shape=(NE, NA, NTH))
+            self.diff[mask] = amp[:,np.newaxis] * \
+                _thdep(theta_rad_1d[np.newaxis,:], sigma_rad[mask][:,np.newaxis])  # ster^-1
+            return
+
         # Calculate the differential scattering cross-section of shape (NE, NA, NTH)
         xs_sca    = _dsig(a_cm, x, mm1) # cm^2
         xs_sca_3d = np.repeat(xs_sca.reshape(NE, NA, 1), NTH, axis=2)
@@ -124,3 +165,25 @@ def _dsig(a_cm, x, mm1):  # NE x NA
 def _thdep(theta_rad, sigma_rad):  # NE x NA x NTH
     # Angular portion of the differential scattering cross-section
     return 2./9. * np.exp(-0.5 * np.power(theta_rad/sigma_rad, 2))  # ster^-1
+
+def _sum_thdep(amp, sigma_rad, theta_rad, mask=None):
+    """
+    Sum of amp * _thdep over grain radius (NE x NTH), a block of energies at a time.
+    If `mask` (NE x NA) is given, the angular dependence is only evaluated for its cells.
+    """
+    NE, NA = np.shape(amp)
+    NTH    = len(theta_rad)
+    result = np.zeros(shape=(NE, NTH))
+    for rows in _row_blocks(NE, NA * NTH):
+        if mask is None:
+            thdep = _thdep(theta_rad[np.newaxis,np.newaxis,:], sigma_rad[rows][:,:,np.newaxis])
+            result[rows] = np.einsum('ij,ijk->ik', amp[rows], thdep)
+            continue
+        ie, ia = np.nonzero(mask[rows])  # cells in order of energy
+        if len(ie) == 0:
+            continue
+        cells = amp[rows][ie, ia][:,np.newaxis] * \
+            _thdep(theta_rad[np.newaxis,:], sigma_rad[rows][ie, ia][:,np.newaxis])
+        first = np.append(0, np.nonzero(np.diff(ie))[0] + 1)  # first cell of each energy
+        result[rows][ie[first]] = np.add.reduceat(cells, first, axis=0)
+    return result
@@ -4,6 +4,14 @@ from .. import helpers
 
 __all__ = ['ScatteringModel']
 
+# Choices for the `outputs` keyword of the calculate methods:
+# 'all' calculates the efficiencies and the differential scattering efficiency (diff),
+# 'int_diff' calculates the efficiencies and the sum of diff over grain radius (int_diff),
+# 'tau' only calculates the efficiencies (qsca, qext, qabs); the others are left as None
+ALLOWED_OUTPUTS = ['all', 'int_diff', 'tau']
+
+DIFF_BLOCK = 1000000  # maximum number of (radius, angle) cells held at once when summing diff over radius
+
 ## See __init__ for API
 class ScatteringModel(object):
     """
@@ -19,6 +27,9 @@ class ScatteringModel(object):
 
     diff : numpy.ndarray : Differential scattering efficiency per steridian
 
+    int_diff : numpy.ndarray : Differential scattering efficiency per steridian, summed over
+    grain radius with the weights given to the calculation (only calculated for outputs='int_diff')
+
     pars : dict : Parameters from most recent calculation are stored here
 
     stype : string : A label for the model
@@ -35,6 +46,7 @@ class ScatteringModel(object):
         self.qext = None
         self.qabs = None
         self.diff = None
+        self.int_diff = None
         self.pars = None
         self.stype = 'Empty'
         if from_file is not None:
@@ -207,3 +219,10 @@ class ScatteringModel(object):
              [fits.Column(name='theta', array=helpers._make_array(self.pars['theta'].value),
              format='E', unit=self.pars['theta'].unit.to_string())])
         return [c1, c2, c3]
+
+def _row_blocks(NE, ncells):
+    # Slices of the first (wavelength/energy) axis, with at most DIFF_BLOCK cells
+    # (or a single row) in each, for summing diff over radius without the NE x NA x NTH array
+    nrows = max(1, int(DIFF_BLOCK // max(ncells, 1)))
+    for i in range(0, NE, nrows):
+        yield slice(i, min(i + nrows, NE))
@@ -0,0 +1,315 @@
+import os
+import shutil
+from concurrent import futures
+import numpy as np
+import astropy.units as u
+from astropy.io import fits
+
+from . import graindist
+from . import scatteringmodel
+from .reweight import SizeReweight
+
+__all__ = ['make_table_model']
+
+AMIN       = 0.005  # um, minimum grain radius of the power law size distributions
+NA         = 100    # default number of grain radii on the master grid
+CHUNK_SIZE = 50     # default number of energies in each scattering calculation job
+
+# Table parameters, in the order they are written to the table model
+TABLE_PARS  = ['md', 'p', 'amax', 'fsil']
+LOG_PARS    = ['md', 'amax']  # parameters interpolated in log space by XSPEC
+
+def make_table_model(outfile, ebins, md, p, amax, fsil=0.6, sil=None, carb=None,
+                     amin=AMIN, na=NA, stype='Mie', keyword='ext',
+                     executor='process', max_workers=None, chunk_size=CHUNK_SIZE,
+                     checkpoint=None, cleanup=True, modlname='newdust', overwrite=True):
+    """
+    Write an XSPEC multiplicative table model (OGIP/92-009) of dust extinction,
+    exp(-tau), for power law size distributions of silicate and carbonaceous grains
+    on a grid of parameter values. The grid parameters are the dust mass column `md`,
+    the power law slope `p`, the maximum grain radius `amax`, and the fraction of the
+    dust mass in silicate grains `fsil`.
+
+    The scattering calculation is run only once for each composition, on a master grid
+    of grain radii that includes every `amax` value, and the table is then built by size
+    reweighting (see newdust.reweight.SizeReweight). The scattering calculations are split
+    into jobs of `chunk_size` energies, which can run in a pool of processes. Each finished
+    job is saved in the `checkpoint` directory, so an interrupted calculation resumes
+    where it stopped when this function is called again with the same inputs.
+
+    Inputs
+    ------
+    outfile : string : name of the output FITS file
+
+    ebins : astropy.units.Quantity -or- numpy.ndarray : edges of the NE energy bins (NE+1 values);
+        if no units specified, defaults to keV. The model is evaluated at the center of each bin.
+
+    md : float or numpy.ndarray : dust mass column values [g cm^-2]
+
+    p : float or numpy.ndarray : power law slope values
+
+    amax : float or numpy.ndarray : maximum grain radius values [micron]
+
+    fsil : float or numpy.ndarray : values for the fraction of the dust mass in silicate grains
+
+    sil, carb : list of (newdust.graindist.composition object, float) pairs :
+        compositions of the silicate and carbonaceous grains, each with its fraction of the
+        silicate or carbonaceous dust mass (Default: as in newdust.grainpop.make_MRN,
+        CmSilicate, and CmGraphite with 1/3 parallel and 2/3 perpendicular orientations)
+
+    amin : float : minimum grain radius [micron]
+
+    na : int : number of log-spaced grain radii on the master grid (the `amax` values are added)
+
+    stype : string ('Mie' or 'RG') : scattering model to use
+
+    keyword : string ('ext' or 'abs') : tabulate exp(-tau_ext) or exp(-tau_abs)
+
+    executor : None, 'process', or concurrent.futures.Executor :
+        if not None, run the scattering calculation jobs in a pool of processes
+        (or in the executor provided)
+
+    max_workers : int : number of processes to use when `executor` is 'process'
+
+    chunk_size : int : number of energies in each scattering calculation job
+
+    checkpoint : string : directory for saving finished jobs
+        (Default: None, uses `outfile` + '.ckpt'; False turns off checkpoints)
+
+    cleanup : bool (True) : if True, remove the checkpoint directory after the table is written
+
+    modlname : string : name of the model in the FITS header
+
+    overwrite : bool (True) : if True, overwrite an existing `outfile`
+
+    Returns
+    -------
+    numpy.ndarray (NMD x NP x NAMAX x NFSIL x NE) : the tabulated model values
+    """
+    assert stype in ['Mie', 'RG']
+    assert keyword in ['ext', 'abs']
+    if not isinstance(ebins, u.Quantity):
+        ebins = ebins * u.keV
+    e_kev = ebins.to('keV', equivalencies=u.spectral()).value
+    assert np.all(np.diff(e_kev) > 0.0), "ebins must be increasing in energy"
+    lam   = 0.5 * (e_kev[:-1] + e_kev[1:]) * u.keV
+
+    pars = dict(zip(TABLE_PARS, [np.atleast_1d(np.asarray(x, dtype=float)) for x in [md, p, amax, fsil]]))
+    assert np.all(pars['md'] > 0.0) and np.all(pars['amax'] > amin)
+    assert np.all(pars['fsil'] >= 0.0) and np.all(pars['fsil'] <= 1.0)
+    for k in TABLE_PARS:
+        assert np.all(np.diff(pars[k]) > 0.0), "values of %s must be increasing" % k
+
+    if sil is None:
+        sil = [(graindist.composition.CmSilicate(), 1.0)]
+    if carb is None:
+        carb = [(graindist.composition.CmGraphite(orient='para'), 1.0/3.0),
+                (graindist.composition.CmGraphite(orient='perp'), 2.0/3.0)]
+    # Skip a group of compositions that has no mass anywhere on the grid
+    groups = []
+    if np.any(pars['fsil'] > 0.0):
+        groups.append((pars['fsil'], sil))
+    if np.any(pars['fsil'] < 1.0):
+        groups.append((1.0 - pars['fsil'], carb))
+    comps = [c for g in groups for c, w in g[1]]
+
+    # Master grid of grain radii, with every amax value as a grid point
+    a_um = np.unique(np.concatenate([np.logspace(np.log10(amin), np.log10(np.max(pars['amax'])), na),
+                                     pars['amax']]))
+    a_grid = a_um * u.micron
+
+    if checkpoint is None:
+        checkpoint = outfile + '.ckpt'
+    qvals = _run_table_jobs(comps, a_grid, lam, stype, keyword, executor, max_workers,
+                            chunk_size, checkpoint)
+
+    # Optical depth per unit dust mass for each composition, on the (p, amax) grid
+    NP, NAM, NE = len(pars['p']), len(pars['amax']), len(lam)
+    tau_md = 0.0
+    i = 0
+    for frac, group in groups:
+        tau_group = 0.0
+        for comp, wt in group:
+            rw = SizeReweight(a_grid, comp, stype=stype)
+            nd = rw.ndens_powerlaw(1.0, pars['p'][:,np.newaxis], amax=pars['amax'][np.newaxis,:])
+            tau_group = tau_group + wt * np.dot(rw.geo_weights(nd), qvals[i].T).reshape(NP, NAM, NE)
+            i += 1
+        # NP x NAMAX x NFSIL x NE
+        tau_md = tau_md + tau_group[:,:,np.newaxis,:] * frac[np.newaxis,np.newaxis,:,np.newaxis]
+
+    model = np.exp(-pars['md'][:,np.newaxis,np.newaxis,np.newaxis,np.newaxis] * tau_md[np.newaxis,...])
+    _write_table_model(outfile, e_kev, pars, model, modlname, keyword, overwrite)
+
+    if checkpoint and cleanup and os.path.isdir(checkpoint):
+        shutil.rmtree(checkpoint)
+    return model
+
+##----- Helper material
+
+def _run_table_jobs(comps, a, lam, stype, keyword, executor, max_workers, chunk_size, checkpoint):
+    """
+    Run the scattering calculations for each composition, in jobs of chunk_size energies,
+    skipping the jobs that are already saved in the checkpoint directory.
+    Returns a list with the efficiencies (NE x NA) for each composition.
+    """
+    assert chunk_size >= 1
+    if checkpoint:
+        os.makedirs(checkpoint, exist_ok=True)
+    starts = list(range(0, len(lam), int(chunk_size)))
+    chunks = [lam[i:i+int(chunk_size)] for i in starts]
+
+    results, todo = dict(), []
+    for ic, comp in enumerate(comps):
+        for ie, lam_chunk in enumerate(chunks):
+            ckfile = _checkpoint_file(checkpoint, ic, ie) if checkpoint else None
+            q = _read_checkpoint(ckfile, comp, a, lam_chunk, stype, keyword) if ckfile else None
+            if q is None:
+                todo.append((ic, ie, ckfile))
+            else:
+                results[(ic, ie)] = q
+
+    def _finish(ic, ie, ckfile, q):
+        results[(ic, ie)] = q
+        if ckfile:
+            _write_checkpoint(ckfile, q, comps[ic], a, chunks[ie], stype, keyword)
+
+    if executor is None:
+        for ic, ie, ckfile in todo:
+            _finish(ic, ie, ckfile, _table_job(stype, a, comps[ic], chunks[ie], keyword))
+    else:
+        if isinstance(executor, str):
+            assert executor == 'process'
+            pool = futures.ProcessPoolExecutor(max_workers=max_workers)
+        else:
+            pool = executor
+        try:
+            jobs = dict((pool.submit(_table_job, stype, a, comps[ic], chunks[ie], keyword), (ic, ie, ckfile))
+                        for ic, ie, ckfile in todo)
+            # save each job as soon as it is done, so that little is lost to an interruption
+            for job in futures.as_completed(jobs):
+                _finish(*jobs[job], job.result())
+        finally:
+            if isinstance(executor, str):
+                pool.shutdown()
+
+    return [np.concatenate([results[(ic, ie)] for ie in range(len(chunks))], axis=0)
+            for ic in range(len(comps))]
+
+def _table_job(stype, a, comp, lam, keyword):
+    # Runs in a worker process; returns the extinction or absorption efficiency (NE x NA)
+    if stype == 'RG':
+        scatm = scatteringmodel.RGscattering()
+    if stype == 'Mie':
+        scatm = scatteringmodel.Mie()
+    scatm.calculate(lam, a, comp, outputs='tau')
+    return np.array(getattr(scatm, 'q' + keyword), dtype=float)
+
+def _checkpoint_file(checkpoint, ic, ie):
+    return os.path.join(checkpoint, 'comp{:03d}_chunk{:05d}.npz'.format(ic, ie))
+
+def _job_stamp(comp, a, lam, stype, keyword):
+    # Inputs that must match for a saved job to be used again,
+    # including the optical constants (e.g. graphite orientations share a cmtype)
+    cm = np.atleast_1d(comp.cm(lam))
+    return np.array([comp.cmtype, stype, keyword]), \
+        np.concatenate([a.to('micron').value, lam.to('keV', equivalencies=u.spectral()).value,
+                        cm.real, cm.imag])
+
+def _read_checkpoint(ckfile, comp, a, lam, stype, keyword):
+    """
+    Returns the saved efficiencies for a job, or None if the job has not been saved
+    or was saved for different inputs
+    """
+    if not os.path.exists(ckfile):
+        return None
+    try:
+        with np.load(ckfile) as data:
+            labels, grid = _job_stamp(comp, a, lam, stype, keyword)
+            if list(data['labels']) != list(labels) or np.shape(data['grid']) != np.shape(grid) or \
+                not np.allclose(data['grid'], grid, rtol=1.e-10, atol=0.0):
+                return None
+            return np.array(data['q'])
+    except (OSError, ValueError, KeyError):
+        return None
+
+def _write_checkpoint(ckfile, q, comp, a, lam, stype, keyword):
+    # The write is atomic, so that an interruption never leaves a partial file
+    labels, grid = _job_stamp(comp, a, lam, stype, keyword)
+    tmpfile = '{}.{}.tmp.npz'.format(ckfile[:-len('.npz')], os.getpid())
+    np.savez(tmpfile, q=q, labels=labels, grid=grid)
+    os.replace(tmpfile, ckfile)
+    return
+
+def _write_table_model(outfile, e_kev, pars, model, modlname, keyword, overwrite=True):
+    """
+    Write the model values to a FITS file following the OGIP/92-009 format
+    for XSPEC table models. In the SPECTRA extension, the last parameter (fsil)
+    changes fastest and the first parameter (md) changes slowest.
+    """
+    hdr = fits.Header()
+    hdr['MODLNAME'] = modlname[:12]
+    hdr['MODLUNIT'] = ' '
+    hdr['REDSHIFT'] = False
+    hdr['ADDMODEL'] = False
+    hdr['HDUCLASS'] = 'OGIP'
+    hdr['HDUCLAS1'] = 'XSPEC TABLE MODEL'
+    hdr['HDUVERS']  = '1.0.0'
+    hdr['COMMENT']  = "newdust extinction model, exp(-tau_%s), for power law size distributions" % keyword
+    primary_hdu = fits.PrimaryHDU(header=hdr)
+
+    # Parameter descriptions and values
+    nmax  = max([len(pars[k]) for k in TABLE_PARS])
+    vals  = np.zeros(shape=(len(TABLE_PARS), nmax))
+    for i, k in enumerate(TABLE_PARS):
+        vals[i,:len(pars[k])] = pars[k]
+    lo    = np.array([pars[k][0] for k in TABLE_PARS])
+    hi    = np.array([pars[k][-1] for k in TABLE_PARS])
+    nvals = np.array([len(pars[k]) for k in TABLE_PARS])
+    init  = np.array([pars[k][(len(pars[k])-1)//2] for k in TABLE_PARS])
+    # a negative delta freezes parameters that have a single value
+    delta = np.where(nvals > 1, 0.01 * (hi - lo), -1.0)
+    method = np.array([1 if k in LOG_PARS else 0 for k in TABLE_PARS])
+    par_hdu = fits.BinTableHDU.from_columns(
+        [fits.Column(name='NAME', format='12A', array=np.array(TABLE_PARS)),
+         fits.Column(name='METHOD', format='J', array=method),
+         fits.Column(name='INITIAL', format='E', array=init),
+         fits.Column(name='DELTA', format='E', array=delta),
+         fits.Column(name='MINIMUM', format='E', array=lo),
+         fits.Column(name='BOTTOM', format='E', array=lo),
+         fits.Column(name='TOP', format='E', array=hi),
+         fits.Column(name='MAXIMUM', format='E', array=hi),
+         fits.Column(name='NUMBVALS', format='J', array=nvals),
+         fits.Column(name='VALUE', format='%dE' % nmax, array=vals)])
+    par_hdu.name = 'PARAMETERS'
+    _ogip_keywords(par_hdu.header, 'PARAMETERS')
+    par_hdu.header['NINTPARM'] = len(TABLE_PARS)
+    par_hdu.header['NADDPARM'] = 0
+    par_hdu.header['COMMENT'] = "md [g cm^-2], p, amax [micron], fsil"
+
+    # Energy bins
+    en_hdu = fits.BinTableHDU.from_columns(
+        [fits.Column(name='ENERG_LO', format='E', unit='keV', array=e_kev[:-1]),
+         fits.Column(name='ENERG_HI', format='E', unit='keV', array=e_kev[1:])])
+    en_hdu.name = 'ENERGIES'
+    _ogip_keywords(en_hdu.header, 'ENERGIES')
+
+    # Model values, one row per grid point
+    grid = np.meshgrid(*[pars[k] for k in TABLE_PARS], indexing='ij')
+    paramval = np.array([g.ravel() for g in grid]).T  # NROW x NPAR
+    NE = len(e_kev) - 1
+    sp_hdu = fits.BinTableHDU.from_columns(
+        [fits.Column(name='PARAMVAL', format='%dE' % len(TABLE_PARS), array=paramval),
+         fits.Column(name='INTPSPEC', format='%dE' % NE, array=model.reshape(-1, NE))])
+    sp_hdu.name = 'SPECTRA'
+    _ogip_keywords(sp_hdu.header, 'MODEL SPECTRA')
+
+    hdu_list = fits.HDUList(hdus=[primary_hdu, par_hdu, en_hdu, sp_hdu])
+    hdu_list.writeto(outfile, overwrite=overwrite)
+    return
+
+def _ogip_keywords(header, hduclas2):
+    header['HDUCLASS'] = 'OGIP'
+    header['HDUCLAS1'] = 'XSPEC TABLE MODEL'
+    header['HDUCLAS2'] = hduclas2
+    header['HDUVERS']  = '1.0.0'
+    return
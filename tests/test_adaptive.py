@@ -0,0 +1,51 @@
+import pytest
+import numpy as np
+import astropy.units as u
+
+from newdust.grainpop import SingleGrainPop, GrainPop
+from newdust.graindist import composition
+from newdust.graindist.composition.composition import _interp_table
+from newdust.adaptive import adaptive_ext
+from . import percent_diff
+
+MD   = 1.e-4  # g cm^-2
+TOL  = 0.01
+EMIN, EMAX = 0.3, 3.0  # keV, includes the O, Fe, Mg, and Si edges
+DENSE = np.logspace(np.log10(EMIN), np.log10(EMAX), 2000)
+
+def test_adaptive_ext():
+    gp = SingleGrainPop('Powerlaw', 'Silicate', 'RG', md=MD)
+    result = adaptive_ext(gp, EMIN, EMAX, tol=TOL)
+    lam = result['lam'].value
+    assert result['lam'].unit == u.keV
+    assert np.all(np.diff(lam) > 0.0)
+    assert len(lam) == 16 + result['ncm'] + result['ntau']
+    assert len(lam) < len(DENSE) / 4
+    # the results are stored in the grain population
+    assert np.all(percent_diff(gp.tau_ext, result['tau_ext']) <= 1.e-10)
+
+    # interpolating the adaptive grid reproduces a dense calculation
+    full = SingleGrainPop('Powerlaw', 'Silicate', 'RG', md=MD)
+    full.calculate_ext(DENSE, outputs='tau')
+    tau  = _interp_table(DENSE, lam, [result['tau_ext']], [0.0], loglog=True)[0]
+    assert np.all(percent_diff(tau, full.tau_ext) <= TOL)
+
+    # the same grid comes out in wavelength units
+    test = SingleGrainPop('Powerlaw', 'Silicate', 'RG', md=MD)
+    lmin = (EMAX * u.keV).to('angstrom', equivalencies=u.spectral())
+    lmax = (EMIN * u.keV).to('angstrom', equivalencies=u.spectral())
+    result2 = adaptive_ext(test, lmin, lmax, tol=TOL)
+    assert result2['lam'].unit == u.angstrom
+    assert np.all(np.diff(result2['lam'].value) > 0.0)
+    tau2 = _interp_table(DENSE, result2['lam'].to('keV', equivalencies=u.spectral()).value[::-1],
+                         [result2['tau_ext'][::-1]], [0.0], loglog=True)[0]
+    assert np.all(percent_diff(tau2, full.tau_ext) <= TOL)
+
+def test_adaptive_ext_grainpop():
+    gpop = GrainPop([SingleGrainPop('Powerlaw', 'Silicate', 'RG', md=0.6*MD),
+                     SingleGrainPop('Powerlaw', composition.CmGraphite(orient='perp'), 'RG', md=0.4*MD)])
+    result = adaptive_ext(gpop, EMIN, EMAX, tol=TOL, nmax=40)
+    assert len(result['lam']) <= 40
+    assert np.all(percent_diff(gpop.tau_ext, result['tau_ext']) <= 1.e-10)
+    for gp in gpop.gpoplist:
+        assert len(gp.tau_ext) == len(result['lam'])
@@ -1,3 +1,4 @@
+import os
 import pytest
 import numpy as np
 import astropy.units as u
@@ -55,4 +56,162 @@ def test_interpolation(cm):
     new_x = ENERGY.to(cm.wavel.unit, equivalencies=u.spectral()).value
     test = np.interp(new_x, cm.wavel.value, cm.revals)
     ii = (cm.wavel.value >= min(new_x)) & (cm.wavel.value <= max(new_x))
-    assert percent_diff(np.mean(test), np.mean(cm.revals[ii])) <= 0.01
\ No newline at end of file
+    assert percent_diff(np.mean(test), np.mean(cm.revals[ii])) <= 0.01
+
+# Test that the parsed optical constant tables are cached and stored in a binary sidecar
+def test_cmfile_cache(tmpdir):
+    fname = composition._find_cmfile('callindex.out_sil.D03')
+    tname = str(tmpdir.join('callindex.out_test'))
+    with open(fname, 'r') as f:
+        text = f.read()
+    with open(tname, 'w') as f:
+        f.write(text)
+
+    test = composition.read_cmfile(tname)
+    assert os.path.exists(tname + '.npz')
+    assert test is composition.read_cmfile(tname)
+
+    # Loading from the sidecar gives the same values as parsing the text table
+    composition.clear_cmfile_cache()
+    from_sidecar = composition.read_cmfile(tname)
+    from_text = composition.read_cmfile(tname, use_sidecar=False)
+    assert from_text is not from_sidecar
+    assert from_sidecar is composition.read_cmfile(tname)
+    for col in ['wave(um)', 'Re(n)-1', 'Im(n)']:
+        assert np.all(from_sidecar[col] == from_text[col])
+    os.remove(tname + '.npz')
+    composition.read_cmfile(tname, use_sidecar=False)
+    assert not os.path.exists(tname + '.npz')
+
+    # A stale sidecar is ignored when the table changes
+    with open(tname, 'w') as f:
+        f.write(text.replace('2.4350E+00', '2.4351E+00', 1))
+    st = os.stat(tname)
+    os.utime(tname, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    composition.clear_cmfile_cache()
+    changed = composition.read_cmfile(tname)
+    assert changed['Re(n)-1'][0] == 2.4351
+
+# Test that the single-pass cm() agrees with rp() and ip()
+@pytest.mark.parametrize('cm', CMS)
+def test_cm_single_pass(cm):
+    for x in [WAVEL, ENERGY, EN]:
+        assert np.all(np.abs(cm.cm(x) - (cm.rp(x) + 1j * cm.ip(x))) < 1.e-12)
+    # Memoized results should not be affected by changes to the returned array
+    test = cm.cm(ENERGY)
+    test[:] = 0.0
+    assert np.all(np.abs(cm.cm(ENERGY) - (cm.rp(ENERGY) + 1j * cm.ip(ENERGY))) < 1.e-12)
+
+# Memoized results follow changes to the optical constant tables
+def test_cm_cache_table_edit():
+    # Tables read from file are read-only, and are replaced rather than edited
+    cm = composition.CmSilicate()
+    before = cm.cm(ENERGY)
+    with pytest.raises(ValueError):
+        cm.revals *= 2.0
+    cm.revals = cm.revals * 2.0
+    cm.imvals = np.zeros_like(cm.imvals)
+    assert np.all(np.abs(cm.cm(ENERGY) - cm.rp(ENERGY)) < 1.e-12)
+    assert np.any(np.abs(cm.cm(ENERGY) - before) > 1.e-12)
+
+    # Writable tables can be changed in place
+    cm.revals *= 0.5
+    cm.imvals[:] = 1.e-3
+    assert np.all(np.abs(cm.cm(ENERGY) - (cm.rp(ENERGY) + 1j * cm.ip(ENERGY))) < 1.e-12)
+
+# Test that log-log interpolation is exact for power laws between the table knots
+def test_cm_loglog():
+    test = composition.Composition()
+    test.wavel  = np.logspace(0, 3, 20) * u.angstrom
+    test.revals = 1.0 + 1.e-6 * test.wavel.value**2
+    test.imvals = 1.e-8 * test.wavel.value**3
+    test.loglog = True
+    lam = np.logspace(0.1, 2.9, 77)
+    result = test.cm(lam * u.angstrom)
+    assert np.all(percent_diff(result.real - 1.0, 1.e-6 * lam**2) <= 1.e-8)
+    assert np.all(percent_diff(result.imag, 1.e-8 * lam**3) <= 1.e-8)
+    # Switching the interpolation scheme does not reuse the stored result
+    linear = test.cm(lam * u.angstrom, loglog=False)
+    assert np.all(linear.imag >= result.imag * (1.0 - 1.e-10))
+    assert np.any(percent_diff(linear.imag, result.imag) > 0.01)
+
+# Test the effective-medium compositions
+@pytest.mark.parametrize('rule', ['Bruggeman', 'MaxwellGarnett'])
+def test_effective_medium(rule):
+    sil, gra, vac = composition.CmSilicate(), composition.CmGraphite(), composition.CmVacuum()
+    test = composition.CmEffectiveMedium([sil, gra, vac], [0.5, 0.2, 0.3], rule=rule)
+    test_abstract_class(test)
+    assert percent_diff(test.rho, 0.5 * sil.rho + 0.2 * gra.rho) <= 1.e-6
+
+    # A single component recovers the original optical constants
+    pure = composition.CmEffectiveMedium([sil, vac], [1.0, 0.0], rule=rule)
+    assert np.all(np.abs(pure.cm(ENERGY) - sil.cm(ENERGY)) < 1.e-10)
+
+    # Many volume fractions at once give the same result as one at a time
+    porosity = np.linspace(0.0, 0.9, 10)
+    vfrac = np.array([[0.7*(1.0-p), 0.3*(1.0-p), p] for p in porosity])
+    result = test.cm_vfrac(ENERGY, vfrac)
+    assert np.shape(result) == (len(porosity), len(ENERGY))
+    for i in range(len(porosity)):
+        assert np.all(np.abs(result[i] - test.at_vfrac(vfrac[i]).cm(ENERGY)) < 1.e-10)
+    assert np.all(result.imag >= 0.0)
+    # More porous grains are closer to vacuum
+    assert np.all(np.diff(np.abs(result[:,0] - 1.0)) < 0.0)
+
+# Components only need the basic API: cmtype, rho, rp, ip, and cm(x)
+class MinimalCm(object):
+    cmtype, rho = 'Minimal', 2.0
+    def rp(self, x):
+        return 1.0 + 1.e-3 * np.ones(np.shape(x))
+    def ip(self, x):
+        return 1.e-4 * np.ones(np.shape(x))
+    def cm(self, x):
+        return self.rp(x) + 1j * self.ip(x)
+
+def test_effective_medium_minimal():
+    sil = composition.CmSilicate()
+    test = composition.CmEffectiveMedium([sil, MinimalCm()], [0.5, 0.5])
+    assert np.shape(test.cm(ENERGY)) == (len(ENERGY),)
+    pure = composition.CmEffectiveMedium([MinimalCm(), composition.CmVacuum()], [1.0, 0.0])
+    assert np.all(np.abs(pure.cm(EN) - MinimalCm().cm(EN)) < 1.e-10)
+
+def test_bruggeman_condition():
+    sil, gra = composition.CmSilicate(), composition.CmGraphite()
+    vf = np.array([0.4, 0.6])
+    test = composition.CmEffectiveMedium([sil, gra], vf)
+    eps = test.cm(test.wavel)**2
+    eps_c = np.array([sil.cm(test.wavel)**2, gra.cm(test.wavel)**2])
+    cond = np.sum(vf.reshape(2,1) * (eps_c - eps) / (eps_c + 2.0*eps), axis=0)
+    assert np.all(np.abs(cond) < 1.e-10)
+
+# Test the Kramers-Kronig composition builder with a Lorentz oscillator,
+# for which the real part is known analytically
+def test_kramers_kronig():
+    energy = np.logspace(-2, 3, 20000)  # keV
+    m_true = np.sqrt(1.0 + 0.25 / (1.0 - energy**2 - 0.1j * energy))
+    test = composition.make_cm_kk(energy, imvals=m_true.imag, rho=RHO_TEST)
+    test_abstract_class(test)
+    assert test.rho == RHO_TEST
+    ii = (energy > 0.1) & (energy < 100.0)
+    assert np.all(np.abs(test.revals[ii] - m_true.real[ii]) < 0.01 * np.max(np.abs(m_true.real - 1.0)))
+
+    # Mass absorption coefficient input gives the same imaginary part
+    lam_cm = (energy * u.keV).to('cm', equivalencies=u.spectral()).value
+    mac = 4.0 * np.pi * m_true.imag / (lam_cm * RHO_TEST)
+    test2 = composition.make_cm_kk(energy * u.keV, mac=mac, rho=RHO_TEST)
+    assert np.all(percent_diff(test2.imvals[ii], test.imvals[ii]) <= 1.e-6)
+    assert np.all(np.abs(test2.revals - test.revals) < 1.e-8)
+
+def test_kramers_kronig_soft(capsys):
+    # Narrow resonance below 0.1 keV, in a table that extends to high energies
+    energy = np.logspace(-3, 4, 5000)  # keV
+    e0, gam = 0.03, 0.002
+    m_true = np.sqrt(1.0 + 0.25 * e0**2 / (e0**2 - energy**2 - 1j * gam * energy))
+    test = composition.make_cm_kk(energy, imvals=m_true.imag, rho=RHO_TEST)
+    ii = (energy > 0.005) & (energy < 1.0)
+    assert np.all(np.abs(test.revals[ii] - m_true.real[ii]) < 0.01 * np.max(np.abs(m_true.real - 1.0)))
+    assert 'WARNING' not in capsys.readouterr().out
+
+    # A grid that is coarser than the table gives a warning
+    composition.kk_real_part(energy, m_true.imag, npts=1000)
+    assert 'WARNING' in capsys.readouterr().out
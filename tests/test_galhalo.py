@@ -2,8 +2,10 @@ import pytest
 import numpy as np
 from scipy.integrate import trapz
 import astropy.units as u
+from astropy.io import fits
 
 from newdust.halos import *
+from newdust.halos import halo
 from newdust import grainpop
 from . import percent_diff
 
@@ -167,3 +169,194 @@ def test_halo_io(test):
     assert np.all(percent_diff(new_halo.taux,test.taux) < 0.01)
     assert np.all(percent_diff(new_halo.norm_int.flatten(),test.norm_int.flatten()) < 0.01)
     assert new_halo.lam.unit == 'keV'
+
+# Test halos for many sightlines from one scattering calculation
+def test_calculate_batch():
+    md_vals = np.array([1.0, 3.0]) * GPOP.md
+    test = ScreenGalHalo(EVALS, THVALS)
+    norm_int, taux = test.calculate_batch(GPOP, md_vals, x=0.5)
+    assert np.shape(norm_int) == (2, NE, NTH)
+    assert np.shape(taux) == (2, NE)
+
+    test.calculate(GPOP, x=0.5)
+    assert np.all(percent_diff(norm_int[1].value.flatten(), 3.0 * test.norm_int.value.flatten()) <= 1.e-10)
+    assert np.all(percent_diff(taux[0], test.taux) <= 1.e-10)
+
+    test = UniformGalHalo(EVALS, THVALS[::10])
+    norm_int, taux = test.calculate_batch(GPOP, md_vals, nx=50)
+    test.calculate(GPOP, nx=50)
+    assert np.all(percent_diff(norm_int[1].value.flatten(), 3.0 * test.norm_int.value.flatten()) <= 1.e-10)
+
+def test_halo_enclosed():
+    # The enclosed intensity is exact for a halo that is linear between the theta values
+    test = Halo(EVALS, THVALS)
+    test.norm_int = (1.e-3 + 2.e-7 * THVALS[np.newaxis,:] * EVALS[:,np.newaxis]) * u.Unit('arcsec^-2')
+    test.taux = np.ones(NE)
+    def exact(th):
+        a, b = 1.e-3, 2.e-7 * EVALS
+        # the intensity is constant inside the smallest theta value
+        disk = np.pi * THVALS[0]**2 * (a + b * THVALS[0])
+        return disk + 2.0 * np.pi * (a * (th**2 - THVALS[0]**2) / 2.0 + b * (th**3 - THVALS[0]**3) / 3.0)
+    for th in [THVALS[0], 3.3, THVALS[40], 5000.0, THVALS[-1]]:
+        assert np.all(percent_diff(test.enclosed(th), exact(th)) <= 1.e-10)
+    assert np.shape(test.enclosed([1.0, 2.0, 3.0])) == (NE, 3)
+    assert np.all(percent_diff(test.enclosed(1.0*u.arcmin), exact(60.0)) <= 1.e-10)
+    # constant inside the theta grid, and clipped to it outside
+    assert np.all(percent_diff(test.enclosed(0.01), np.pi * 0.01**2 * (1.e-3 + 2.e-7 * THVALS[0] * EVALS)) <= 1.e-10)
+    assert np.all(test.enclosed(0.0) == 0.0)
+    assert np.all(test.enclosed(1.e5) == test.enclosed(THVALS[-1]))
+
+    # a flat profile has enclosed intensity pi theta^2, also inside the theta grid,
+    # so the sampled radii are 2 sqrt(u) for theta values out to 2 arcsec
+    flat = Halo(EVALS, np.array([1.0, 1.5, 2.0]))
+    flat.norm_int = np.ones((NE, 3)) * u.Unit('arcsec^-2')
+    th_asec, norm_int, cum_int = flat._enclosed_table()
+    uniform = np.linspace(0.0, 1.0, 101)
+    radius  = halo._sample_radius(th_asec, norm_int, cum_int, np.zeros(101, dtype=int), uniform)
+    assert np.all(np.abs(radius - 2.0 * np.sqrt(uniform)) < 1.e-6)
+
+    # a new intensity replaces the table
+    test.norm_int = 2.0 * test.norm_int
+    assert np.all(percent_diff(test.enclosed(5000.0), 2.0 * exact(5000.0)) <= 1.e-10)
+
+@pytest.mark.parametrize('test', [galhalo.UniformGalHalo(EVALS, THVALS), galhalo.ScreenGalHalo(EVALS, THVALS)])
+def test_halo_ecf(test):
+    test.calculate(GPOP)
+    test.calculate_intensity(FABS)
+    radii = np.array([1.0, 10.0, 100.0, 1000.0])
+    frac  = test.frac_halo(radii)
+    assert np.shape(frac) == (NE, len(radii))
+    assert np.all(np.diff(frac, axis=1) > 0.0)
+    # linear interpolation between the theta values is a bit above trapz, see test_halos_general
+    assert np.all(percent_diff(test.frac_halo(THVALS[-1]), np.ones(NE)) <= 0.06)
+    for i, th in enumerate(radii):
+        assert np.all(percent_diff(test.frac_halo(th), frac[:,i]) <= 1.e-10)
+    # the energy-integrated fraction is the flux weighted sum of the fractions
+    ecf = test.ecf(radii)
+    assert np.all(percent_diff(ecf, np.sum(FABS[:,np.newaxis] * test.taux[:,np.newaxis] * frac, axis=0) / np.sum(FABS * test.taux)) <= 1.e-10)
+    assert percent_diff(test.ecf(100.0*u.arcsec), ecf[2]) <= 1.e-10
+    # annulus spectra
+    spec = test.annulus(radii[:-1], radii[1:])
+    assert np.shape(spec) == (NE, len(radii) - 1)
+    assert np.all(percent_diff(spec.flatten(), (FABS[:,np.newaxis] * test.taux[:,np.newaxis] * np.diff(frac, axis=1)).flatten()) <= 1.e-8)
+
+def _write_arf(filename, area=400.0):
+    elo = np.linspace(0.05, 12.0, 500)
+    cols = [fits.Column(name='ENERG_LO', array=elo, format='E', unit='keV'),
+            fits.Column(name='ENERG_HI', array=elo + (elo[1] - elo[0]), format='E', unit='keV'),
+            fits.Column(name='SPECRESP', array=np.full(len(elo), area), format='E', unit='cm**2')]
+    hdu = fits.BinTableHDU.from_columns(cols)
+    hdu.header['EXTNAME'] = 'SPECRESP'
+    fits.HDUList([fits.PrimaryHDU(), hdu]).writeto(filename, overwrite=True)
+
+def test_fake_events(tmp_path, monkeypatch):
+    arf = str(tmp_path / 'test.arf')
+    _write_arf(arf)
+    test = galhalo.ScreenGalHalo(EVALS, THVALS)
+    test.calculate(GPOP, x=0.5)
+    exposure = 10.0
+    events = test.fake_events(arf, FABS, exposure, seed=42, save_file=str(tmp_path / 'evt.fits'))
+
+    # number of events, compared to the expected halo counts within the theta grid
+    expected = FABS * 400.0 * exposure * test.enclosed(THVALS[-1])
+    assert np.abs(len(events) - np.sum(expected)) < 5.0 * np.sqrt(np.sum(expected))
+    assert np.all(np.isin(events['ENERGY'], EVALS.astype(np.float32)))
+
+    # the radial distribution follows the enclosed intensity
+    radius = np.sqrt(events['X']**2 + events['Y']**2) * 0.5  # arcsec
+    for th in [10.0, 100.0, 1000.0]:
+        frac = np.sum(expected * test.enclosed(th) / test.enclosed(THVALS[-1])) / np.sum(expected)
+        assert np.abs(np.mean(radius < th) - frac) < 5.0 * np.sqrt(frac * (1.0 - frac) / len(events))
+
+    # the same seed gives the same events, and the events are saved
+    again = test.fake_events(arf, FABS, exposure, seed=42)
+    assert np.all(again['X'] == events['X']) and np.all(again['ENERGY'] == events['ENERGY'])
+    # independent of the number of events sampled at a time
+    monkeypatch.setattr(halo, 'EVENT_CHUNK', 1000)
+    again = test.fake_events(arf, FABS, exposure, seed=42)
+    assert np.all(again['X'] == events['X']) and np.all(again['ENERGY'] == events['ENERGY'])
+    other = test.fake_events(arf, FABS, exposure, seed=43)
+    assert len(other) != len(events) or np.any(other['X'] != events['X'])
+    saved = fits.open(str(tmp_path / 'evt.fits'))['EVENTS']
+    assert len(saved.data) == len(events)
+    assert saved.header['EXPOSURE'] == exposure
+
+    # only the energies in range
+    some = test.fake_events(arf, FABS, exposure, lmin=1.0, lmax=5.0, seed=np.random.SeedSequence(7))
+    assert np.all(some['ENERGY'] >= np.float32(1.0)) and np.all(some['ENERGY'] <= np.float32(5.0))
+
+def test_fake_image(tmp_path):
+    arf = str(tmp_path / 'test.arf')
+    _write_arf(arf)
+    theta = np.logspace(-1, np.log10(40.0), NTH)  # arcsec, smaller than the image
+    test = galhalo.ScreenGalHalo(EVALS, theta)
+    test.calculate(GPOP, x=0.5)
+    exposure, num_pix = 1.e3, [200, 160]
+    image = test.fake_image(arf, FABS, exposure, num_pix=num_pix, seed=1,
+                            save_file=str(tmp_path / 'img.fits'))
+    assert np.shape(image) == (160, 200)
+    expected = np.sum(FABS * 400.0 * exposure * test.enclosed(theta[-1]))
+    assert np.abs(np.sum(image) - expected) < 0.01 * expected + 5.0 * np.sqrt(expected)
+
+    # nothing outside of the largest theta value
+    yy, xx = np.indices(np.shape(image))
+    radius = np.sqrt((xx - 100)**2 + (yy - 80)**2) * 0.5
+    assert np.all(image[radius > theta[-1]] == 0.0)
+
+    # reproducible, and the same when the rows are evaluated in smaller blocks
+    assert np.all(test.fake_image(arf, FABS, exposure, num_pix=num_pix, seed=1) == image)
+    profile = np.dot(FABS * 400.0 * exposure, test.norm_int.value)
+    assert np.all(halo._fake_radial_image(theta, profile, 0.5, num_pix, seed=1, row_chunk=7) == image)
+    assert np.all(fits.open(str(tmp_path / 'img.fits'))[0].data == image)
+
+    # only the energies in range
+    some = test.fake_image(arf, FABS, exposure, num_pix=num_pix, lmin=1.0, lmax=5.0, seed=1)
+    use  = (EVALS >= 1.0) & (EVALS <= 5.0)
+    expected = np.sum((FABS * 400.0 * exposure * test.enclosed(theta[-1]))[use])
+    assert np.abs(np.sum(some) - expected) < 0.01 * expected + 5.0 * np.sqrt(expected)
+
+    # a constant light curve gives the same halo
+    test.calculate_intensity(FABS)
+    time = np.linspace(0.0, 100.0, 20)
+    var_image = test.fake_variable_image(time, np.ones(20), arf, exposure=exposure,
+                                         num_pix=num_pix, seed=2)
+    assert np.shape(var_image) == (160, 200)
+    assert np.abs(np.sum(var_image) - np.sum(image)) < 0.01 * expected + 10.0 * np.sqrt(np.sum(image))
+
+def _gaussian(sigma, theta):
+    return np.exp(-theta**2 / (2.0 * sigma**2)) / (2.0 * np.pi * sigma**2)
+
+def test_convolve_psf():
+    # Gaussian halos convolved with a Gaussian PSF are Gaussian
+    theta = np.logspace(-2, 3, 500)  # arcsec
+    sigma = np.array([2.0, 3.0, 5.0])
+    test  = Halo(EVALS[:3], theta)
+    test.norm_int = 0.1 * _gaussian(sigma[:,np.newaxis], theta[np.newaxis,:]) * u.Unit('arcsec^-2')
+    test.taux = 0.1 * np.ones(3)
+    near  = (theta < 15.0)
+
+    conv = test.convolve_psf(theta, 7.0 * _gaussian(1.0, theta))  # normalized by convolve_psf
+    assert isinstance(conv, Halo) and conv is not test
+    assert conv.norm_int.unit == 'arcsec^-2'
+    assert np.all(conv.taux == test.taux)
+    expected = 0.1 * _gaussian(np.sqrt(sigma**2 + 1.0)[:,np.newaxis], theta[np.newaxis,:])
+    assert np.all(np.abs(conv.norm_int.value - expected)[:,near] <= 1.e-3 * np.max(expected))
+
+    # an energy dependent PSF
+    psf_sigma = np.array([0.5, 1.0, 2.0])
+    conv = test.convolve_psf(theta * u.arcsec, _gaussian(psf_sigma[:,np.newaxis], theta[np.newaxis,:]))
+    expected = 0.1 * _gaussian(np.sqrt(sigma**2 + psf_sigma**2)[:,np.newaxis], theta[np.newaxis,:])
+    assert np.all(np.abs(conv.norm_int.value - expected)[:,near] <= 1.e-3 * np.max(expected))
+
+    # the halo flux is conserved, and a narrow PSF does not change the outer halo
+    theta = np.logspace(-1, 4, 400)  # arcsec
+    scr = galhalo.ScreenGalHalo(EVALS, theta)
+    scr.calculate(GPOP, x=0.5)
+    scr.calculate_intensity(FABS)
+    conv = scr.convolve_psf(theta, _gaussian(0.5, theta))
+    assert np.all(percent_diff(conv.enclosed(theta[-1]), scr.enclosed(theta[-1])) <= 0.005)
+    outer = (theta > 10.0) & (theta < theta[-1])
+    peak  = np.max(scr.norm_int.value, axis=1)[:,np.newaxis]
+    assert np.all(np.abs(conv.norm_int.value - scr.norm_int.value)[:,outer] <= 1.e-3 * peak)
+    assert np.all(conv.norm_int.value >= 0.0)
+    assert conv.intensity is not None
@@ -11,7 +11,7 @@ RHO = 3.0    # g cm^-3
 SDEFAULT = 'Powerlaw'
 CDEFAULT = 'Silicate'
 
-ALLOWED_SIZES = ['Grain','Powerlaw','ExpCutoff','Astrodust']
+ALLOWED_SIZES = ['Grain','Powerlaw','ExpCutoff','Astrodust','WD01']
 ALLOWED_COMPS = ['Drude','Silicate','Graphite']
 
 # Test that the helper function runs on all types
@@ -71,3 +71,48 @@ def test_ndens():
                 nd1 = trapz(test1.ndens, test1.a.to('micron').value)
                 nd2 = trapz(test2.ndens, test2.a.to('micron').value)
             assert percent_diff(nd2, 0.5 * nd1) <= 0.01
+
+# Test that derived quantities are stored, and recomputed when the inputs change
+def test_cached_quantities():
+    test = GrainDist('Powerlaw', 'Silicate', md=MD)
+    nd = test.ndens
+    assert test.ndens is nd
+    assert test.cgeo is test.cgeo
+
+    test.md = MD2
+    assert np.all(percent_diff(test.ndens, 2.0 * nd) <= 1.e-6)
+
+    rho0 = test.rho
+    test.comp = composition.CmSilicate(rho=2.0 * rho0)
+    assert np.all(percent_diff(test.ndens, nd) <= 1.e-6)
+    assert np.all(percent_diff(test.mdens, 2.0 * nd * test.vol * rho0) <= 1.e-6)
+    test.comp.rho = rho0
+    assert np.all(percent_diff(test.ndens, 2.0 * nd) <= 1.e-6)
+
+    test.size.a = test.a[::2]
+    assert len(test.ndens) == len(test.a)
+    assert len(test.cgeo) == len(test.a)
+
+    test.size = sizedist.Grain()
+    assert len(test.ndens) == 1
+
+def test_astrodust_shape():
+    test = sizedist.Astrodust()
+    a_angs = test.a.to('angstrom').value
+    ln_a = np.log(a_angs)
+    a_um = test.a.to('micron').value
+    expected = test.B / a_um * np.exp(-np.log(a_angs / 63.8)**2 / (2 * test.sigma**2)) + \
+        test.A0 / a_um * np.exp(test.A1*ln_a + test.A2*ln_a**2 + test.A3*ln_a**3 +
+                                test.A4*ln_a**4 + test.A5*ln_a**5)
+    assert np.all(percent_diff(test._adep(), expected) <= 1.e-10)
+    assert test._adep() is test._adep()
+
+# WD01 takes its grain type from the composition, and its own maximum grain radius
+def test_WD01_grain():
+    sil = GrainDist('WD01', 'Silicate')
+    assert sil.size.grain == 'Silicate'
+    assert percent_diff(sil.a.to('micron').value[-1], sizedist.wd01.AMAX) <= 1.e-10
+    assert GrainDist('WD01', 'Graphite').size.grain == 'Graphite'
+    assert GrainDist('WD01', 'Silicate', amax=0.3).a.to('micron').value[-1] <= 0.3 * (1.0 + 1.e-10)
+    with pytest.raises(AssertionError):
+        GrainDist('WD01', 'Silicate', grain='Graphite')
@@ -166,3 +166,274 @@ def test_custom_SingleGrainPop():
     test  = SingleGrainPop(sdist, compo, 'RG')
     test  = SingleGrainPop('Powerlaw', compo, mscat)
     test  = SingleGrainPop(sdist, 'Silicate', mscat)
+
+# Test that a Gauss-Legendre size grid reproduces the optical depth of a fine grid
+def test_quad_grid():
+    fine = SingleGrainPop(graindist.sizedist.Powerlaw(log=True, na=300), 'Drude', 'RG')
+    quad = SingleGrainPop(graindist.sizedist.Powerlaw(log=True, na=15, quad='gauss'), 'Drude', 'RG')
+    fine.calculate_ext(EVALS, theta=THETA)
+    quad.calculate_ext(EVALS, theta=THETA)
+    assert np.all(percent_diff(quad.tau_ext, fine.tau_ext) <= 0.01)
+    # compare at the small angles where the RG cross-section is well resolved
+    small = (THETA < 1.e-3)
+    assert np.all(percent_diff(quad.int_diff[:,small].value.flatten(),
+                               fine.int_diff[:,small].value.flatten()) <= 0.01)
+
+# Test that a mixture needs one calculation, and gives the sum of its components
+def test_mixture_ext():
+    pl1 = graindist.sizedist.Powerlaw(amin=0.005, amax=0.3, log=True)
+    pl2 = graindist.sizedist.Powerlaw(amin=0.1, amax=1.0, p=2.0, log=True)
+    mix = SingleGrainPop(graindist.sizedist.Mixture([pl1, pl2], [0.7, 0.3]), 'Drude', 'RG', md=MD)
+    mix.calculate_ext(EVALS, theta=THETA)
+
+    tau_c = [np.dot(mix.scatm.qext, nd * mix.cgeo * mix.wts)
+             for nd in mix.size.ndens_components(MD, mix.rho, mix.shape)]
+    assert np.all(percent_diff(mix.tau_ext, tau_c[0] + tau_c[1]) <= 1.e-10)
+
+# Test that the per-radius differential cross-section can be dropped
+def test_diff():
+    test = SingleGrainPop('Powerlaw', 'Drude', 'RG', md=MD)
+    test.calculate_ext(EVALS, theta=THETA)
+    int_diff, diff = test.int_diff, test.diff
+    assert np.shape(diff) == (NE, NA, NTH)
+    assert np.all(percent_diff(diff[:,:,0].value.flatten(),
+                               (test.scatm.diff[:,:,0] * test.cgeo).flatten()) <= 1.e-10)
+
+    test.calculate_ext(EVALS, theta=THETA, outputs='int_diff')
+    assert test.diff is None
+    assert np.all(percent_diff(test.int_diff.value.flatten(), int_diff.value.flatten()) <= 1.e-10)
+
+# Test that identical scattering calculations are only run once
+def test_GrainPop_unique():
+    gp1 = SingleGrainPop('Powerlaw', 'Drude', 'RG', md=MD)
+    gp2 = SingleGrainPop('Powerlaw', 'Drude', 'RG', md=2.0*MD)
+    gp3 = SingleGrainPop('Powerlaw', 'Drude', 'RG', md=3.0*MD)
+    gp4 = SingleGrainPop('Powerlaw', 'Drude', 'RG', md=MD, rho=2.0)
+    test = GrainPop([gp2, gp3, gp4])
+    test.calculate_ext(EVALS, theta=THETA)
+    assert gp3.scatm.qext is gp2.scatm.qext
+    assert gp4.scatm.qext is not gp2.scatm.qext  # different optical constants
+
+    gp1.calculate_ext(EVALS, theta=THETA)
+    assert np.all(percent_diff(gp2.tau_ext, 2.0 * gp1.tau_ext) <= 1.e-10)
+    assert np.all(percent_diff(gp3.tau_ext, 3.0 * gp1.tau_ext) <= 1.e-10)
+    assert np.all(percent_diff(gp3.int_diff.value.flatten(), 3.0 * gp1.int_diff.value.flatten()) <= 1.e-10)
+
+    # compare with separate calculations
+    test2 = GrainPop([SingleGrainPop('Powerlaw', 'Drude', 'RG', md=2.0*MD),
+                      SingleGrainPop('Powerlaw', 'Drude', 'RG', md=3.0*MD)])
+    test2.calculate_ext(EVALS, theta=THETA, unique=False)
+    assert test2[1].scatm.qext is not test2[0].scatm.qext
+    assert np.all(percent_diff(test2[1].tau_ext, gp3.tau_ext) <= 1.e-10)
+
+# Test that running the grain populations concurrently gives the same answer
+@pytest.mark.parametrize('executor', ['thread', 'process'])
+def test_GrainPop_executor(executor):
+    def make_test():
+        return GrainPop([SingleGrainPop('Powerlaw', 'Drude', 'RG', md=MD),
+                         SingleGrainPop('ExpCutoff', 'Drude', 'RG', md=MD),
+                         SingleGrainPop('Powerlaw', 'Drude', 'RG', md=MD, rho=2.0)])
+    serial = make_test()
+    serial.calculate_ext(EVALS, theta=THETA)
+    test = make_test()
+    test.calculate_ext(EVALS, theta=THETA, executor=executor, max_workers=2)
+    assert np.all(percent_diff(test.tau_ext, serial.tau_ext) <= 1.e-10)
+    for i in range(3):
+        assert np.all(percent_diff(test[i].int_diff.value.flatten(),
+                                   serial[i].int_diff.value.flatten()) <= 1.e-10)
+
+# Test that extending the energy grid only calculates the new values
+@pytest.mark.parametrize('executor', [None, 'thread'])
+def test_extend(executor):
+    e_all = np.sort(np.append(EVALS, [0.25, 2.5]))
+    full  = GrainPop([SingleGrainPop('Powerlaw', 'Drude', 'RG', md=MD),
+                      SingleGrainPop('Powerlaw', 'Drude', 'RG', md=2.0*MD)])
+    full.calculate_ext(e_all, theta=THETA)
+
+    test = GrainPop([SingleGrainPop('Powerlaw', 'Drude', 'RG', md=MD),
+                     SingleGrainPop('Powerlaw', 'Drude', 'RG', md=2.0*MD)])
+    test.calculate_ext(EVALS, theta=THETA)
+    assert test[0]._missing_lam(e_all, THETA).value.tolist() == [0.25, 2.5]
+    test.calculate_ext(e_all[::-1], theta=THETA, extend=True, executor=executor)
+
+    assert np.all(percent_diff(test.lam.value, e_all) <= 1.e-10)
+    assert np.all(percent_diff(test.tau_ext, full.tau_ext) <= 1.e-10)
+    for i in range(2):
+        assert np.shape(test[i].diff) == (len(e_all), NA, NTH)
+        assert np.all(percent_diff(test[i].int_diff.value.flatten(),
+                                   full[i].int_diff.value.flatten()) <= 1.e-10)
+
+    # nothing new to calculate
+    test[0].calculate_ext(EVALS, theta=THETA, extend=True)
+    assert len(test[0].lam) == len(e_all)
+
+# Test that many sightlines can be evaluated from one extinction calculation
+def test_batch_sightlines():
+    gp1 = SingleGrainPop('Powerlaw', 'Drude', 'RG', md=MD)
+    gp2 = SingleGrainPop('ExpCutoff', 'Drude', 'RG', md=3.0*MD)
+    test = GrainPop([gp1, gp2])
+    test.calculate_ext(EVALS, theta=THETA)
+
+    md_vals = np.array([1.0, 2.0, 4.0]) * MD
+    # default weights are the mass fractions of the GrainPop
+    tau = test.batch_tau(4.0 * md_vals)
+    assert np.shape(tau) == (3, NE)
+    assert np.all(percent_diff(tau[0], test.tau_ext) <= 1.e-10)
+
+    weights = np.array([[1.0, 0.0], [0.5, 0.5], [0.0, 1.0]])
+    tau = test.batch_tau(md_vals, weights=weights, keyword='sca')
+    assert np.all(percent_diff(tau[0], gp1.tau_sca) <= 1.e-10)
+    assert np.all(percent_diff(tau[1], gp1.tau_sca * 1.0 + gp2.tau_sca / 3.0) <= 1.e-10)
+    assert np.all(percent_diff(tau[2], gp2.tau_sca * 4.0 / 3.0) <= 1.e-10)
+
+    int_diff = test.batch_int_diff(md_vals, weights=weights)
+    assert np.shape(int_diff) == (3, NE, NTH)
+    assert np.all(percent_diff(int_diff[2].value.flatten(),
+                               4.0 / 3.0 * gp2.int_diff.value.flatten()) <= 1.e-10)
+
+    # doubling the material density halves the number of grains
+    tau_rho = gp1.batch_tau(md_vals, rho=2.0 * gp1.rho)
+    assert np.all(percent_diff(tau_rho[1], gp1.tau_ext) <= 1.e-10)
+
+# Test that streaming the calculation in blocks of energy gives the same answer
+def test_iter_ext():
+    e_all = np.linspace(0.3, 3.0, 7)
+    gp1 = SingleGrainPop('Powerlaw', 'Drude', 'RG', md=MD)
+    gp2 = SingleGrainPop('Powerlaw', 'Drude', 'RG', md=2.0*MD)
+    gp3 = SingleGrainPop('ExpCutoff', 'Drude', 'RG', md=MD)
+    full = GrainPop([gp1, gp2, gp3])
+    full.calculate_ext(e_all, theta=THETA)
+
+    test = GrainPop([SingleGrainPop('Powerlaw', 'Drude', 'RG', md=MD),
+                     SingleGrainPop('Powerlaw', 'Drude', 'RG', md=2.0*MD),
+                     SingleGrainPop('ExpCutoff', 'Drude', 'RG', md=MD)])
+    chunks = list(test.iter_ext(e_all, chunk_size=3, theta=THETA))
+    assert [len(c['lam']) for c in chunks] == [3, 3, 1]
+    assert test.lam is None and test[0].tau_ext is None  # nothing stored
+    tau_ext  = np.concatenate([c['tau_ext'] for c in chunks])
+    int_diff = np.concatenate([c['int_diff'].value for c in chunks], axis=0)
+    assert np.all(percent_diff(tau_ext, full.tau_ext) <= 1.e-10)
+    total_diff = gp1.int_diff + gp2.int_diff + gp3.int_diff
+    assert np.all(percent_diff(int_diff.flatten(), total_diff.value.flatten()) <= 1.e-10)
+
+    # a single grain population
+    chunks = list(test[2].iter_ext(e_all, chunk_size=4, theta=THETA))
+    assert np.all(percent_diff(np.concatenate([c['tau_abs'] for c in chunks]), gp3.tau_abs) <= 1.e-10)
+    assert test[2].scatm.qext is None
+
+# Test that only the requested outputs are calculated and stored
+def test_outputs():
+    full = SingleGrainPop('Powerlaw', 'Drude', 'RG', md=MD)
+    full.calculate_ext(EVALS, theta=THETA)
+
+    test = SingleGrainPop('Powerlaw', 'Drude', 'RG', md=MD)
+    test.calculate_ext(EVALS, theta=THETA, outputs='int_diff')
+    assert test.diff is None and test.scatm.diff is None
+    assert np.all(percent_diff(test.int_diff.value.flatten(), full.int_diff.value.flatten()) <= 1.e-10)
+
+    # a scattering model that ignores `outputs` does not keep diff either
+    class FullRG(scatteringmodel.RGscattering):
+        def calculate(self, lam, a, cm, theta=0.0, **kwargs):
+            scatteringmodel.RGscattering.calculate(self, lam, a, cm, theta=theta)
+    test = SingleGrainPop('Powerlaw', 'Drude', FullRG(), md=MD)
+    test.calculate_ext(EVALS, theta=THETA, outputs='int_diff')
+    assert test.diff is None and test.scatm.diff is None
+    assert np.all(percent_diff(test.int_diff.value.flatten(), full.int_diff.value.flatten()) <= 1.e-10)
+
+    test.calculate_ext(EVALS, theta=THETA, outputs='tau')
+    assert test.diff is None and test.int_diff is None and test.scatm.diff is None
+    assert np.all(percent_diff(test.tau_ext, full.tau_ext) <= 1.e-10)
+    assert np.all(percent_diff(test.tau_sca, full.tau_sca) <= 1.e-10)
+
+    # passed through GrainPop, including to populations that share a calculation
+    gpop = GrainPop([SingleGrainPop('Powerlaw', 'Drude', 'RG', md=MD),
+                     SingleGrainPop('Powerlaw', 'Drude', 'RG', md=2.0*MD)])
+    gpop.calculate_ext(EVALS, theta=THETA, outputs='tau')
+    for gp in gpop.gpoplist:
+        assert gp.int_diff is None and gp.diff is None
+    assert gpop.tau_ext is not None
+    with pytest.raises(AssertionError, match="outputs='int_diff'"):
+        gpop.batch_int_diff(MD)
+
+    # extending the grid without diff drops it for the old values too
+    test = SingleGrainPop('Powerlaw', 'Drude', 'RG', md=MD)
+    test.calculate_ext(EVALS, theta=THETA)
+    test.calculate_ext(np.append(EVALS, 2.5), theta=THETA, extend=True, outputs='tau')
+    assert test.scatm.diff is None and len(test.tau_ext) == NE + 1
+
+# Test that int_diff summed by the scattering model is only shared by proportional size distributions
+@pytest.mark.parametrize('executor', [None, 'thread'])
+def test_outputs_int_diff(executor):
+    def make_test():
+        return GrainPop([SingleGrainPop('Powerlaw', 'Drude', 'RG', md=MD),
+                         SingleGrainPop('Powerlaw', 'Drude', 'RG', md=3.0*MD),
+                         SingleGrainPop('ExpCutoff', 'Drude', 'RG', md=MD)])
+    full = make_test()
+    full.calculate_ext(EVALS, theta=THETA)
+    test = make_test()
+    test.calculate_ext(EVALS, theta=THETA, outputs='int_diff', executor=executor)
+    assert test[1].scatm.int_diff is test[0].scatm.int_diff
+    assert test[2].scatm.int_diff is not test[0].scatm.int_diff
+    for i in range(3):
+        assert test[i].diff is None
+        assert np.all(percent_diff(test[i].int_diff.value.flatten(),
+                                   full[i].int_diff.value.flatten()) <= 1.e-10)
+
+# Test that many porosities need only one scattering calculation
+@pytest.mark.parametrize('stype', ALLOWED_SCATM)
+def test_calculate_ext_vfrac(stype):
+    sil, vac = graindist.composition.CmSilicate(), graindist.composition.CmVacuum()
+    eff = graindist.composition.CmEffectiveMedium([sil, vac], [1.0, 0.0])
+    vfrac = np.array([[1.0 - p, p] for p in [0.0, 0.3, 0.6]])
+    lam, outputs = EVALS, 'int_diff'
+    if stype == 'Mie':
+        lam, outputs = LAMVALS * u.angstrom, 'tau'
+    test = SingleGrainPop('Powerlaw', eff, stype, md=MD, na=20)
+    result = test.calculate_ext_vfrac(lam, vfrac, theta=THETA, outputs=outputs)
+    assert np.shape(result['tau_ext']) == (len(vfrac), NE)
+    assert test.tau_ext is None and test.scatm.qext is None  # nothing stored
+
+    for i in range(len(vfrac)):
+        gp = SingleGrainPop('Powerlaw', eff.at_vfrac(vfrac[i]), stype, md=MD, na=20)
+        gp.calculate_ext(lam, theta=THETA, outputs=outputs)
+        assert np.all(percent_diff(result['tau_ext'][i], gp.tau_ext) <= 1.e-10)
+        assert np.all(percent_diff(result['tau_abs'][i], gp.tau_abs) <= 1.e-10)
+        if outputs == 'int_diff':
+            assert np.all(percent_diff(result['int_diff'][i].value.flatten(),
+                                       gp.int_diff.value.flatten()) <= 1.e-10)
+
+def test_prune():
+    evals = np.array([0.3, 0.6, 1.0])  # keV
+    na    = 30
+    full  = SingleGrainPop('Powerlaw', 'Silicate', 'Mie', md=MD, na=na, p=4.5)
+    full.calculate_ext(evals, outputs='tau')
+    assert full.prune_mask is None and full.prune_err is None
+
+    test = SingleGrainPop('Powerlaw', 'Silicate', 'Mie', md=MD, na=na, p=4.5)
+    test.calculate_ext(evals, outputs='tau', prune=0.01)
+    assert np.shape(test.prune_mask) == (len(evals), na)
+    assert np.sum(~test.prune_mask) > 0
+    assert np.all(np.abs(test.tau_ext - full.tau_ext) <= test.prune_err)
+    assert np.all(test.prune_err <= 0.01 * 6.0 * np.sum(test.ndens * test.cgeo * test.wts))
+
+    test.calculate_ext(evals, outputs='tau', prune=0.0)
+    assert np.all(test.prune_mask) and np.all(test.prune_err == 0.0)
+    assert np.all(percent_diff(test.tau_ext, full.tau_ext) <= 1.e-10)
+
+    # the estimate is not a bound where |m-1| is large
+    with pytest.raises(AssertionError, match='m-1'):
+        test.calculate_ext(LAMVALS * u.angstrom, outputs='tau', prune=0.01)
+
+    # passed through GrainPop, where each population gets its own cells;
+    # for RG the estimate is exact
+    gpop = GrainPop([SingleGrainPop('Powerlaw', 'Drude', 'RG', md=MD),
+                     SingleGrainPop('Powerlaw', 'Drude', 'RG', md=MD, p=4.5)])
+    gpop.calculate_ext(EVALS, theta=THETA, prune=0.01)
+    for gp in gpop.gpoplist:
+        full = SingleGrainPop('Powerlaw', 'Drude', 'RG', md=MD, p=gp.size.p)
+        full.calculate_ext(EVALS, theta=THETA)
+        assert np.shape(gp.prune_mask) == (NE, NA)
+        assert np.all(percent_diff(full.tau_ext - gp.tau_ext, gp.prune_err) <= 1.e-6)
+        assert np.all(gp.diff[~gp.prune_mask] == 0.0)
+    with pytest.raises(AssertionError):
+        gpop.calculate_ext(EVALS, theta=THETA, prune=0.01, extend=True)
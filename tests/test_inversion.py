@@ -0,0 +1,40 @@
+import pytest
+import numpy as np
+import astropy.units as u
+
+from newdust.grainpop import SingleGrainPop
+from newdust.graindist import sizedist
+from newdust.inversion import invert_tau
+from . import percent_diff
+
+MD    = 1.e-5  # g cm^-2
+WAVEL = np.logspace(-1, np.log10(2.0), 25) * u.micron
+ALPHAS = np.logspace(-4, 0, 5)
+
+def test_invert_tau():
+    gp = SingleGrainPop(sizedist.Powerlaw(amin=0.005, amax=0.5, na=40, log=True), 'Silicate', 'Mie', md=MD)
+    gp.calculate_ext(WAVEL, outputs='tau')
+    result = invert_tau(gp, gp.tau_ext, sigma=0.01*gp.tau_ext, alphas=ALPHAS)
+
+    assert np.shape(result['ndens']) == (len(ALPHAS), len(gp.a))
+    assert np.all(result['ndens'] >= 0.0)
+    # weak regularization reproduces the data and the dust mass
+    assert np.all(percent_diff(result['tau'][0], gp.tau_ext) <= 0.01)
+    assert percent_diff(result['md'][0], MD) <= 0.1
+    # stronger regularization gives smoother solutions that fit worse
+    assert np.all(np.diff(result['rough']) < 0.0)
+    assert np.all(np.diff(result['chi2']) > 0.0)
+
+    # the solutions are returned as tabulated size distributions
+    sd = result['sizedist'][0]
+    assert np.all(percent_diff(sd.ndens(result['md'][0], gp.rho), result['ndens'][0]) <= 1.e-6)
+
+# The non-negativity constraint is active for a size distribution that stops inside the grid
+def test_invert_tau_nonneg():
+    gp = SingleGrainPop(sizedist.Powerlaw(amin=0.005, amax=0.5, na=40, log=True), 'Silicate', 'Mie', md=MD)
+    gp.calculate_ext(WAVEL, outputs='tau')
+    nd_true = gp.ndens * (gp.a.to('micron').value <= 0.1)
+    tau = np.dot(gp.scatm.qext, nd_true * gp.cgeo * gp.wts)
+    result = invert_tau(gp, tau, sigma=0.01*tau, alphas=[1.e-4])
+    assert np.all(result['ndens'] >= 0.0)
+    assert np.all(percent_diff(result['tau'][0], tau) <= 0.01)
@@ -0,0 +1,112 @@
+import os
+import pytest
+import numpy as np
+import astropy.units as u
+from astropy.io import fits
+
+from newdust.halos import *
+from newdust import grainpop
+from . import percent_diff
+
+NE, NCHAN = 60, 40
+ELO  = np.linspace(0.3, 6.0, NE + 1)[:-1]  # keV
+EHI  = np.linspace(0.3, 6.0, NE + 1)[1:]
+AREA = 300.0 + 50.0 * np.sin(ELO)  # cm^2
+CHAN_EDGES = np.linspace(0.2, 6.2, NCHAN + 1)
+
+def _dense_rmf():
+    # Gaussian redistribution with a 0.2 keV width, normalized for each energy bin
+    emid = 0.5 * (ELO + EHI)
+    cmid = 0.5 * (CHAN_EDGES[1:] + CHAN_EDGES[:-1])
+    resp = np.exp(-0.5 * ((cmid[np.newaxis,:] - emid[:,np.newaxis]) / 0.2)**2)
+    resp[resp < 1.e-3] = 0.0
+    return resp / np.sum(resp, axis=1)[:,np.newaxis]
+
+def _write_arf(filename, elo=ELO, ehi=EHI, area=AREA):
+    cols = [fits.Column(name='ENERG_LO', array=elo, format='E', unit='keV'),
+            fits.Column(name='ENERG_HI', array=ehi, format='E', unit='keV'),
+            fits.Column(name='SPECRESP', array=area, format='E', unit='cm**2')]
+    hdu = fits.BinTableHDU.from_columns(cols)
+    hdu.header['EXTNAME'] = 'SPECRESP'
+    fits.HDUList([fits.PrimaryHDU(), hdu]).writeto(filename, overwrite=True)
+
+def _write_rmf(filename, dense):
+    # One group of channels per energy bin, with channels numbered from 1
+    f_chan, n_chan, matrix = [], [], []
+    for row in dense:
+        nz = np.nonzero(row)[0]
+        f_chan.append(np.array([nz[0] + 1]))
+        n_chan.append(np.array([nz[-1] - nz[0] + 1]))
+        matrix.append(row[nz[0]:nz[-1]+1].astype(np.float32))
+    cols = [fits.Column(name='ENERG_LO', array=ELO, format='E', unit='keV'),
+            fits.Column(name='ENERG_HI', array=EHI, format='E', unit='keV'),
+            fits.Column(name='N_GRP', array=np.ones(NE, dtype=np.int16), format='I'),
+            fits.Column(name='F_CHAN', array=f_chan, format='PJ()'),
+            fits.Column(name='N_CHAN', array=n_chan, format='PJ()'),
+            fits.Column(name='MATRIX', array=matrix, format='PE()')]
+    mat = fits.BinTableHDU.from_columns(cols)
+    mat.header['EXTNAME'] = 'MATRIX'
+    ebo = fits.BinTableHDU.from_columns(
+          [fits.Column(name='CHANNEL', array=np.arange(1, NCHAN + 1), format='J'),
+           fits.Column(name='E_MIN', array=CHAN_EDGES[:-1], format='E', unit='keV'),
+           fits.Column(name='E_MAX', array=CHAN_EDGES[1:], format='E', unit='keV')])
+    ebo.header['EXTNAME'] = 'EBOUNDS'
+    fits.HDUList([fits.PrimaryHDU(), mat, ebo]).writeto(filename, overwrite=True)
+
+def test_read_response(tmp_path):
+    arf, rmf = str(tmp_path / 'test.arf'), str(tmp_path / 'test.rmf')
+    dense = _dense_rmf()
+    _write_arf(arf)
+    _write_rmf(rmf, dense)
+
+    rmf_data = read_rmf(rmf)
+    assert np.shape(rmf_data['matrix']) == (NE, NCHAN)
+    assert np.allclose(rmf_data['matrix'].toarray(), dense, rtol=1.e-6, atol=1.e-8)
+    assert np.all(percent_diff(rmf_data['e_min'], CHAN_EDGES[:-1].astype(np.float32)) <= 1.e-6)
+
+    # files are read once, until they change
+    assert read_rmf(rmf) is rmf_data
+    assert read_arf(arf) is read_arf(arf)
+    arf_data = read_arf(arf)
+    with pytest.raises(ValueError):
+        arf_data['specresp'][0] = 0.0
+    _write_arf(arf, area=2.0 * AREA)
+    os.utime(arf, ns=(0, os.stat(arf).st_mtime_ns + 10**9))
+    assert np.all(percent_diff(read_arf(arf)['specresp'], 2.0 * AREA.astype(np.float32)) <= 1.e-6)
+    clear_response_cache()
+    assert read_rmf(rmf) is not rmf_data
+
+def test_fold(tmp_path):
+    arf, rmf = str(tmp_path / 'test.arf'), str(tmp_path / 'test.rmf')
+    dense = _dense_rmf()
+    _write_arf(arf)
+    _write_rmf(rmf, dense)
+    resp  = Response(arf, rmf)
+    assert resp.nchan == NCHAN
+
+    # a spectrum on the response energies, one or several at once
+    flux = np.power(resp.energy.value, -2.0)  # phot/cm^2/s
+    area = AREA.astype(np.float32)
+    counts = resp.fold(flux, resp.energy, exposure=100.0)
+    assert np.shape(counts) == (NCHAN,)
+    assert np.all(percent_diff(counts, np.dot(flux * area, dense) * 100.0) <= 1.e-5)
+    both = resp.fold(np.array([flux, 2.0 * flux]).T, resp.energy.to('angstrom', equivalencies=u.spectral()), exposure=100.0)
+    assert np.shape(both) == (2, NCHAN)
+    assert np.all(percent_diff(both[1], 2.0 * counts) <= 1.e-10)
+
+    # without an RMF, there is one channel per energy bin
+    arf_only = Response(arf)
+    assert np.all(percent_diff(arf_only.fold(flux, arf_only.energy, exposure=100.0), flux * area * 100.0) <= 1.e-6)
+
+    # a scattering halo, folded for several annuli at once
+    halo = galhalo.ScreenGalHalo(resp.energy, np.logspace(-1, 4, 200))
+    halo.calculate(grainpop.make_MRN_RGDrude(), x=0.5)
+    halo.calculate_intensity(flux)
+    th_in, th_out = np.array([10.0, 50.0, 100.0]), np.array([50.0, 100.0, 500.0])
+    ann = resp.fold_annuli(halo, th_in, th_out, exposure=100.0)
+    assert np.shape(ann) == (3, NCHAN)
+    for i in range(3):
+        spec = halo.annulus(th_in[i], th_out[i])
+        assert np.all(percent_diff(ann[i], np.dot(spec * area, dense) * 100.0) <= 1.e-5)
+    # the RMF rows sum to one, so the total counts do not depend on it
+    assert np.all(percent_diff(np.sum(ann, axis=1), np.sum(arf_only.fold_annuli(halo, th_in, th_out, exposure=100.0), axis=1)) <= 1.e-5)
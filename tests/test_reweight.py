@@ -0,0 +1,72 @@
+import pytest
+import numpy as np
+
+from newdust.grainpop import SingleGrainPop
+from newdust.reweight import SizeReweight
+from newdust.graindist import sizedist
+from . import percent_diff
+
+MD     = 1.e-5  # g cm^-2
+EVALS  = np.logspace(-1, np.log10(3.0), 5)  # kev
+THETA  = np.logspace(-6, -3, 20)  # rad
+PVALS  = np.array([3.0, 3.5, 4.0])
+
+MASTER = sizedist.Powerlaw(log=True, na=30, quad='gauss')
+RW = SizeReweight(MASTER, 'Drude', stype='RG')
+RW.calculate_ext(EVALS, theta=THETA)
+
+def test_reweight_shapes():
+    nd = RW.ndens_powerlaw(MD, PVALS)
+    assert np.shape(nd) == (len(PVALS), len(RW.a))
+    assert np.shape(RW.tau_ext(nd)) == (len(PVALS), len(EVALS))
+    assert np.shape(RW.tau_ext(nd[0])) == (len(EVALS),)
+    assert np.shape(RW.int_diff(nd)) == (len(PVALS), len(EVALS), len(THETA))
+
+    # Every distribution contains the requested dust mass
+    mtot = np.sum(nd * RW.vol * RW.comp.rho * RW.wts, axis=1)
+    assert np.all(percent_diff(mtot, MD * np.ones(len(PVALS))) <= 1.e-6)
+
+@pytest.mark.parametrize('i', range(len(PVALS)))
+def test_reweight_powerlaw(i):
+    # Each row should agree with a full calculation on the same grid
+    nd   = RW.ndens_powerlaw(MD, PVALS)
+    test = SingleGrainPop(sizedist.Powerlaw(log=True, na=30, quad='gauss', p=PVALS[i]),
+                          'Drude', 'RG', md=MD)
+    test.calculate_ext(EVALS, theta=THETA)
+    assert np.all(percent_diff(RW.tau_ext(nd)[i], test.tau_ext) <= 1.e-6)
+    assert np.all(percent_diff(RW.tau_sca(nd)[i], test.tau_sca) <= 1.e-6)
+    assert np.all(percent_diff(RW.int_diff(nd)[i].value.flatten(),
+                               test.int_diff.value.flatten()) <= 1.e-6)
+
+def test_reweight_sizedist():
+    sd = sizedist.ExpCutoff(acut=0.05, log=True)
+    nd_sd  = RW.ndens_sizedist([sd, sd], [MD, 2.0*MD])
+    sd_um  = sd.a.to('micron').value
+    nd_exp = RW.ndens_expcutoff([MD, 2.0*MD], 3.5, 0.05, amin=sd_um[0], amax=sd_um[-1])
+    assert np.all(percent_diff(nd_sd.flatten(), nd_exp.flatten()) <= 1.e-6)
+    # the input size distribution is not changed
+    assert len(sd.a) == 100
+
+    # Truncated distributions are zero outside of [amin, amax]
+    nd = RW.ndens_powerlaw(MD, 3.5, amax=0.1)
+    assert np.all(nd[0][RW.a.to('micron').value > 0.1] == 0.0)
+
+# A size distribution narrower than the master grid keeps its own radius limits
+def test_reweight_sizedist_truncated():
+    sd = sizedist.Powerlaw(amin=0.05, amax=0.25)
+    nd = RW.ndens_sizedist(sd, MD)
+    a_um = RW.a.to('micron').value
+    outside = (a_um < 0.05) | (a_um > 0.25)
+    assert np.all(nd[0][outside] == 0.0)
+    nd_pl = RW.ndens_powerlaw(MD, 3.5, amin=0.05, amax=0.25)
+    assert np.all(percent_diff(nd[0], nd_pl[0]) <= 1.e-6)
+
+# The radius limits of a size distribution on a Gauss-Legendre grid are not on its grid
+def test_reweight_sizedist_gauss():
+    fine = SizeReweight(sizedist.Powerlaw(amin=0.005, amax=0.3, log=True, na=200), 'Drude', stype='RG')
+    sd = sizedist.Powerlaw(amin=0.005, amax=0.3, na=20, quad='gauss')
+    assert sd.a.to('micron').value[0] > 0.005
+    nd = fine.ndens_sizedist(sd, MD)
+    nd_pl = fine.ndens_powerlaw(MD, 3.5, amin=0.005, amax=0.3)
+    assert np.all(nd[0] > 0.0)
+    assert np.all(percent_diff(nd[0], nd_pl[0]) <= 1.e-6)
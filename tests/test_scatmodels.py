@@ -113,6 +113,63 @@ def test_dimensions(sm):
     assert np.shape(sm.qabs) == (NE, NA)
     assert np.shape(sm.diff) == (NE, NA, NTH)
 
+@pytest.mark.parametrize('sm',
+                         [scatteringmodel.RGscattering(),
+                          scatteringmodel.Mie()])
+def test_outputs_tau(sm):
+    NE, NA = 2, 20
+    LAMVALS = np.linspace(1000.,5000.,NE) * u.angstrom
+    AVALS   = np.linspace(0.1, 0.5, NA) * u.micron
+    sm.calculate(LAMVALS, AVALS, composition.CmSilicate(), theta=THETA_ARCSEC)
+    qext, qsca = sm.qext, sm.qsca
+    sm.calculate(LAMVALS, AVALS, composition.CmSilicate(), theta=THETA_ARCSEC, outputs='tau')
+    assert sm.diff is None
+    assert np.all(percent_diff(sm.qext.flatten(), qext.flatten()) <= 1.e-10)
+    assert np.all(percent_diff(sm.qsca.flatten(), qsca.flatten()) <= 1.e-10)
+
+@pytest.mark.parametrize('sm',
+                         [scatteringmodel.RGscattering(),
+                          scatteringmodel.Mie()])
+def test_mask(sm):
+    NE, NA = 2, 20
+    LAMVALS = np.linspace(1000.,5000.,NE) * u.angstrom
+    AVALS   = np.linspace(0.1, 0.5, NA) * u.micron
+    mask = np.zeros((NE, NA), dtype=bool)
+    mask[0,::3] = True
+    mask[1,5:] = True
+    sm.calculate(LAMVALS, AVALS, composition.CmSilicate(), theta=THETA_ARCSEC)
+    qext, qsca, diff = sm.qext, sm.qsca, sm.diff
+    sm.calculate(LAMVALS, AVALS, composition.CmSilicate(), theta=THETA_ARCSEC, mask=mask)
+    assert np.all(percent_diff(sm.qext[mask], qext[mask]) <= 1.e-10)
+    assert np.all(percent_diff(sm.qsca[mask], qsca[mask]) <= 1.e-10)
+    assert np.all(percent_diff(sm.diff[mask].flatten(), diff[mask].flatten()) <= 1.e-10)
+    assert np.all(sm.qext[~mask] == 0.0) and np.all(sm.diff[~mask] == 0.0)
+
+@pytest.mark.parametrize('sm',
+                         [scatteringmodel.RGscattering(),
+                          scatteringmodel.Mie()])
+@pytest.mark.parametrize('block', [1000000, 2000])
+def test_outputs_int_diff(sm, block, monkeypatch):
+    # block=2000 sums one energy at a time
+    monkeypatch.setattr(scatteringmodel.scatteringmodel, 'DIFF_BLOCK', block)
+    NE, NA = 3, 20
+    LAMVALS = np.linspace(1000.,5000.,NE) * u.angstrom
+    AVALS   = np.linspace(0.1, 0.5, NA) * u.micron
+    weights = np.linspace(1.0, 2.0, NA)
+    mask    = np.ones((NE, NA), dtype=bool)
+    mask[1,::2] = False
+    sm.calculate(LAMVALS, AVALS, composition.CmSilicate(), theta=THETA_ARCSEC, mask=mask)
+    qext, int_diff = sm.qext, np.einsum('ijk,j->ik', sm.diff, weights)
+    sm.calculate(LAMVALS, AVALS, composition.CmSilicate(), theta=THETA_ARCSEC, mask=mask,
+                 outputs='int_diff', weights=weights)
+    assert sm.diff is None
+    assert np.shape(sm.int_diff) == (NE, len(THETA))
+    assert np.all(percent_diff(sm.qext.flatten(), qext.flatten()) <= 1.e-10)
+    assert np.all(percent_diff(sm.int_diff.flatten(), int_diff.flatten()) <= 1.e-10)
+
+    with pytest.raises(AssertionError, match="weights"):
+        sm.calculate(LAMVALS, AVALS, composition.CmSilicate(), theta=THETA_ARCSEC, outputs='int_diff')
+
 def test_read_write():
     cm = composition.CmDrude()
     test = scatteringmodel.RGscattering()
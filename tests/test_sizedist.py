@@ -1,7 +1,8 @@
 import pytest
+import numpy as np
 from scipy.integrate import trapz
 
-from newdust.graindist import sizedist
+from newdust.graindist import sizedist, shape
 from . import percent_diff
 
 MDTEST  = 1.e-4  # g cm^-2
@@ -64,3 +65,108 @@ def test_change_rho(sd):
         ntot1 = trapz(nd1, sd.a.to('micron').value)
         ntot2 = trapz(nd2, sd.a.to('micron').value)
     assert percent_diff(ntot2, 0.5 * ntot1) <= 0.01
+
+# Test the integration weights of the size distribution grids
+@pytest.mark.parametrize('sd',
+                         [sizedist.Powerlaw(),
+                          sizedist.Powerlaw(log=True, quad='gauss', na=20),
+                          sizedist.ExpCutoff(quad='gauss', na=20),
+                          sizedist.Astrodust(log=True, quad='gauss', na=30)])
+def test_wts(sd):
+    assert len(sd.wts) == len(sd.a)
+    tot_mass = np.sum(sd.mdens(MDTEST, RHOTEST) * sd.wts)
+    assert percent_diff(tot_mass, MDTEST) <= 0.01
+
+def test_quadrature():
+    a_um = sizedist.Powerlaw(log=True).a.to('micron').value
+    assert np.all(percent_diff(np.sum(a_um**2 * sizedist.trapz_weights(a_um)),
+                               trapz(a_um**2, a_um)) <= 1.e-10)
+
+    # Gauss-Legendre rules integrate a smooth distribution with far fewer radii
+    ref  = sizedist.ExpCutoff(log=True, na=5000)
+    test = sizedist.ExpCutoff(log=True, na=20, quad='gauss')
+    ntot_ref  = trapz(ref.ndens(MDTEST, RHOTEST), ref.a.to('micron').value)
+    ntot_test = np.sum(test.ndens(MDTEST, RHOTEST) * test.wts)
+    assert percent_diff(ntot_test, ntot_ref) <= 0.01
+
+    # Replacing the grid falls back to trapezoidal weights
+    test.a = ref.a
+    assert len(test.wts) == len(ref.a)
+    assert np.all(percent_diff(test.wts, ref.wts) <= 1.e-10)
+
+# Test the WD01 size distributions, evaluated from the bundled tables
+def test_WD01():
+    table = sizedist.read_wdtable('MW')
+    assert sizedist.read_wdtable('MW') is table
+    assert len(table['R_v']) == 16
+    assert np.all(np.isnan(sizedist.read_wdtable('SMC')['R_v']))
+
+    for grain in ['Graphite', 'Silicate']:
+        test = sizedist.WD01(R_v=4.0, bc=2.0, grain=grain)
+        assert test.R_v == 4.0 and test.bc == 2.0
+        nd   = test.ndens(MDTEST, RHOTEST)
+        assert len(nd) == len(test.a)
+        assert percent_diff(np.sum(test.mdens(MDTEST, RHOTEST) * test.wts), MDTEST) <= 0.01
+
+        # Evaluating all of the table rows at once matches row-by-row evaluation
+        dnda = test.dnda()
+        assert np.shape(dnda) == (len(table['R_v']), len(test.a))
+        assert np.all(percent_diff(dnda[test.row], test.dnda(test.row)[0]) <= 1.e-10)
+        nd_rows = test.ndens_rows(MDTEST, RHOTEST)
+        assert np.all(percent_diff(nd_rows[test.row], nd) <= 1.e-10)
+
+    # Milky Way dust (R_v = 3.1, bc = 6) has a dust-to-gas mass ratio of about 1%
+    mgas = 1.4 * 1.6726e-24  # g per H
+    md_H = sizedist.WD01(bc=6.0, grain='Graphite', amax=10.0).md_per_H(rho=2.24) + \
+        sizedist.WD01(bc=6.0, grain='Silicate', amax=10.0).md_per_H(rho=3.5)
+    assert (md_H / mgas > 0.005) and (md_H / mgas < 0.015)
+    assert np.ndim(md_H) == 0
+    assert np.shape(sizedist.WD01().md_per_H(rows=[0, 1])) == (2,)
+
+# Test tabulated size distributions, and mixtures on a common grid
+def test_Tabulated(tmpdir):
+    pl   = sizedist.Powerlaw(log=True, na=50)
+    a_um = pl.a.to('micron').value
+    test = sizedist.Tabulated(pl.a, a_um**-3.5)
+    assert np.all(percent_diff(test.ndens(MDTEST, RHOTEST), pl.ndens(MDTEST, RHOTEST)) <= 1.e-10)
+
+    # resampling the table with a spline
+    test2 = sizedist.Tabulated(pl.a, a_um**-3.5, na=20, quad='gauss')
+    a2_um = test2.a.to('micron').value
+    assert np.all(percent_diff(test2.resample(test2.a), a2_um**-3.5) <= 1.e-6)
+    assert percent_diff(np.sum(test2.mdens(MDTEST, RHOTEST) * test2.wts), MDTEST) <= 0.01
+    assert np.all(test2.resample(np.array([1.e-4, 1.0])) == 0.0)
+
+    # reading from a file
+    fname = str(tmpdir.join('sdist.txt'))
+    np.savetxt(fname, np.array([a_um, a_um**-3.5]).T, header='a(um) dn/da')
+    test3 = sizedist.Tabulated(from_file=fname)
+    assert np.all(percent_diff(test3.ndens(MDTEST, RHOTEST), pl.ndens(MDTEST, RHOTEST)) <= 1.e-6)
+
+def test_Mixture():
+    pl1  = sizedist.Powerlaw(amin=0.005, amax=0.3, p=3.5, log=True)
+    pl2  = sizedist.Powerlaw(amin=0.1, amax=1.0, p=2.0, log=True)
+    test = sizedist.Mixture([pl1, pl2], [0.7, 0.3], na=300)
+    assert percent_diff(test.a.to('micron').value[-1], 1.0) <= 1.e-10
+
+    nd_c = test.ndens_components(MDTEST, RHOTEST)
+    assert np.shape(nd_c) == (2, len(test.a))
+    mg   = RHOTEST * test.wts * shape.Sphere().vol(test.a)
+    assert percent_diff(np.sum(nd_c[0] * mg), 0.7 * MDTEST) <= 1.e-6
+    assert percent_diff(np.sum(nd_c[1] * mg), 0.3 * MDTEST) <= 1.e-6
+    assert np.all(nd_c[1][test.a.to('micron').value < 0.1] == 0.0)
+
+    nd = test.ndens(MDTEST, RHOTEST)
+    assert np.all(percent_diff(nd, nd_c[0] + nd_c[1]) <= 1.e-10)
+    assert percent_diff(np.sum(test.mdens(MDTEST, RHOTEST) * test.wts), MDTEST) <= 1.e-6
+
+    # components on Gauss-Legendre grids keep their radius limits, which are not on their grids
+    gs1  = sizedist.Powerlaw(amin=0.005, amax=0.3, p=3.5, na=20, log=True, quad='gauss')
+    gs2  = sizedist.Powerlaw(amin=0.1, amax=1.0, p=2.0, na=20, log=True, quad='gauss')
+    test = sizedist.Mixture([gs1, gs2], [0.7, 0.3], na=300)
+    a_um = test.a.to('micron').value
+    assert percent_diff(a_um[0], 0.005) <= 1.e-10 and percent_diff(a_um[-1], 1.0) <= 1.e-10
+    assert test.amin.value == 0.005 and test.amax.value == 1.0
+    nd_c = test.ndens_components(MDTEST, RHOTEST)
+    assert np.all((nd_c[0] > 0.0) == (a_um <= 0.3))
+    assert np.all((nd_c[1] > 0.0) == (a_um >= 0.1))
@@ -0,0 +1,59 @@
+import os
+import pytest
+import numpy as np
+from astropy.io import fits
+
+from newdust import tablemodel
+from newdust.tablemodel import make_table_model
+from newdust.grainpop import make_MRN
+from . import percent_diff
+
+EBINS = np.linspace(0.5, 2.0, 8)  # keV
+PARS  = dict(md=[1.e-5, 1.e-4], p=[3.0, 3.5], amax=[0.25, 0.3], fsil=[0.0, 0.6, 1.0])
+
+def test_table_model(tmpdir):
+    outfile = str(tmpdir.join('table.fits'))
+    model = make_table_model(outfile, EBINS, stype='RG', executor=None, na=200, **PARS)
+    assert np.shape(model) == (2, 2, 2, 3, len(EBINS)-1)
+    assert not os.path.exists(outfile + '.ckpt')
+
+    ff = fits.open(outfile)
+    assert ff[0].header['HDUCLAS1'] == 'XSPEC TABLE MODEL'
+    assert not ff[0].header['ADDMODEL']
+    assert list(ff['PARAMETERS'].data['NAME']) == tablemodel.TABLE_PARS
+    assert list(ff['PARAMETERS'].data['NUMBVALS']) == [2, 2, 2, 3]
+    assert np.all(ff['ENERGIES'].data['ENERG_LO'] == np.float32(EBINS[:-1]))
+    # the last parameter changes fastest
+    paramval = ff['SPECTRA'].data['PARAMVAL']
+    assert len(paramval) == 24
+    assert np.allclose(paramval[1], [1.e-5, 3.0, 0.25, 0.6])
+    assert np.allclose(ff['SPECTRA'].data['INTPSPEC'][1], model[0,0,0,1], rtol=1.e-6)
+    ff.close()
+
+    # compare with a direct calculation for one grid point
+    lam = 0.5 * (EBINS[1:] + EBINS[:-1])
+    test = make_MRN(amax=0.3, p=3.5, md=1.e-4, fsil=0.6, na=400, log=True)
+    for gp in test.gpoplist:
+        gp._assign_scatm_from_string('RG')
+    test.calculate_ext(lam, outputs='tau')
+    assert np.all(percent_diff(model[1,1,1,1], np.exp(-test.tau_ext)) <= 0.01)
+
+# Test that a calculation resumes from the saved jobs, and that a process pool gives the same answer
+def test_table_model_resume(tmpdir, monkeypatch):
+    outfile = str(tmpdir.join('table.fits'))
+    model = make_table_model(outfile, EBINS, stype='RG', executor='process', max_workers=2,
+                             chunk_size=3, cleanup=False, **PARS)
+    assert len(os.listdir(outfile + '.ckpt')) == 3 * 3  # 3 compositions x 3 energy chunks
+
+    # an interrupted run: one job is missing
+    os.remove(os.path.join(outfile + '.ckpt', 'comp001_chunk00002.npz'))
+    calls = []
+    def counting_job(*args):
+        calls.append(args)
+        return run_job(*args)
+    run_job = tablemodel._table_job
+    monkeypatch.setattr(tablemodel, '_table_job', counting_job)
+    resumed = make_table_model(outfile, EBINS, stype='RG', executor=None, chunk_size=3, **PARS)
+    assert len(calls) == 1
+    assert np.all(percent_diff(resumed.flatten(), model.flatten()) <= 1.e-10)
+    assert not os.path.exists(outfile + '.ckpt')